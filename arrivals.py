@@ -0,0 +1,248 @@
+import warnings
+
+import numpy as np
+
+"""
+arrival sources for the scheduler. a source hands out (arrival time, burst time) pairs in
+order of arrival time, one at a time, so only the next arrival ever has to sit in the event queue.
+
+sources either draw synthetic arrivals (ArrivalStream) or replay a trace file (BinaryTrace,
+CSVTrace). every source works on one block of arrivals at a time so a trace is never loaded
+whole, and a trace source runs out when the file ends.
+"""
+
+
+# builds a SeedSequence from an int, None (fresh entropy) or an existing SeedSequence
+def seed_sequence(seed):
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    return np.random.SeedSequence(seed)
+
+
+class ArrivalSource:
+    '''
+    base class for arrival sources. a source keeps its current block in the times and bursts
+    arrays and refill replaces the block with the next one, leaving it empty when the source
+    has run out
+    '''
+
+    def __init__(self):
+        self.times = np.empty(0)
+        self.bursts = np.empty(0)
+        self.cursor = 0
+
+    # loads the next block of arrivals into times and bursts
+    def refill(self):
+        raise NotImplementedError
+
+    # returns the next (arrival time, burst time), None once the source has run out
+    def next(self):
+        if self.cursor == len(self.times):
+            self.refill()
+            if not len(self.times):
+                return None
+        k = self.cursor
+        self.cursor += 1
+        return self.times.item(k), self.bursts.item(k)
+
+    # time of the next arrival without taking it, None once the source has run out
+    def next_time(self):
+        if self.cursor == len(self.times):
+            self.refill()
+            if not len(self.times):
+                return None
+        return self.times.item(self.cursor)
+
+    # returns arrays with the next n arrival times and burst times, fewer if the source runs out
+    def take(self, n):
+        times = [self.times[:0]]
+        bursts = [self.bursts[:0]]
+        while n > 0:
+            if self.cursor == len(self.times):
+                self.refill()
+                if not len(self.times):
+                    break
+            end = min(self.cursor + n, len(self.times))
+            times.append(self.times[self.cursor:end])
+            bursts.append(self.bursts[self.cursor:end])
+            n -= end - self.cursor
+            self.cursor = end
+        return np.concatenate(times), np.concatenate(bursts)
+
+    # puts arrivals that were taken but not used back in front of the next one
+    def unread(self, times, bursts):
+        self.times = np.concatenate((times, self.times[self.cursor:]))
+        self.bursts = np.concatenate((bursts, self.bursts[self.cursor:]))
+        self.cursor = 0
+
+    # returns arrays with every remaining arrival up to and including time t
+    def take_until(self, t):
+        times = [self.times[:0]]
+        bursts = [self.bursts[:0]]
+        while True:
+            if self.cursor == len(self.times):
+                self.refill()
+                if not len(self.times):
+                    break
+            end = self.cursor + int(np.searchsorted(self.times[self.cursor:], t, side='right'))
+            times.append(self.times[self.cursor:end])
+            bursts.append(self.bursts[self.cursor:end])
+            self.cursor = end
+            if end < len(self.times):
+                break
+        return np.concatenate(times), np.concatenate(bursts)
+
+
+class ArrivalStream(ArrivalSource):
+    '''
+    synthetic arrivals. inter arrival times are poisson counts of milliseconds and burst times
+    are exponential. samples are drawn block_size at a time with vectorized numpy calls, the
+    inter arrival times and the bursts each come from their own np.random.Generator so a
+    stream is reproducible from its seed.
+    '''
+
+    def __init__(self, arrival_rate, avg_burst_time, seed=None, block_size=16384):
+        super().__init__()
+        self.inter_process_arrival_rate = 1/arrival_rate
+        self.avg_burst_time = avg_burst_time
+        self.block_size = block_size
+
+        arrival_seed, burst_seed = seed_sequence(seed).spawn(2)
+        self.arrival_rng = np.random.default_rng(arrival_seed)
+        self.burst_rng = np.random.default_rng(burst_seed)
+
+        self.last_time = 0.0
+
+    # draws the next block of arrivals
+    def refill(self):
+        inter_arrival_times = self.arrival_rng.poisson(self.inter_process_arrival_rate * 1000, self.block_size) / 1000
+        times = np.cumsum(inter_arrival_times)
+        times += self.last_time
+        self.last_time = times.item(-1)
+        self.times = times
+        self.bursts = self.burst_rng.exponential(self.avg_burst_time, self.block_size)
+        self.cursor = 0
+
+
+class TickSource(ArrivalSource):
+    '''
+    another arrival source on an integer clock: its arrival and burst times rounded to whole
+    ticks, as int64, ticks_per_second ticks to a second. the rounding happens once per block
+    '''
+
+    def __init__(self, source, ticks_per_second=10**9):
+        super().__init__()
+        self.source = source
+        self.ticks_per_second = ticks_per_second
+        self.times = np.empty(0, dtype=np.int64)
+        self.bursts = np.empty(0, dtype=np.int64)
+
+    def refill(self):
+        source = self.source
+        if source.cursor == len(source.times):
+            source.refill()
+        times = source.times[source.cursor:]
+        bursts = source.bursts[source.cursor:]
+        source.cursor = len(source.times)
+        self.times = np.rint(times * self.ticks_per_second).astype(np.int64)
+        self.bursts = np.rint(bursts * self.ticks_per_second).astype(np.int64)
+        self.cursor = 0
+
+
+class TraceSource(ArrivalSource):
+    '''
+    base class for trace replays. subclasses read the next rows of the file in read_block,
+    this checks that arrival times never go backwards, across blocks as well
+    '''
+
+    def __init__(self, block_size):
+        super().__init__()
+        self.block_size = block_size
+        self.last_time = -np.inf
+        self.rows_read = 0
+
+    # returns (arrival times, burst times) of the next rows, empty arrays at the end of the file
+    def read_block(self):
+        raise NotImplementedError
+
+    def refill(self):
+        times, bursts = self.read_block()
+        times = np.ascontiguousarray(times, dtype=np.float64)
+        bursts = np.ascontiguousarray(bursts, dtype=np.float64)
+        if len(times):
+            if times.item(0) < self.last_time or (len(times) > 1 and (np.diff(times) < 0).any()):
+                raise ValueError(f'trace arrival times are not sorted near row {self.rows_read}')
+            self.last_time = times.item(-1)
+        self.rows_read += len(times)
+        self.times = times
+        self.bursts = bursts
+        self.cursor = 0
+
+
+# record layout of binary traces, little endian (arrival time, burst time) pairs in seconds
+TRACE_DTYPE = np.dtype([('arrival', '<f8'), ('burst', '<f8')])
+
+
+class BinaryTrace(TraceSource):
+    '''
+    replays a binary trace of TRACE_DTYPE records. the file is memory mapped and only the
+    current block is copied out of it, so traces bigger than memory are fine.
+        offset: bytes to skip at the start of the file (a header)
+    '''
+
+    def __init__(self, path, block_size=1 << 20, offset=0, dtype=TRACE_DTYPE):
+        super().__init__(block_size)
+        self.records = np.memmap(path, dtype=dtype, mode='r', offset=offset)
+        self.position = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def read_block(self):
+        block = self.records[self.position:self.position + self.block_size]
+        self.position += len(block)
+        return block['arrival'], block['burst']
+
+
+class CSVTrace(TraceSource):
+    '''
+    replays a csv trace, block_size rows at a time.
+        columns: the column numbers of the arrival time and the burst time
+        skip_header: number of lines to skip at the top
+    '''
+
+    def __init__(self, path, block_size=1 << 16, columns=(0, 1), delimiter=',', skip_header=0):
+        super().__init__(block_size)
+        self.file = open(path)
+        for _ in range(skip_header):
+            self.file.readline()
+        self.columns = columns
+        self.delimiter = delimiter
+
+    def read_block(self):
+        if self.file.closed:
+            return np.empty(0), np.empty(0)
+        # loadtxt warns when it gets to the end of the file with nothing left to read
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            block = np.loadtxt(self.file, delimiter=self.delimiter, usecols=self.columns,
+                               max_rows=self.block_size, ndmin=2)
+        if len(block) < self.block_size:
+            self.file.close()
+        return block[:, 0], block[:, 1]
+
+
+# writes arrival and burst time arrays as a binary trace, appending to the file if it exists
+def write_binary_trace(path, arrival_times, burst_times):
+    records = np.empty(len(arrival_times), dtype=TRACE_DTYPE)
+    records['arrival'] = arrival_times
+    records['burst'] = burst_times
+    with open(path, 'ab') as f:
+        f.write(records.tobytes())
+
+
+# opens a trace file, csv files by their extension and binary traces otherwise
+def open_trace(path, **kwargs):
+    if path.endswith('.csv'):
+        return CSVTrace(path, **kwargs)
+    return BinaryTrace(path, **kwargs)
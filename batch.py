@@ -0,0 +1,264 @@
+import math
+
+import numpy as np
+from arrivals import ArrivalStream, TickSource
+from metrics import MetricsAccumulator, replication_summary
+from scheduling_algorithms import TICKS_PER_SECOND
+
+"""
+batched replications. BatchScheduler runs R independent replications of the same
+configuration in lockstep: all of the per replication state (clock, next arrival, ready queue,
+running process, time remaining) lives in numpy arrays with one row per replication, and every
+step of the loop handles the next event of every replication at once. the python overhead of
+a step is paid once for the whole batch instead of once per replication.
+
+each replication uses its own ArrivalStream and follows the same event ordering as the event
+engine in scheduling_algorithms.py, so replication r gives the same run as the single
+scheduler built with the same seed (or the same arrival source). with integer_clock=True the per replication times are int64
+nanoseconds, the same as the single scheduler's integer_clock.
+"""
+
+
+class BatchScheduler:
+    '''
+    lockstep replications of FCFS (algorithm 1) or RR (algorithm 3).
+    processes are columns of per replication arrays indexed by pid, which are drawn from the
+    replication's arrival stream in chunks as the runs need them. never is the time of an event
+    that is not there, inf or the largest int64 with integer_clock.
+        arrivals: optional arrival sources, one per replication, instead of streams from seeds
+    '''
+    algorithms = (1, 3)
+
+    def __init__(self, algorithm, arrival_rate, avg_burst_time, quantum, seeds, max_processes=10000, chunk=None,
+                 integer_clock=False, arrivals=None):
+        if algorithm not in self.algorithms:
+            raise ValueError(f'batched replications only support algorithms {self.algorithms}')
+        self.algorithm = algorithm
+        self.inter_process_arrival_rate = 1/arrival_rate
+        self.avg_burst_time = avg_burst_time
+        self.integer_clock = integer_clock
+        self.time_scale = 1 / TICKS_PER_SECOND if integer_clock else 1.0 # seconds per unit of clock time
+        self.quantum = round(quantum * TICKS_PER_SECOND) if integer_clock else quantum # in clock units
+        self.max_processes = max_processes
+        self.chunk = chunk if chunk is not None else max_processes
+        time_dtype = np.int64 if integer_clock else np.float64
+        self.never = np.iinfo(np.int64).max if integer_clock else math.inf
+
+        if arrivals is not None:
+            self.streams = list(arrivals)
+        else:
+            self.streams = [ArrivalStream(arrival_rate, avg_burst_time, seed) for seed in seeds]
+        if integer_clock:
+            self.streams = [TickSource(stream, TICKS_PER_SECOND) for stream in self.streams]
+        n = len(self.streams)
+        self.replications = n
+
+        # processes, one row per replication
+        self.arrival = np.empty((n, 0), dtype=time_dtype)
+        self.burst = np.empty((n, 0), dtype=time_dtype)
+        self.remaining = np.empty((n, 0), dtype=time_dtype)
+        self.draw_processes()
+
+        self.clock = np.zeros(n, dtype=time_dtype)
+        self.arrived = np.zeros(n, dtype=np.int64) # pid of the next arrival
+        # pending terminations in the order they happen, never past the last one. FCFS has at most one,
+        # an RR slice that ends right on the quantum boundary can add a second before the first is handled
+        self.term_time = np.full((n, 2), self.never)
+        self.term_pid = np.zeros((n, 2), dtype=np.int64)
+        self.terms_ready = np.zeros(n, dtype=np.int64)
+
+        # ready queue. FCFS runs processes in pid order so it only needs the next pid to dispatch,
+        # RR keeps a ring buffer of scheduled time events per replication
+        self.dispatched = np.zeros(n, dtype=np.int64)
+        self.ring_size = 64
+        self.ring_pid = np.zeros((n, self.ring_size), dtype=np.int64)
+        self.ring_time = np.zeros((n, self.ring_size), dtype=time_dtype)
+        self.ring_head = np.zeros(n, dtype=np.int64)
+
+        #  metrics
+        self.turnaround = np.zeros((n, max_processes)) # in seconds
+        self.wait = np.zeros((n, max_processes))
+        self.cpu_time = np.zeros(n, dtype=time_dtype)
+        self.processes_completed = np.zeros(n, dtype=np.int64)
+        self.event_counter = np.zeros(n, dtype=np.int64)
+        self.time_events_ready = np.zeros(n, dtype=np.int64)
+        self.time_events_handled = np.zeros(n, dtype=np.int64)
+        self.arrival_events_handled = np.zeros(n, dtype=np.int64)
+        self.termination_events_handled = np.zeros(n, dtype=np.int64)
+
+        self.rows = np.arange(n) # replications that are still running
+
+
+    # draws the next chunk of processes for every replication
+    def draw_processes(self):
+        blocks = [stream.take(self.chunk) for stream in self.streams]
+        arrival = np.array([b[0] for b in blocks])
+        burst = np.array([b[1] for b in blocks])
+        self.arrival = np.concatenate((self.arrival, arrival), axis=1)
+        self.burst = np.concatenate((self.burst, burst), axis=1)
+        self.remaining = np.concatenate((self.remaining, burst), axis=1)
+
+
+    # doubles the RR ring buffers, unrolling each one so its head is at 0
+    def grow_ring(self):
+        order = (self.ring_head[:, None] + np.arange(self.ring_size)) % self.ring_size
+        rows = np.arange(self.replications)[:, None]
+        self.ring_pid = np.concatenate((self.ring_pid[rows, order], np.zeros_like(self.ring_pid)), axis=1)
+        self.ring_time = np.concatenate((self.ring_time[rows, order], np.zeros_like(self.ring_time)), axis=1)
+        self.ring_head[:] = 0
+        self.ring_size *= 2
+
+
+    # adds RR time events for pids, one quantum after the last queued one or after the clock
+    def add_time_events(self, rows, pids):
+        count = self.time_events_ready[rows]
+        if count.max(initial=0) == self.ring_size:
+            self.grow_ring()
+        head = self.ring_head[rows]
+        last = self.ring_time[rows, (head + count - 1) % self.ring_size]
+        t = np.where(count > 0, last, self.clock[rows]) + self.quantum
+        slot = (head + count) % self.ring_size
+        self.ring_time[rows, slot] = t
+        self.ring_pid[rows, slot] = pids
+        self.time_events_ready[rows] = count + 1
+
+
+    # adds termination events at times for pids. an RR slice starts no earlier than the one before
+    # it ended, so every termination goes after the ones already pending
+    def add_termination_events(self, rows, times, pids):
+        count = self.terms_ready[rows]
+        if count.max(initial=0) == self.term_time.shape[1]:
+            self.term_time = np.concatenate((self.term_time, np.full_like(self.term_time, self.never)), axis=1)
+            self.term_pid = np.concatenate((self.term_pid, np.zeros_like(self.term_pid)), axis=1)
+        self.term_time[rows, count] = times
+        self.term_pid[rows, count] = pids
+        self.terms_ready[rows] = count + 1
+
+
+    # handles the first pending termination in rows
+    def handle_termination_events(self, rows):
+        self.termination_events_handled[rows] += 1
+        pids = self.term_pid[rows, 0]
+        done = self.processes_completed[rows]
+        turnaround = self.clock[rows] - self.arrival[rows, pids]
+        self.turnaround[rows, done] = turnaround * self.time_scale
+        self.wait[rows, done] = (turnaround - self.burst[rows, pids]) * self.time_scale
+        self.processes_completed[rows] = done + 1
+        self.term_time[rows, :-1] = self.term_time[rows, 1:]
+        self.term_time[rows, -1] = self.never
+        self.term_pid[rows, :-1] = self.term_pid[rows, 1:]
+        self.terms_ready[rows] -= 1
+
+
+    # one FCFS event for every running replication
+    def step_fcfs(self):
+        rows = self.rows
+        next_arrival = self.arrival[rows, self.arrived[rows]]
+        term_time = self.term_time[rows, 0]
+        dispatch = (term_time == self.never) & (self.time_events_ready[rows] > 0)
+        arrive = ~dispatch & (next_arrival <= term_time)
+        terminate = ~dispatch & ~arrive
+
+        # time events, the cpu is free so the next process in line runs to completion
+        r = rows[dispatch]
+        pids = self.dispatched[r]
+        t = self.remaining[r, pids]
+        self.cpu_time[r] += self.burst[r, pids]
+        self.remaining[r, pids] = 0
+        self.add_termination_events(r, self.clock[r] + t, pids)
+        self.dispatched[r] = pids + 1
+        self.time_events_ready[r] -= 1
+        self.time_events_handled[r] += 1
+
+        r = rows[arrive]
+        self.clock[r] = next_arrival[arrive]
+        self.arrived[r] += 1
+        self.time_events_ready[r] += 1
+        self.arrival_events_handled[r] += 1
+
+        r = rows[terminate]
+        self.clock[r] = term_time[terminate]
+        self.handle_termination_events(r)
+
+
+    # one RR event for every running replication
+    def step_rr(self):
+        rows = self.rows
+        next_arrival = self.arrival[rows, self.arrived[rows]]
+        term_time = self.term_time[rows, 0]
+        head = self.ring_head[rows]
+        next_slice = np.where(self.time_events_ready[rows] > 0, self.ring_time[rows, head], self.never)
+        # arrivals come first on a tie, a time slice that was scheduled first beats the termination
+        arrive = (next_arrival <= next_slice) & (next_arrival <= term_time)
+        time_slice = ~arrive & (next_slice <= term_time)
+        terminate = ~arrive & ~time_slice
+
+        r = rows[arrive]
+        self.clock[r] = next_arrival[arrive]
+        pids = self.arrived[r]
+        self.arrived[r] = pids + 1
+        self.arrival_events_handled[r] += 1
+        arrivals = (r, pids)
+
+        r = rows[time_slice]
+        self.clock[r] = next_slice[time_slice]
+        pids = self.ring_pid[r, head[time_slice]]
+        self.ring_head[r] = (head[time_slice] + 1) % self.ring_size
+        self.time_events_ready[r] -= 1
+        self.time_events_handled[r] += 1
+        t = self.remaining[r, pids]
+        more = t > self.quantum
+
+        # not done, back in the queue after one quantum
+        cr = r[more]
+        self.cpu_time[cr] += self.quantum
+        self.remaining[cr, pids[more]] = t[more] - self.quantum
+        requeued = (cr, pids[more])
+
+        # done during this slice
+        fr = r[~more]
+        self.cpu_time[fr] += t[~more]
+        self.remaining[fr, pids[~more]] = 0
+        self.add_termination_events(fr, self.clock[fr] + t[~more], pids[~more])
+
+        # the rows are disjoint so the queue updates can be done after the slices are taken
+        self.add_time_events(*arrivals)
+        self.add_time_events(*requeued)
+
+        r = rows[terminate]
+        self.clock[r] = term_time[terminate]
+        self.handle_termination_events(r)
+
+
+    # runs every replication until max_processes are done
+    def run_sim(self):
+        step = self.step_fcfs if self.algorithm == 1 else self.step_rr
+        while len(self.rows):
+            if self.arrived[self.rows].max() == self.arrival.shape[1]:
+                self.draw_processes()
+            step()
+            self.event_counter[self.rows] += 1
+            self.rows = self.rows[self.processes_completed[self.rows] < self.max_processes]
+
+
+    # the collect_metrics dict of every replication
+    def collect_metrics(self):
+        results = []
+        for r in range(self.replications):
+            done = self.processes_completed.item(r)
+            acc = MetricsAccumulator()
+            acc.add_many(self.turnaround[r, :done], self.wait[r, :done])
+            avg_wait_time = acc.wait.mean
+            d = {"average turnaround time": acc.turnaround.mean,
+                 "throughput": done / (self.clock.item(r) * self.time_scale),
+                 "average wait time": avg_wait_time,
+                 "average time events in queue": avg_wait_time / self.inter_process_arrival_rate
+                 }
+            d.update(acc.summary())
+            results.append(d)
+        return results
+
+
+    # mean and confidence interval half width of each metric over the replications
+    def summary(self, level=0.95):
+        return replication_summary(self.collect_metrics(), level)
@@ -0,0 +1,162 @@
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from hooks import SimHooks
+from scheduling_algorithms import FCFS, STRF, RR
+
+"""
+benchmark suite for the simulator. runs FCFS, STRF and RR over a fixed grid of arrival rates,
+bursts and quanta with fixed seeds and records for every case
+    wall time and events per second (plain run)
+    microseconds per event for each event type and for popping events (timed run)
+    peak traced memory (tracemalloc run)
+timings are the best of a few repeats to keep noise down. results are written to a json
+baseline, compare mode reruns the suite and flags every case that got slower or bigger than
+the baseline by more than a threshold.
+
+    python benchmark.py run --output bench.json
+    python benchmark.py compare bench.json --threshold 0.1
+"""
+
+
+# name, class and extra constructor arguments. FCFS is benchmarked with both engines
+ENGINES = [('FCFS', FCFS, {}),
+           ('FCFS-events', FCFS, {'fast': False}),
+           ('STRF', STRF, {}),
+           ('RR', RR, {})]
+ARRIVAL_RATES = [5, 10, 15, 20, 30]
+BURSTS = [0.06]
+QUANTA = [0.02, 0.04]
+SEED = 2024
+
+# timed method -> name of its measurement. only these are timed so no timer runs inside another
+EVENT_NAMES = {'pop_event': 'pop', 'handle_arrival_event': 'arrival', 'handle_time_event': 'time slice',
+               'handle_termination_event': 'termination'}
+
+
+def benchmark_cases():
+    cases = []
+    for name, cls, kwargs in ENGINES:
+        quanta = QUANTA if cls.uses_quantum else QUANTA[-1:]
+        for rate in ARRIVAL_RATES:
+            for burst in BURSTS:
+                for q in quanta:
+                    cases.append((f'{name} lambda={rate} burst={burst} q={q}', cls, rate, burst, q, kwargs))
+    return cases
+
+
+def make_scheduler(cls, rate, burst, q, kwargs):
+    return cls(rate, burst, q, seed=SEED, **kwargs)
+
+
+# runs one case plain for the wall time, with every handler timed by SimHooks for the per event
+# breakdown and under tracemalloc for the peak memory
+def run_case(cls, rate, burst, q, kwargs, repeats=3):
+    wall_time = float('inf')
+    for _ in range(repeats):
+        s = make_scheduler(cls, rate, burst, q, kwargs)
+        start = time.perf_counter()
+        s.run_sim()
+        wall_time = min(wall_time, time.perf_counter() - start)
+    events = s.event_counter
+
+    # the FCFS fast path does not go through the handlers, there is nothing to break down
+    # (hooks would switch it to the event engine)
+    us_per_event = {}
+    timed_runs = 0 if getattr(s, 'fast', False) else repeats
+    for _ in range(timed_runs):
+        hooks = SimHooks(histograms=False, methods=tuple(EVENT_NAMES))
+        s = make_scheduler(cls, rate, burst, q, dict(kwargs, hooks=hooks))
+        s.run_sim()
+        counts = {'pop_event': s.event_counter, 'handle_arrival_event': s.arrival_events_handled,
+                  'handle_time_event': s.time_events_handled, 'handle_termination_event': s.termination_events_handled}
+        for method, count in counts.items():
+            name = EVENT_NAMES[method]
+            us = hooks.times[method] / count * 1e6 if count else 0.0
+            us_per_event[name] = min(us, us_per_event.get(name, us))
+
+    tracemalloc.start()
+    s = make_scheduler(cls, rate, burst, q, kwargs)
+    s.run_sim()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'wall_time': wall_time,
+            'events': events,
+            'events_per_sec': events / wall_time,
+            'us_per_event': us_per_event,
+            'peak_memory_bytes': peak_memory}
+
+
+def run_suite(repeats=3, verbose=True):
+    results = {'meta': {'python': platform.python_version(),
+                        'numpy': np.__version__,
+                        'machine': platform.machine(),
+                        'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+               'cases': {}}
+    for name, cls, rate, burst, q, kwargs in benchmark_cases():
+        result = run_case(cls, rate, burst, q, kwargs, repeats)
+        results['cases'][name] = result
+        if verbose:
+            print(f"{name:<40} {result['wall_time']*1000:9.1f} ms {result['events_per_sec']:12.0f} events/s "
+                  f"{result['peak_memory_bytes']/1024:9.0f} KiB")
+    return results
+
+
+def compare(baseline, current, threshold):
+    """
+    compares two suite results case by case
+    :return: list of (case, measurement, baseline value, current value) that got worse by more than threshold
+    """
+    regressions = []
+    for name, base in baseline['cases'].items():
+        if name not in current['cases']:
+            continue
+        cur = current['cases'][name]
+        checks = [('wall_time', base['wall_time'], cur['wall_time']),
+                  ('peak_memory_bytes', base['peak_memory_bytes'], cur['peak_memory_bytes'])]
+        for event_name, value in base['us_per_event'].items():
+            if event_name in cur['us_per_event']:
+                checks.append((f'us per {event_name} event', value, cur['us_per_event'][event_name]))
+        for measurement, old, new in checks:
+            if old > 0 and (new - old) / old > threshold:
+                regressions.append((name, measurement, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='simulator benchmark suite')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--repeats', type=int, default=3, help='timings are the best of this many runs')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', parents=[common], help='run the suite and write a baseline')
+    run_parser.add_argument('--output', default='bench.json')
+    compare_parser = sub.add_parser('compare', parents=[common], help='run the suite and compare it to a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown, 0.1 is 10%%')
+    compare_parser.add_argument('--output', default=None, help='also write the new results here')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.repeats)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        for name, measurement, old, new in regressions:
+            print(f'REGRESSION {name}: {measurement} {old:.4g} -> {new:.4g} ({(new - old) / old:+.1%})')
+        if regressions:
+            sys.exit(1)
+        print(f'no regressions beyond {args.threshold:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+import itertools
+import json
+
+import numpy as np
+from arrivals import ArrivalStream
+from event_queue import HeapEventQueue
+from metrics import MetricsAccumulator, QuantileSketch, RunningStats
+from scheduling_algorithms import ALGORITHMS, Event, PolicyScheduler, ProcessTable, RR, STRF
+
+"""
+checkpoints of a running simulation. a snapshot holds the whole state of a scheduler: clock,
+counters, process table, event queue, ready queue, the arrival stream with its rng states and
+buffered block, and the metric accumulators. it is written as a compressed numpy archive with
+a json header that carries the format version, so a run can be stopped and resumed later
+exactly where it was.
+
+a snapshot can also be forked into a run with a different quantum or algorithm. the waiting
+processes are then queued again under the new policy in the order they were waiting, while the
+clock, the arrivals still to come and the process that is running carry over. this lets a sweep
+warm up one system and start every quantum or policy from the same warmed up state.
+
+    warm = RR(12, 0.06, 0.04, seed=1)
+    warm.max_processes = 2000
+    warm.run_sim()
+    save_checkpoint(warm, 'warm.npz')
+    for q in (0.01, 0.02, 0.04):
+        s = load_checkpoint('warm.npz', quantum=q, reset_metrics=True)
+        s.max_processes = 12000
+        s.run_sim()
+"""
+
+
+FORMAT_VERSION = 1
+
+COUNTERS = ('clock', 'cpu_time', 'processes_completed', 'event_counter', 'time_events_ready',
+            'termination_event_ready', 'time_events_handled', 'arrival_events_handled',
+            'termination_events_handled', 'next_pid', 'max_processes')
+
+
+# current value of an itertools.count, the count is replaced by one that carries on from it
+def count_value(owner, name):
+    value = next(getattr(owner, name))
+    setattr(owner, name, itertools.count(value))
+    return value
+
+
+def stats_state(stats):
+    return [stats.count, stats.mean, stats.m2, stats.min, stats.max]
+
+
+def restore_stats(state):
+    stats = RunningStats()
+    stats.count, stats.mean, stats.m2, stats.min, stats.max = state
+    return stats
+
+
+def snapshot(sim):
+    """
+    captures the state of a scheduler. FCFS runs that used the closed form end in the same state
+    as the event engine, so they can be captured too and carry on in the event engine
+    :return: (meta, arrays), a json-able dict and a dict of numpy arrays
+    """
+    if not len(sim.event_queue):
+        raise ValueError('the event queue is empty, there is no run state to capture')
+    if type(sim.arrivals) is not ArrivalStream:
+        raise TypeError('only runs on a synthetic ArrivalStream can be checkpointed')
+    if sim.integer_clock:
+        raise TypeError('runs on an integer clock cannot be checkpointed')
+    if isinstance(sim, PolicyScheduler):
+        raise TypeError('policy schedulers keep their ready queue in the policy and cannot be checkpointed')
+
+    meta = {'format': FORMAT_VERSION,
+            'algorithm': sim.algorithm,
+            'arrival_rate': 1 / sim.inter_process_arrival_rate,
+            'avg_burst_time': sim.avg_burst_time,
+            'quantum': sim.quantum,
+            'keep_records': sim.keep_records,
+            'recent_done': list(sim.recent_done)}
+    for name in COUNTERS:
+        meta[name] = getattr(sim, name)
+    meta['event_seq'] = count_value(sim.event_queue, 'counter')
+
+    table = sim.processes
+    arrays = {'table_' + name: getattr(table, name)[:table.size]
+              for name in ('pid', 'arrival', 'burst', 'remaining', 'termination')}
+    arrays['table_free'] = np.array(table.free, dtype=np.int64)
+
+    entries = list(sim.event_queue)
+    arrays['event_time'] = np.array([e[0] for e in entries], dtype=np.float64)
+    arrays['event_rank'] = np.array([e[1] for e in entries], dtype=np.int64)
+    arrays['event_seq'] = np.array([e[2] for e in entries], dtype=np.int64)
+    arrays['event_type'] = np.array([e[3].event_type for e in entries], dtype=np.int64)
+    arrays['event_process'] = np.array([e[3].process for e in entries], dtype=np.int64)
+
+    # the ready queue in its own layout plus the waiting rows in the order they would run
+    if isinstance(sim, STRF):
+        meta['ready_seq'] = count_value(sim, 'ready_counter')
+        arrays['ready_key'] = np.array([e[0] for e in sim.ready_queue], dtype=np.float64)
+        arrays['ready_seq'] = np.array([e[1] for e in sim.ready_queue], dtype=np.int64)
+        arrays['ready_rows'] = np.array([e[2] for e in sim.ready_queue], dtype=np.int64)
+        arrays['waiting'] = np.array([e[2] for e in sorted(sim.ready_queue)], dtype=np.int64)
+    elif isinstance(sim, RR):
+        arrays['ready_time'] = np.array([e[0] for e in sim.ready_queue], dtype=np.float64)
+        arrays['ready_seq'] = np.array([e[2] for e in sim.ready_queue], dtype=np.int64)
+        arrays['ready_rows'] = np.array([e[3].process for e in sim.ready_queue], dtype=np.int64)
+        arrays['waiting'] = arrays['ready_rows']
+    else:
+        arrays['ready_rows'] = np.array(sim.ready_queue, dtype=np.int64)
+        arrays['waiting'] = arrays['ready_rows']
+
+    stream = sim.arrivals
+    meta['arrivals'] = {'arrival_rng': stream.arrival_rng.bit_generator.state,
+                        'burst_rng': stream.burst_rng.bit_generator.state,
+                        'block_size': stream.block_size,
+                        'last_time': stream.last_time,
+                        'cursor': stream.cursor}
+    arrays['arrival_times'] = stream.times
+    arrays['arrival_bursts'] = stream.bursts
+
+    metrics = sim.metrics
+    meta['metrics'] = {'turnaround': stats_state(metrics.turnaround),
+                       'wait': stats_state(metrics.wait)}
+    for name in ('turnaround_sketch', 'wait_sketch'):
+        sketch = getattr(metrics, name)
+        meta['metrics'][name] = [sketch.relative_accuracy, sketch.min_value, sketch.zero_count, sketch.count]
+        arrays[name + '_keys'] = np.array(list(sketch.buckets), dtype=np.int64)
+        arrays[name + '_counts'] = np.array(list(sketch.buckets.values()), dtype=np.int64)
+    return meta, arrays
+
+
+def save_checkpoint(sim, path):
+    meta, arrays = snapshot(sim)
+    header = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, meta=header, **arrays)
+
+
+def restore(meta, arrays, algorithm=None, quantum=None, reset_metrics=False, **kwargs):
+    """
+    builds a scheduler from a snapshot.
+    :param algorithm: algorithm number of the new run, defaults to the one in the snapshot
+    :param quantum: quantum of the new run, defaults to the one in the snapshot
+    :param reset_metrics: start the turnaround and wait accumulators empty, so only processes
+                          that finish after the snapshot are measured. counters and throughput
+                          still cover the whole run
+    :param kwargs: passed to the scheduler (event_queue, hooks, stopping...)
+    """
+    if meta['format'] != FORMAT_VERSION:
+        raise ValueError(f"checkpoint format {meta['format']} is not supported, expected {FORMAT_VERSION}")
+    algorithm = meta['algorithm'] if algorithm is None else algorithm
+    quantum = meta['quantum'] if quantum is None else quantum
+    cls = ALGORITHMS[algorithm]
+    if issubclass(cls, PolicyScheduler):
+        raise TypeError(f'{cls.__name__} cannot be restored from a checkpoint, see snapshot')
+    kwargs.setdefault('keep_records', meta['keep_records'])
+    sim = cls(meta['arrival_rate'], meta['avg_burst_time'], quantum, **kwargs)
+
+    for name in COUNTERS:
+        setattr(sim, name, meta[name])
+    sim.recent_done.extend(meta['recent_done'])
+
+    table = ProcessTable(max(len(arrays['table_pid']), 1024))
+    table.size = len(arrays['table_pid'])
+    for name in ('pid', 'arrival', 'burst', 'remaining', 'termination'):
+        getattr(table, name)[:table.size] = arrays['table_' + name]
+    table.free = arrays['table_free'].tolist()
+    sim.processes = table
+
+    stream = ArrivalStream(meta['arrival_rate'], meta['avg_burst_time'], block_size=meta['arrivals']['block_size'])
+    stream.arrival_rng.bit_generator.state = meta['arrivals']['arrival_rng']
+    stream.burst_rng.bit_generator.state = meta['arrivals']['burst_rng']
+    stream.last_time = meta['arrivals']['last_time']
+    stream.cursor = meta['arrivals']['cursor']
+    stream.times = np.array(arrays['arrival_times'])
+    stream.bursts = np.array(arrays['arrival_bursts'])
+    sim.arrivals = stream
+
+    if not reset_metrics:
+        metrics = MetricsAccumulator()
+        metrics.turnaround = restore_stats(meta['metrics']['turnaround'])
+        metrics.wait = restore_stats(meta['metrics']['wait'])
+        for name in ('turnaround_sketch', 'wait_sketch'):
+            accuracy, min_value, zero_count, count = meta['metrics'][name]
+            sketch = QuantileSketch(accuracy, min_value)
+            sketch.zero_count = zero_count
+            sketch.count = count
+            sketch.buckets = dict(zip(arrays[name + '_keys'].tolist(), arrays[name + '_counts'].tolist()))
+            setattr(metrics, name, sketch)
+        sim.metrics = metrics
+
+    # the constructor queued an arrival of its own, the queue is rebuilt from the snapshot
+    queue = type(sim.event_queue)() if 'event_queue' in kwargs else HeapEventQueue()
+    queue.counter = itertools.count(meta['event_seq'])
+    sim.event_queue = queue
+    same_schedule = algorithm == meta['algorithm'] and (quantum == meta['quantum'] or not cls.uses_quantum)
+    from_rr = ALGORITHMS[meta['algorithm']] is RR
+    term_event = None
+    for time, rank, seq, event_type, row in zip(arrays['event_time'].tolist(), arrays['event_rank'].tolist(),
+                                                arrays['event_seq'].tolist(), arrays['event_type'].tolist(),
+                                                arrays['event_process'].tolist()):
+        # queued rr time slices belong to the old schedule and are rebuilt below
+        if event_type == 2 and from_rr and not same_schedule:
+            continue
+        event = Event(event_type, time, row)
+        if event_type == 3:
+            term_event = event
+        queue.push_entry((time, rank, seq, event))
+
+    if same_schedule:
+        rows = arrays['ready_rows'].tolist()
+        if cls is STRF:
+            sim.ready_counter = itertools.count(meta['ready_seq'])
+            sim.ready_queue = list(zip(arrays['ready_key'].tolist(), arrays['ready_seq'].tolist(), rows))
+        elif cls is RR:
+            # the first of these is also in the event queue
+            sim.ready_queue.extend((time, sim.event_ranks[2], seq, Event(2, time, row)) for time, seq, row in
+                                   zip(arrays['ready_time'].tolist(), arrays['ready_seq'].tolist(), rows))
+        else:
+            sim.ready_queue.extend(rows)
+    else:
+        sim.time_events_ready = 0
+        for row in arrays['waiting'].tolist():
+            sim.add_time_event(row)
+
+    # rr does not use the flag, the other algorithms dispatch only when no process is running
+    sim.termination_event_ready = term_event is not None and cls is not RR
+    sim.term_event = term_event if cls is not RR else None
+    return sim
+
+
+def load_checkpoint(path, algorithm=None, quantum=None, reset_metrics=False, **kwargs):
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    meta = json.loads(arrays.pop('meta').tobytes().decode())
+    return restore(meta, arrays, algorithm, quantum, reset_metrics, **kwargs)
+
+
+# a new scheduler that carries on from the current state of sim, see restore for the arguments
+def fork(sim, algorithm=None, quantum=None, reset_metrics=False, **kwargs):
+    meta, arrays = snapshot(sim)
+    arrays = {name: np.array(a) for name, a in arrays.items()}
+    return restore(meta, arrays, algorithm, quantum, reset_metrics, **kwargs)
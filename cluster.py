@@ -0,0 +1,335 @@
+import argparse
+import contextlib
+import itertools
+import json
+import multiprocessing
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+
+from results_store import ResultsStore
+from sweep import (SweepTask, add_grid_arguments, cached_results, grid_tasks, print_result, run_task, task_cost,
+                   write_results)
+
+"""
+sweeps over several machines. a coordinator splits a sweep into work units of a few tasks and
+hands them over tcp to worker processes, which can run on any machine that reaches it. every
+message is one json object on a line:
+    worker:      {"type": "ready"}                        asks for work
+    coordinator: {"type": "unit", "unit": 3, "tasks": [...], "heartbeat": 5.0, "saturation": true}
+                 {"type": "wait", "seconds": 0.5}         nothing to hand out right now, ask again
+                 {"type": "done"}                         the sweep is finished
+    worker:      {"type": "heartbeat", "unit": 3}         every heartbeat seconds while it runs a unit
+                 {"type": "result", "unit": 3, "results": [...]}
+a unit that has not had a heartbeat for timeout seconds, or whose worker disconnects, goes back
+in the queue and is handed to the next worker that asks. if the first worker turns out to be
+alive after all, whichever result comes in first is kept. results are merged as they come back
+and come out in task order, the same as sweep.run_sweep returns them.
+
+    python cluster.py coordinator --port 7077 --replications 20     (the data_collector.py grid)
+    python cluster.py worker --host coordinator-host --port 7077 --processes 8
+    python cluster.py local --processes 4     (coordinator and workers on this machine)
+"""
+
+
+# numpy scalars in the metrics go out as plain numbers
+def to_json(value):
+    return value.item()
+
+
+def send(stream, message):
+    stream.write((json.dumps(message, default=to_json) + '\n').encode())
+    stream.flush()
+
+
+# the next message, None once the other side has closed the connection
+def receive(stream):
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class Coordinator:
+    '''
+    hands out the work units of a sweep and collects their results.
+        unit_size: tasks per unit, the most expensive tasks go out first
+        timeout: seconds without a heartbeat before a unit is handed out again
+        heartbeat: seconds between the heartbeats of a worker
+        store: ResultsStore, stored tasks are not handed out and new results are appended at the end
+        saturation: workers stop unstable runs early, see sweep.run_sweep
+    '''
+    poll = 0.5 # seconds a worker waits before asking again when every unit is out
+
+    def __init__(self, tasks, unit_size=4, timeout=30.0, heartbeat=5.0, on_result=None, store=None, saturation=True):
+        self.tasks = tasks
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat
+        self.on_result = on_result
+        self.store = store
+        self.saturation = saturation
+        self.results, pending = cached_results(tasks, store, on_result, saturation)
+        order = sorted(pending, key=lambda k: task_cost(tasks[k]), reverse=True)
+        self.units = [order[k:k + unit_size] for k in range(0, len(order), unit_size)]
+        self.pending = deque(range(len(self.units)))
+        self.running = {} # unit -> [connection, deadline]
+        self.done = set()
+        self.connections = itertools.count()
+        self.lock = threading.Condition()
+        self.server = None
+        self.issued = 0
+        self.reissued = 0
+
+    def finished(self):
+        return len(self.done) == len(self.units)
+
+    # units whose deadline has passed go back in the queue
+    def expire(self):
+        now = time.monotonic()
+        for unit, (_, deadline) in list(self.running.items()):
+            if deadline < now:
+                del self.running[unit]
+                self.pending.append(unit)
+                self.reissued += 1
+
+    # the reply to a worker that asks for work
+    def assign(self, connection):
+        with self.lock:
+            if self.finished():
+                return {'type': 'done'}
+            self.expire()
+            if not self.pending:
+                return {'type': 'wait', 'seconds': self.poll}
+            unit = self.pending.popleft()
+            self.running[unit] = [connection, time.monotonic() + self.timeout]
+            self.issued += 1
+            return {'type': 'unit', 'unit': unit, 'tasks': [list(self.tasks[k]) for k in self.units[unit]],
+                    'heartbeat': self.heartbeat_interval, 'saturation': self.saturation}
+
+    def heartbeat(self, unit):
+        with self.lock:
+            if unit in self.running:
+                self.running[unit][1] = time.monotonic() + self.timeout
+
+    def complete(self, unit, results):
+        with self.lock:
+            if unit in self.done:
+                return
+            self.done.add(unit)
+            self.running.pop(unit, None)
+            if unit in self.pending:
+                self.pending.remove(unit)
+            for k, result in zip(self.units[unit], results):
+                result['task'] = self.tasks[k]
+                self.results[k] = result
+                if self.on_result is not None:
+                    self.on_result(result)
+            self.lock.notify_all()
+
+    # the units of a worker that disconnected go back in the queue
+    def lost(self, connection):
+        with self.lock:
+            for unit, (owner, _) in list(self.running.items()):
+                if owner == connection:
+                    del self.running[unit]
+                    self.pending.appendleft(unit)
+                    self.reissued += 1
+
+    def start(self, host='', port=0):
+        """
+        starts serving workers in a background thread
+        :return: (host, port) the coordinator listens on, port 0 picks a free one
+        """
+        self.server = CoordinatorServer((host, port), WorkerConnection)
+        self.server.coordinator = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address
+
+    def wait(self):
+        """
+        blocks until every unit has a result, then stops serving and appends the new results to the store
+        :return: list of results in task order
+        """
+        with self.lock:
+            while not self.finished():
+                self.lock.wait()
+        # workers that ask again in the meantime are told the sweep is done
+        time.sleep(self.poll)
+        self.server.shutdown()
+        self.server.server_close()
+        if self.store is not None:
+            self.store.append([self.results[k] for unit in self.units for k in unit])
+        return self.results
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class WorkerConnection(socketserver.StreamRequestHandler):
+    '''
+    one worker connection on the coordinator
+    '''
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        connection = next(coordinator.connections)
+        try:
+            while True:
+                message = receive(self.rfile)
+                if message is None:
+                    break
+                if message['type'] == 'ready':
+                    reply = coordinator.assign(connection)
+                    send(self.wfile, reply)
+                    if reply['type'] == 'done':
+                        break
+                elif message['type'] == 'heartbeat':
+                    coordinator.heartbeat(message['unit'])
+                elif message['type'] == 'result':
+                    coordinator.complete(message['unit'], message['results'])
+        except (ConnectionError, ValueError):
+            # a worker that dies halfway through a line looks the same as one that disconnects
+            pass
+        finally:
+            coordinator.lost(connection)
+
+
+# sends a heartbeat for unit every interval seconds until stop is set
+def send_heartbeats(say, unit, interval, stop):
+    while not stop.wait(interval):
+        try:
+            say({'type': 'heartbeat', 'unit': unit})
+        except OSError:
+            return
+
+
+def run_worker(host, port, connect_timeout=30.0):
+    """
+    runs units from the coordinator at host:port until the sweep is done, one task at a time.
+    the coordinator does not have to be up yet, connecting is retried for connect_timeout seconds
+    :return: number of units run
+    """
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            sock = socket.create_connection((host, port))
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+    units = 0
+    # a coordinator that goes away ends the worker as well
+    with sock, sock.makefile('rwb') as stream, contextlib.suppress(ConnectionError):
+        lock = threading.Lock()
+
+        def say(message):
+            with lock:
+                send(stream, message)
+
+        while True:
+            say({'type': 'ready'})
+            reply = receive(stream)
+            if reply is None or reply['type'] == 'done':
+                break
+            if reply['type'] == 'wait':
+                time.sleep(reply['seconds'])
+                continue
+
+            stop = threading.Event()
+            beats = threading.Thread(target=send_heartbeats, args=(say, reply['unit'], reply['heartbeat'], stop),
+                                     daemon=True)
+            beats.start()
+            try:
+                results = []
+                for fields in reply['tasks']:
+                    result = run_task(SweepTask(*fields), reply['saturation'])
+                    del result['task']
+                    results.append(result)
+            finally:
+                stop.set()
+                beats.join()
+            say({'type': 'result', 'unit': reply['unit'], 'results': results})
+            units += 1
+    return units
+
+
+def start_workers(host, port, processes):
+    workers = [multiprocessing.Process(target=run_worker, args=(host, port)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def run_local(tasks, processes=None, on_result=None, store=None, **kwargs):
+    """
+    runs a sweep through a coordinator and worker processes on this machine
+    :param kwargs: passed to Coordinator (unit_size, timeout, heartbeat, saturation)
+    :return: list of results in task order
+    """
+    coordinator = Coordinator(tasks, on_result=on_result, store=store, **kwargs)
+    host, port = coordinator.start('127.0.0.1', 0)
+    workers = start_workers(host, port, processes or multiprocessing.cpu_count())
+    try:
+        return coordinator.wait()
+    finally:
+        for worker in workers:
+            worker.join()
+
+
+def print_progress(coordinator):
+    print(f'{len(coordinator.units)} units, {coordinator.issued} handed out, {coordinator.reissued} handed out again')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run a sweep over worker processes on several machines')
+    commands = parser.add_subparsers(dest='command', required=True)
+    coordinator_parser = commands.add_parser('coordinator', help='serve a sweep to workers')
+    local_parser = commands.add_parser('local', help='run a sweep with a coordinator and workers on this machine')
+    for command in (coordinator_parser, local_parser):
+        add_grid_arguments(command)
+        command.add_argument('--unit-size', type=int, default=4, help='tasks per work unit')
+        command.add_argument('--timeout', type=float, default=30.0,
+                             help='seconds without a heartbeat before a unit is handed out again')
+        command.add_argument('--heartbeat', type=float, default=5.0, help='seconds between worker heartbeats')
+    coordinator_parser.add_argument('--host', default='', help='address to listen on, all interfaces by default')
+    coordinator_parser.add_argument('--port', type=int, default=7077)
+    local_parser.add_argument('--processes', type=int, default=None, help='worker processes, defaults to the cpu count')
+    worker_parser = commands.add_parser('worker', help='run units for a coordinator')
+    worker_parser.add_argument('--host', default='127.0.0.1')
+    worker_parser.add_argument('--port', type=int, default=7077)
+    worker_parser.add_argument('--processes', type=int, default=1, help='worker processes to start')
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        for worker in start_workers(args.host, args.port, args.processes):
+            worker.join()
+        return
+
+    tasks = grid_tasks(args)
+    store = ResultsStore(args.store) if args.store is not None else None
+    coordinator = Coordinator(tasks, args.unit_size, args.timeout, args.heartbeat, print_result, store,
+                              args.saturation)
+    print(f'running {len(tasks)} simulations')
+    if args.command == 'coordinator':
+        host, port = coordinator.start(args.host, args.port)
+        print(f'waiting for workers on {host or "*"}:{port}')
+        workers = []
+    else:
+        host, port = coordinator.start('127.0.0.1', 0)
+        workers = start_workers(host, port, args.processes or multiprocessing.cpu_count())
+    results = coordinator.wait()
+    for worker in workers:
+        worker.join()
+    print_progress(coordinator)
+    if args.output != '-':
+        write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import argparse
+
+import numpy as np
+from arrivals import ArrivalSource, ArrivalStream
+from metrics import replication_summary
+from saturation import SaturationDetector
+from scheduling_algorithms import ALGORITHMS, algorithm_help
+
+"""
+policy comparisons with common random numbers. every replication draws one workload (arrival
+and burst times) and feeds the very same workload to each policy, so the policies only differ
+by how they schedule it. the differences between policies are then measured per replication
+and paired: the sampling noise of the workload cancels out of the difference, which needs far
+fewer replications for the same confidence interval than comparing independent runs, and the
+random numbers are only drawn once instead of once per policy.
+
+    python crn.py --algorithms 1 2 3 --rate 12 --replications 10 --seed 1
+"""
+
+
+class SharedWorkload:
+    '''
+    one synthetic arrival stream read by several policies. blocks are drawn once and kept
+    until every reader has moved past them
+    '''
+
+    def __init__(self, arrival_rate, avg_burst_time, seed=None, block_size=16384):
+        self.stream = ArrivalStream(arrival_rate, avg_burst_time, seed, block_size)
+        self.blocks = {} # block number -> (times, bursts)
+        self.drawn = 0
+        self.readers = []
+
+    # a new arrival source that replays the workload from the start
+    def reader(self):
+        view = WorkloadView(self)
+        self.readers.append(view)
+        return view
+
+    def block(self, k):
+        while self.drawn <= k:
+            self.stream.refill()
+            self.blocks[self.drawn] = (self.stream.times, self.stream.bursts)
+            self.drawn += 1
+        times, bursts = self.blocks[k]
+        # blocks every reader has passed are not needed any more
+        oldest = min(view.block_number for view in self.readers)
+        for j in [j for j in self.blocks if j < oldest]:
+            del self.blocks[j]
+        return times, bursts
+
+
+class WorkloadView(ArrivalSource):
+    '''
+    arrival source reading a SharedWorkload
+    '''
+
+    def __init__(self, workload):
+        super().__init__()
+        self.workload = workload
+        self.block_number = 0
+
+    def refill(self):
+        self.times, self.bursts = self.workload.block(self.block_number)
+        self.block_number += 1
+        self.cursor = 0
+
+
+# runs every algorithm on one workload, returns their collect_metrics dicts in order
+def run_replication(algorithms, arrival_rate, avg_burst, quantum, seed, saturation=True):
+    workload = SharedWorkload(arrival_rate, avg_burst, seed)
+    # every reader has to exist before the first one runs so no block is dropped too early
+    readers = [workload.reader() for _ in algorithms]
+    results = []
+    for algorithm, reader in zip(algorithms, readers):
+        detector = SaturationDetector() if saturation else None
+        s = ALGORITHMS[algorithm](arrival_rate, avg_burst, quantum, arrivals=reader, saturation=detector)
+        s.run_sim()
+        results.append(s.collect_metrics())
+    return results
+
+
+def compare_policies(algorithms, arrival_rate, avg_burst, quantum, replications=10, seed=None, level=0.95,
+                     saturation=True):
+    """
+    runs each algorithm on the same workload in every replication and pairs the results.
+    :return: dict with
+        'policies': algorithm -> {metric: (mean, ci half width)} over the replications
+        'differences': (algorithm, baseline) -> {metric: (mean difference, ci half width, variance ratio)}
+                       for every algorithm against the first one. variance ratio is the variance of
+                       the paired difference over the variance of the difference of independent
+                       runs, below 1 the pairing helped and 1 / ratio is the saving in replications
+    """
+    seeds = np.random.SeedSequence(seed).spawn(replications)
+    runs = [run_replication(algorithms, arrival_rate, avg_burst, quantum, s, saturation) for s in seeds]
+
+    per_policy = {a: [run[k] for run in runs] for k, a in enumerate(algorithms)}
+    summary = {'policies': {a: replication_summary(dicts, level) for a, dicts in per_policy.items()},
+               'differences': {}}
+    baseline = algorithms[0]
+    for algorithm in algorithms[1:]:
+        pairs = list(zip(per_policy[algorithm], per_policy[baseline]))
+        diffs = [{key: float(a[key]) - float(b[key]) for key in a} for a, b in pairs]
+        result = {}
+        for key, (mean, half_width) in replication_summary(diffs, level).items():
+            a = np.array([p[0][key] for p in pairs], dtype=np.float64)
+            b = np.array([p[1][key] for p in pairs], dtype=np.float64)
+            independent = a.var(ddof=1) + b.var(ddof=1) if len(pairs) > 1 else 0.0
+            paired = (a - b).var(ddof=1) if len(pairs) > 1 else 0.0
+            result[key] = (mean, half_width, paired / independent if independent > 0 else np.nan)
+        summary['differences'][(algorithm, baseline)] = result
+    return summary
+
+
+def print_summary(summary, metrics):
+    for algorithm, values in summary['policies'].items():
+        print(ALGORITHMS[algorithm].__name__)
+        for key in metrics:
+            mean, half_width = values[key]
+            print(f'    {key:<32} {mean:12.6g} +- {half_width:.3g}')
+    for (algorithm, baseline), values in summary['differences'].items():
+        print(f'{ALGORITHMS[algorithm].__name__} - {ALGORITHMS[baseline].__name__} (paired)')
+        for key in metrics:
+            mean, half_width, ratio = values[key]
+            print(f'    {key:<32} {mean:12.6g} +- {half_width:.3g}   variance ratio {ratio:.3f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='compare policies on common random numbers')
+    parser.add_argument('--algorithms', nargs='+', type=int, default=[1, 2, 3], help=algorithm_help() + ', the first is the baseline')
+    parser.add_argument('--rate', type=float, default=10, help='arrival rate')
+    parser.add_argument('--burst', type=float, default=0.06, help='average burst time')
+    parser.add_argument('--quantum', type=float, default=0.04, help='time quantum for RR')
+    parser.add_argument('--replications', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=None, help='random if omitted')
+    parser.add_argument('--level', type=float, default=0.95, help='confidence level')
+    args = parser.parse_args(argv)
+
+    summary = compare_policies(args.algorithms, args.rate, args.burst, args.quantum, args.replications,
+                               args.seed, args.level)
+    print_summary(summary, ["average turnaround time", "average wait time", "p95 turnaround time", "throughput"])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,461 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from metrics import t_quantile
+from results_store import METRICS
+
 """
-this python script will take the data collected by the data collection script
-and create plots.
-THIS WILL NOT RUN ON TSXT SERVER
+analysis of sweep results, headless. results are read from the data file (data.csv, see
+metrics_line) or from a results store in chunks of rows, so the input never has to fit in
+memory. chunks are aggregated in parallel worker processes: every chunk is grouped by
+(algorithm, arrival rate, burst, quantum) and reduced to a count, mean and sum of squared
+deviations per group and metric, saturated runs apart from the others, and the chunks are merged
+with the parallel variance formula. the means and confidence intervals across replications come
+out of the merged groups.
+
+the aggregates are cached next to the input. results are only ever appended, so when the input
+has grown since the cache was written only the new rows are read and merged in, and when
+nothing changed nothing is read at all. figures (mean against arrival rate with confidence
+intervals, one line per algorithm, burst and quantum, saturated runs as separate markers) are
+rendered in parallel with matplotlib when it is installed, without opening any windows.
+
+    python data_analyzer.py data.csv --figures figures
+    python data_analyzer.py --store results --metrics "p95 turnaround time" throughput
 """
 
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
-
-data = np.array(pd.read_csv('data.csv', header=None))
-
-#
-plt.plot(range(30), data.T[4][:30], color='r', label='FCFS')
-plt.plot(range(30), data.T[4][30:60], color='g', label='STRF')
-plt.plot(range(30), data.T[4][60:90], color='b', label='RR')
-plt.title('turnaround time')
-plt.xlabel('lambda')
-plt.ylabel('time (seconds)')
-plt.legend()
-plt.savefig('ges71_turnaround_time.png', bbox_inches='tight')
-plt.show()
-
-
-
-
-plt.plot(range(30), data.T[5][:30], color='r', label='FCFS')
-plt.plot(range(30), data.T[5][30:60], color='g', label='STRF')
-plt.plot(range(30), data.T[5][60:90], color='b', label='RR')
-plt.title('throughput')
-plt.xlabel('lambda')
-plt.ylabel('processes per second')
-plt.legend()
-plt.savefig('ges71_throughput.png', bbox_inches='tight')
-plt.show()
-
-
-plt.plot(range(30), data.T[7][:30], color='r', label='FCFS')
-plt.plot(range(30), data.T[7][30:60], color='g', label='STRF')
-plt.plot(range(30), data.T[7][60:90], color='b', label='RR')
-plt.title('average number of time events in the queue')
-plt.xlabel('lambda')
-plt.ylabel('time events in queue')
-plt.legend()
-plt.savefig('ges71_avge_time_events.png', bbox_inches='tight')
-plt.show()
\ No newline at end of file
+
+GROUP_COLUMNS = ('algorithm', 'arrival_rate', 'avg_burst', 'quantum')
+# metric columns of the data file, after the key columns
+CSV_METRICS = ("average turnaround time", "throughput", "average wait time", "average time events in queue")
+
+# title, y label and file name of the figures data_analyzer.py has always drawn
+FIGURES = {"average turnaround time": ('turnaround time', 'time (seconds)', 'turnaround_time'),
+           "throughput": ('throughput', 'processes per second', 'throughput'),
+           "average time events in queue": ('average number of time events in the queue', 'time events in queue',
+                                            'avge_time_events')}
+ALGORITHM_NAMES = {1: 'FCFS', 2: 'STRF', 3: 'RR', 4: 'MLFQ', 5: 'Priority', 6: 'SJF'}
+
+
+# per group count, mean and sum of squared deviations of every metric over the rows of values,
+# group holds the group of each row
+def moments(group, values, groups):
+    n = np.bincount(group, minlength=groups).astype(np.float64)
+    mean = np.zeros((groups, values.shape[1]))
+    m2 = np.zeros((groups, values.shape[1]))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for m in range(values.shape[1]):
+            mean[:, m] = np.where(n > 0, np.bincount(group, values[:, m], minlength=groups) / n, 0.0)
+            deviation = values[:, m] - mean[group, m]
+            m2[:, m] = np.bincount(group, deviation * deviation, minlength=groups)
+    return n, mean, m2
+
+
+# combines the count, mean and m2 of two sets of runs with the parallel variance formula
+def merge_moments(na, mean_a, m2_a, nb, mean_b, m2_b):
+    n = na + nb
+    delta = mean_b - mean_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n[:, None] > 0, mean_a + delta * (nb / n)[:, None], 0.0)
+        m2 = np.where(n[:, None] > 0, m2_a + m2_b + delta * delta * (na * nb / n)[:, None], 0.0)
+    return n, mean, m2
+
+
+# mean and confidence interval half width of every metric from a count, mean and m2 per group,
+# nan means for groups without runs and infinite half widths for groups with fewer than two
+def interval(n, mean, m2, level):
+    # one t quantile per distinct replication count
+    t = np.full(len(n), np.inf)
+    for count in np.unique(n):
+        if count >= 2:
+            t[n == count] = t_quantile(0.5 + level / 2, int(count) - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(m2 / (n - 1)[:, None])
+        return (np.where(n[:, None] > 0, mean, np.nan),
+                np.where(n[:, None] >= 2, t[:, None] * std / np.sqrt(n)[:, None], np.inf))
+
+
+class Aggregate:
+    '''
+    per group count, mean and sum of squared deviations (m2) of every metric. saturated runs were
+    stopped before they settled, they are kept apart in saturated, saturated_mean and saturated_m2
+    so they neither skew the means of the other runs nor vanish. unmarked counts the runs that come
+    from data file lines written before it had the saturation columns, which may or may not be
+    saturated, they are in the means of the other runs. groups are rows of keys
+    '''
+
+    def __init__(self, metrics):
+        self.metrics = tuple(metrics)
+        self.keys = np.empty((0, len(GROUP_COLUMNS)))
+        self.index = {} # key tuple -> group
+        self.n = np.empty(0)
+        self.mean = np.empty((0, len(self.metrics)))
+        self.m2 = np.empty((0, len(self.metrics)))
+        self.saturated = np.empty(0)
+        self.saturated_mean = np.empty((0, len(self.metrics)))
+        self.saturated_m2 = np.empty((0, len(self.metrics)))
+        self.unmarked = np.empty(0)
+
+    def __len__(self):
+        return len(self.n)
+
+    @classmethod
+    def from_rows(cls, metrics, keys, values, saturated, marked):
+        """
+        aggregates a chunk of rows
+        :param keys: (rows, 4) array of the key columns
+        :param values: (rows, metrics) array
+        :param saturated: boolean array, True for runs that were stopped as saturated
+        :param marked: boolean array, False for runs that are not known to be saturated or not
+        """
+        agg = cls(metrics)
+        if not len(keys):
+            return agg
+        agg.keys, group = np.unique(keys, axis=0, return_inverse=True)
+        group = group.ravel()
+        groups = len(agg.keys)
+        agg.index = {tuple(k): g for g, k in enumerate(agg.keys.tolist())}
+        agg.unmarked = np.bincount(group, ~marked, minlength=groups).astype(np.float64)
+        agg.n, agg.mean, agg.m2 = moments(group[~saturated], values[~saturated], groups)
+        agg.saturated, agg.saturated_mean, agg.saturated_m2 = moments(group[saturated], values[saturated], groups)
+        return agg
+
+    # merges another aggregate of the same metrics into this one
+    def merge(self, other):
+        new = [k for k in other.index if k not in self.index]
+        if new:
+            start = len(self.n)
+            for g, k in enumerate(new):
+                self.index[k] = start + g
+            self.keys = np.concatenate((self.keys, np.array(new, dtype=np.float64).reshape(-1, len(GROUP_COLUMNS))))
+            self.n = np.concatenate((self.n, np.zeros(len(new))))
+            self.mean = np.concatenate((self.mean, np.zeros((len(new), len(self.metrics)))))
+            self.m2 = np.concatenate((self.m2, np.zeros((len(new), len(self.metrics)))))
+            self.saturated = np.concatenate((self.saturated, np.zeros(len(new))))
+            self.saturated_mean = np.concatenate((self.saturated_mean, np.zeros((len(new), len(self.metrics)))))
+            self.saturated_m2 = np.concatenate((self.saturated_m2, np.zeros((len(new), len(self.metrics)))))
+            self.unmarked = np.concatenate((self.unmarked, np.zeros(len(new))))
+        target = np.array([self.index[k] for k in other.index], dtype=np.int64)
+        source = np.array(list(other.index.values()), dtype=np.int64)
+
+        self.n[target], self.mean[target], self.m2[target] = merge_moments(
+            self.n[target], self.mean[target], self.m2[target], other.n[source], other.mean[source], other.m2[source])
+        self.saturated[target], self.saturated_mean[target], self.saturated_m2[target] = merge_moments(
+            self.saturated[target], self.saturated_mean[target], self.saturated_m2[target],
+            other.saturated[source], other.saturated_mean[source], other.saturated_m2[source])
+        self.unmarked[target] += other.unmarked[source]
+        return self
+
+    def summary(self, level=0.95):
+        """
+        groups sorted by key, with the mean and confidence interval half width of every metric
+        :return: dict of arrays: the key columns, 'replications', 'saturated', 'unmarked' and for every metric
+                 the mean of the runs that were not saturated under its name, its half width under
+                 name + ' ci' and the same over the saturated runs under name + ' saturated' and
+                 name + ' saturated ci'
+        """
+        order = np.lexsort(self.keys.T[::-1]) if len(self) else np.empty(0, dtype=np.int64)
+        out = {name: self.keys[order, c] for c, name in enumerate(GROUP_COLUMNS)}
+        out['algorithm'] = out['algorithm'].astype(np.int64)
+        out['replications'] = self.n[order].astype(np.int64)
+        out['saturated'] = self.saturated[order].astype(np.int64)
+        out['unmarked'] = self.unmarked[order].astype(np.int64)
+        mean, half_width = interval(self.n[order], self.mean[order], self.m2[order], level)
+        saturated_mean, saturated_half_width = interval(self.saturated[order], self.saturated_mean[order],
+                                                        self.saturated_m2[order], level)
+        for m, name in enumerate(self.metrics):
+            out[name] = mean[:, m]
+            out[name + ' ci'] = half_width[:, m]
+            out[name + ' saturated'] = saturated_mean[:, m]
+            out[name + ' saturated ci'] = saturated_half_width[:, m]
+        return out
+
+    def save(self, path, source_state):
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, keys=self.keys, n=self.n, mean=self.mean, m2=self.m2, saturated=self.saturated,
+                     saturated_mean=self.saturated_mean, saturated_m2=self.saturated_m2, unmarked=self.unmarked,
+                     meta=np.frombuffer(json.dumps({'metrics': self.metrics, 'source': source_state}).encode(),
+                                        dtype=np.uint8))
+        os.replace(path + '.tmp', path)
+
+    # (aggregate, source state it covers) from a cache file, None if there is no usable one
+    @classmethod
+    def load(cls, path, metrics):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(data['meta'].tobytes().decode())
+                if tuple(meta['metrics']) != tuple(metrics):
+                    return None
+                agg = cls(metrics)
+                agg.keys, agg.n, agg.mean, agg.m2, agg.saturated, agg.saturated_mean, agg.saturated_m2, agg.unmarked = (
+                    data[name] for name in ('keys', 'n', 'mean', 'm2', 'saturated', 'saturated_mean', 'saturated_m2',
+                                            'unmarked'))
+        except (OSError, ValueError, KeyError):
+            return None
+        agg.index = {tuple(k): g for g, k in enumerate(agg.keys.tolist())}
+        return agg, meta['source']
+
+
+class CSVResults:
+    '''
+    a data file written by write_metrics or sweep.write_results. chunks are byte ranges that
+    start and end on line boundaries. a last line without its newline is still being written
+    and is left for the next read. lines have 10 fields (see metrics_line), or 8 when they were
+    written before the saturation columns, the runs of those are unmarked
+    '''
+    metrics = CSV_METRICS
+
+    def __init__(self, path):
+        self.path = path
+        self.cache_path = path + '.analysis.npz'
+
+    # the byte offset up to which the file holds whole lines
+    def end(self):
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as f:
+            f.seek(max(size - 4096, 0))
+            tail = f.read()
+        return size - len(tail) + tail.rfind(b'\n') + 1 if b'\n' in tail else 0
+
+    # identifies the first end bytes, a cache of them is only good while they stay the same
+    def state(self, end):
+        h = hashlib.sha1()
+        with open(self.path, 'rb') as f:
+            h.update(f.read(min(end, 1 << 16)))
+            f.seek(max(end - (1 << 16), 0))
+            h.update(f.read(end - f.tell()))
+        return {'end': end, 'digest': h.hexdigest()}
+
+    def chunks(self, start, end, chunk_rows):
+        chunk_bytes = chunk_rows * 100 # data file lines are around 100 bytes
+        bounds = [start]
+        with open(self.path, 'rb') as f:
+            while bounds[-1] + chunk_bytes < end:
+                f.seek(bounds[-1] + chunk_bytes)
+                f.readline()
+                if f.tell() >= end:
+                    break
+                bounds.append(f.tell())
+        bounds.append(end)
+        return list(zip(bounds, bounds[1:]))
+
+    def read(self, start, end):
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            lines = f.read(end - start).decode().splitlines()
+        widths = np.array([line.count(',') + 1 for line in lines], dtype=np.int64)
+        rows = np.full((len(lines), 10), np.nan)
+        for width in np.unique(widths).tolist():
+            if width not in (8, 10):
+                raise ValueError(f'{self.path}: data file lines have 8 or 10 fields, found one with {width}')
+            at = np.flatnonzero(widths == width)
+            part = lines if len(at) == len(lines) else [lines[k] for k in at.tolist()]
+            rows[at, :width] = np.loadtxt(part, delimiter=',', ndmin=2)
+        marked = ~np.isnan(rows[:, 8])
+        return rows[:, :4], rows[:, 4:8], rows[:, 8] == 1, marked
+
+
+class StoreResults:
+    '''
+    a results store, chunks are row ranges read straight from the column files
+    '''
+    metrics = METRICS
+
+    def __init__(self, path):
+        self.path = path
+        self.cache_path = os.path.join(path, 'analysis.npz')
+
+    def end(self):
+        with open(os.path.join(self.path, 'meta.json')) as f:
+            return json.load(f)['rows']
+
+    # stores are append only, rows below end do not change
+    def state(self, end):
+        return {'end': end}
+
+    def chunks(self, start, end, chunk_rows):
+        return [(k, min(k + chunk_rows, end)) for k in range(start, end, chunk_rows)]
+
+    def read(self, start, end):
+        from results_store import ResultsStore
+        store = ResultsStore(self.path)
+        keys = np.column_stack([store.column(name)[start:end] for name in GROUP_COLUMNS]).astype(np.float64)
+        values = np.column_stack([store.column(name)[start:end] for name in METRICS])
+        saturated = store.column('saturated')[start:end].astype(bool)
+        return keys, values, saturated, np.ones(len(saturated), dtype=bool)
+
+
+def aggregate_chunk(source, start, end):
+    return Aggregate.from_rows(source.metrics, *source.read(start, end))
+
+
+def aggregate(source, workers=None, chunk_rows=1 << 18, cache=True):
+    """
+    aggregates every row of source, reading only the rows the cache does not cover yet
+    :param source: CSVResults or StoreResults
+    :param workers: worker processes for the chunks, defaults to the cpu count. 1 runs in this process
+    :param cache: read and update the cache file of source
+    :return: (Aggregate, number of chunks read)
+    """
+    end = source.end()
+    agg, start = None, 0
+    if cache:
+        cached = Aggregate.load(source.cache_path, source.metrics)
+        if cached is not None:
+            cached_agg, state = cached
+            # the cache only counts if the rows it covers are still there unchanged
+            if state['end'] <= end and source.state(state['end']) == state:
+                agg, start = cached_agg, state['end']
+    if agg is None:
+        agg = Aggregate(source.metrics)
+
+    chunks = source.chunks(start, end, chunk_rows) if start < end else []
+    if workers == 1 or len(chunks) <= 1:
+        parts = (aggregate_chunk(source, a, b) for a, b in chunks)
+        for part in parts:
+            agg.merge(part)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(aggregate_chunk, [source] * len(chunks), *zip(*chunks)):
+                agg.merge(part)
+
+    if cache and chunks:
+        agg.save(source.cache_path, source.state(end))
+    return agg, len(chunks)
+
+
+# one line per (algorithm, burst, quantum), each a list of (arrival rate, mean, ci half width,
+# mean and ci half width of the saturated runs). means are nan where a group has no such runs
+def figure_series(summary, metric):
+    series = {}
+    for k in range(len(summary['algorithm'])):
+        label = (int(summary['algorithm'][k]), float(summary['avg_burst'][k]), float(summary['quantum'][k]))
+        series.setdefault(label, []).append((float(summary['arrival_rate'][k]), float(summary[metric][k]),
+                                             float(summary[metric + ' ci'][k]),
+                                             float(summary[metric + ' saturated'][k]),
+                                             float(summary[metric + ' saturated ci'][k])))
+    return series
+
+
+def render_figure(path, metric, series):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    title, ylabel, _ = FIGURES.get(metric, (metric, metric, None))
+    fig, ax = plt.subplots()
+    several_bursts = len({burst for _, burst, _ in series}) > 1
+    several_quanta = len({(algorithm, quantum) for algorithm, _, quantum in series}) > len({a for a, _, _ in series})
+    for (algorithm, burst, quantum), points in sorted(series.items()):
+        label = ALGORITHM_NAMES.get(algorithm, str(algorithm))
+        if several_bursts:
+            label += f' burst {burst:g}'
+        if several_quanta:
+            label += f' q {quantum:g}'
+        rates, means, half_widths, saturated_means, saturated_half_widths = (np.array(v) for v in zip(*points))
+        stable = np.isfinite(means)
+        line = ax.errorbar(rates[stable], means[stable],
+                           yerr=np.where(np.isfinite(half_widths), half_widths, 0)[stable], label=label, capsize=2)
+        # saturated runs stopped early, their means are only what they got to before the stop
+        saturated = np.isfinite(saturated_means)
+        if saturated.any():
+            ax.errorbar(rates[saturated], saturated_means[saturated],
+                        yerr=np.where(np.isfinite(saturated_half_widths), saturated_half_widths, 0)[saturated],
+                        color=line.lines[0].get_color(), fmt='x', capsize=2, label=label + ' saturated')
+    ax.set_title(title)
+    ax.set_xlabel('lambda')
+    ax.set_ylabel(ylabel)
+    ax.legend()
+    fig.savefig(path, bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def render_figures(summary, metrics, directory, prefix='ges71', workers=None):
+    """
+    renders one figure per metric in parallel worker processes
+    :return: list of the files written
+    """
+    os.makedirs(directory, exist_ok=True)
+    jobs = []
+    for metric in metrics:
+        name = FIGURES[metric][2] if metric in FIGURES else metric.replace(' ', '_')
+        jobs.append((os.path.join(directory, f'{prefix}_{name}.png'), metric, figure_series(summary, metric)))
+    if workers == 1 or len(jobs) <= 1:
+        return [render_figure(*job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(render_figure, *zip(*jobs)))
+
+
+def write_summary(summary, metrics, path):
+    columns = list(GROUP_COLUMNS) + ['replications', 'saturated', 'unmarked']
+    for metric in metrics:
+        columns += [metric, metric + ' ci', metric + ' saturated', metric + ' saturated ci']
+    with open(path, 'w') as f:
+        f.write(','.join(columns) + '\n')
+        for k in range(len(summary['algorithm'])):
+            f.write(','.join(str(summary[c][k].item()) for c in columns) + '\n')
+
+
+def print_summary(summary, metrics):
+    for k in range(len(summary['algorithm'])):
+        algorithm = int(summary['algorithm'][k])
+        saturated = f"saturated = {summary['saturated'][k]}"
+        if summary['unmarked'][k]:
+            saturated += f" and {summary['unmarked'][k]} unknown"
+        print(f"{ALGORITHM_NAMES.get(algorithm, algorithm)} arrival_rate = {summary['arrival_rate'][k]:g} "
+              f"burst = {summary['avg_burst'][k]:g} quantum = {summary['quantum'][k]:g} "
+              f"replications = {summary['replications'][k]} {saturated}")
+        for metric in metrics:
+            mean, half_width = summary[metric][k], summary[metric + ' ci'][k]
+            line = f'    {metric:<32} {mean:12.6g} +- {half_width:.3g}'
+            if summary['saturated'][k]:
+                mean, half_width = summary[metric + ' saturated'][k], summary[metric + ' saturated ci'][k]
+                line += f'    saturated {mean:12.6g} +- {half_width:.3g}'
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='aggregate sweep results and draw figures, without a display')
+    parser.add_argument('data_file', nargs='?', default='data.csv', help='data file to read, unless --store is given')
+    parser.add_argument('--store', default=None, help='results store directory to read instead of the data file')
+    parser.add_argument('--metrics', nargs='+', default=None,
+                        help='metrics to report, defaults to the ones data_analyzer.py has always plotted')
+    parser.add_argument('--level', type=float, default=0.95, help='confidence level')
+    parser.add_argument('--summary', default=None, help='csv file to write the aggregated groups to')
+    parser.add_argument('--figures', default=None, help='directory to render figures into')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the cpu count')
+    parser.add_argument('--chunk-rows', type=int, default=1 << 18, help='rows per chunk')
+    parser.add_argument('--no-cache', action='store_true', help='neither read nor write the aggregate cache')
+    parser.add_argument('--quiet', action='store_true', help='do not print the groups')
+    args = parser.parse_args(argv)
+
+    source = StoreResults(args.store) if args.store is not None else CSVResults(args.data_file)
+    metrics = args.metrics or list(FIGURES)
+    unknown = [m for m in metrics if m not in source.metrics]
+    if unknown:
+        parser.error(f'unknown metrics {unknown}, choose from {list(source.metrics)}')
+
+    agg, chunks = aggregate(source, args.workers, args.chunk_rows, cache=not args.no_cache)
+    summary = agg.summary(args.level)
+    print(f'{len(agg)} groups, {int(agg.n.sum() + agg.saturated.sum())} runs, {chunks} new chunks read')
+    if agg.unmarked.sum():
+        print(f'{int(agg.unmarked.sum())} runs come from data file lines without the saturation columns, it is not '
+              f'known whether they were saturated and they are in the means')
+    if not args.quiet:
+        print_summary(summary, metrics)
+    if args.summary is not None:
+        write_summary(summary, metrics, args.summary)
+    if args.figures is not None:
+        try:
+            for path in render_figures(summary, metrics, args.figures, workers=args.workers):
+                print(f'wrote {path}')
+        except ImportError:
+            print('matplotlib is not installed, no figures were rendered')
+
+
+if __name__ == '__main__':
+    main()
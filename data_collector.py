@@ -1,28 +1,13 @@
-
-from scheduling_algorithms import *
+from sweep import make_tasks, run_sweep, write_results, print_result
 
 avg_arrival_rates = [x for x in range(1,31)]
 average_burst = 0.06
 q = 0.04
 data_file = 'data.csv'
 
-print('starting fcfs')
-for i in avg_arrival_rates:
-    print("arrival_rate = ", i)
-    s = FCFS(i, average_burst, q)
-    s.run_sim()
-    s.write_metrics(data_file)
-
-print('starting STRF')
-for i in avg_arrival_rates:
-    print("arrival_rate = ", i)
-    s = STRF(i, average_burst, q)
-    s.run_sim()
-    s.write_metrics(data_file)
-
-print('starting RR')
-for i in avg_arrival_rates:
-    print("arrival_rate = ", i)
-    s = RR(i, average_burst, q)
-    s.run_sim()
-    s.write_metrics(data_file)
\ No newline at end of file
+if __name__ == '__main__':
+    # FCFS, STRF then RR over every arrival rate, run in parallel and written in that order
+    print('starting FCFS, STRF and RR')
+    tasks = make_tasks([1, 2, 3], avg_arrival_rates, [average_burst], [q])
+    results = run_sweep(tasks, on_result=print_result)
+    write_results(results, data_file)
@@ -0,0 +1,104 @@
+import heapq
+import itertools
+
+"""
+event queue backends for the scheduler.
+
+events are ordered by (time, rank, sequence number). the rank breaks ties between event types
+that land on the same time (arrivals always come first) and the sequence number keeps
+everything else first in first out so equal keys come back in the order they were added.
+"""
+
+
+class EventQueue:
+    '''
+    base class for event queue backends. a backend only has to store entries and hand back
+    the smallest one, the scheduler decides the keys.
+    '''
+
+    def __init__(self):
+        self.counter = itertools.count()
+
+    # builds the key entry for an event
+    def entry(self, event, rank):
+        return (event.time, rank, next(self.counter), event)
+
+    def push(self, event, rank):
+        self.push_entry(self.entry(event, rank))
+
+    def push_entry(self, entry):
+        raise NotImplementedError
+
+    # removes and returns the next event
+    def pop(self):
+        raise NotImplementedError
+
+    # returns the next entry without removing it
+    def peek(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    # iterates over the queued entries in no particular order
+    def __iter__(self):
+        raise NotImplementedError
+
+
+class HeapEventQueue(EventQueue):
+    '''
+    binary heap backend. push and pop are O(log n)
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.heap = []
+
+    def push_entry(self, entry):
+        heapq.heappush(self.heap, entry)
+
+    def pop(self):
+        return heapq.heappop(self.heap)[3]
+
+    def peek(self):
+        return self.heap[0]
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __iter__(self):
+        return iter(self.heap)
+
+
+class SortedListEventQueue(EventQueue):
+    '''
+    sorted list backend, kept as a simple reference for the heap.
+    entries are stored in reverse order so the next event is popped off the end
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+
+    def push_entry(self, entry):
+        # keys are unique because of the sequence number so the negated search is exact
+        lo, hi = 0, len(self.entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.entries[mid][:3] > entry[:3]:
+                lo = mid + 1
+            else:
+                hi = mid
+        self.entries.insert(lo, entry)
+
+    def pop(self):
+        return self.entries.pop()[3]
+
+    def peek(self):
+        return self.entries[-1]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
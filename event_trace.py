@@ -0,0 +1,291 @@
+import argparse
+import os
+
+import numpy as np
+from hooks import SimHooks
+
+"""
+binary event trace of a run. TraceRecorder is a SimHooks that writes one fixed width record
+(time, remaining, pid, queued, type) per event into a preallocated buffer and copies the buffer
+into a memory mapped file whenever it fills up, so the cost per event is one record write plus
+an occasional block copy however long the run is. record types:
+    1 arrival: remaining is the burst time
+    2 time slice: remaining is the time the process had left when the slice started
+    3 termination: remaining is 0
+    4 slice end: the process left the cpu unfinished, its quantum ran out or an arrival preempted
+      it (policy schedulers only). remaining is what it has left
+queued is the number of processes in the ready queue once the event has been handled. arrivals
+taken in bulk (see Scheduler.absorb_arrivals) are recorded as a block.
+
+EventTrace reads a trace back without running anything: per process timelines and the ready
+queue length over time, all in numpy.
+
+    s = RR(10, 0.06, 0.04, hooks=TraceRecorder('run.trace'))
+    s.run_sim()
+    python event_trace.py run.trace
+"""
+
+
+RECORD_DTYPE = np.dtype([('time', '<f8'), ('remaining', '<f8'), ('pid', '<i8'), ('queued', '<i4'), ('type', '<i1')])
+TYPE_NAMES = {1: 'arrival', 2: 'time slice', 3: 'termination', 4: 'slice end'}
+
+
+class TraceRecorder(SimHooks):
+    '''
+    records every event of a run to path. takes the SimHooks arguments as well, timers and
+    histograms are off by default so the trace is all it costs.
+        buffer_size: records held in memory between two copies to the file
+        grow: records the file is extended by when it is full, rounded up to buffer_size
+    the file is closed and cut to the records written when the run ends
+    '''
+
+    def __init__(self, path, buffer_size=1 << 16, grow=1 << 22, timers=False, histograms=False, **kwargs):
+        super().__init__(timers=timers, histograms=histograms, **kwargs)
+        self.path = path
+        self.buffer = np.zeros(buffer_size, dtype=RECORD_DTYPE)
+        self.grow = -(-max(grow, buffer_size) // buffer_size) * buffer_size
+        self.used = 0 # records in the buffer
+        self.written = 0 # records in the file
+        self.file = None
+        self.map = None
+
+    def __len__(self):
+        return self.written + self.used
+
+    # appends one record to the buffer
+    def record(self, time, event_type, pid, remaining, queued):
+        self.buffer[self.used] = (time, remaining, pid, queued, event_type)
+        self.used += 1
+        if self.used == len(self.buffer):
+            self.flush()
+
+    # appends a block of records given as arrays, in buffer sized pieces
+    def record_block(self, times, event_type, pids, remaining, queued):
+        n = len(times)
+        start = 0
+        while start < n:
+            k = min(n - start, len(self.buffer) - self.used)
+            block = self.buffer[self.used:self.used + k]
+            block['time'] = times[start:start + k]
+            block['remaining'] = remaining[start:start + k]
+            block['pid'] = pids[start:start + k]
+            block['queued'] = queued[start:start + k]
+            block['type'] = event_type
+            self.used += k
+            start += k
+            if self.used == len(self.buffer):
+                self.flush()
+
+    # copies the buffer into the mapped file, extending the file first if it is full
+    def flush(self):
+        if self.used == 0:
+            return
+        if self.map is None or self.written + self.used > len(self.map):
+            size = (len(self.map) if self.map is not None else 0) + self.grow
+            self.map = None
+            self.file.truncate(size * RECORD_DTYPE.itemsize)
+            self.map = np.memmap(self.file, dtype=RECORD_DTYPE, mode='r+', shape=(size,))
+        self.map[self.written:self.written + self.used] = self.buffer[:self.used]
+        self.written += self.used
+        self.used = 0
+
+    def attach(self, sim):
+        super().attach(sim)
+        self.file = open(self.path, 'w+b')
+        self.used = self.written = 0
+        table = sim.processes
+        scale = sim.time_scale # records are in seconds whatever the clock unit
+        in_arrival = [False] # set while an arrival is handled, ready queue adds are then arrivals
+        handle_arrival_event = sim.handle_arrival_event
+        handle_time_event = sim.handle_time_event
+        handle_termination_event = sim.handle_termination_event
+        add_time_event = sim.add_time_event
+        add_time_events = sim.add_time_events
+        record = self.record
+
+        def traced_handle_arrival_event(i):
+            in_arrival[0] = True
+            try:
+                handle_arrival_event(i)
+            finally:
+                in_arrival[0] = False
+
+        def traced_add_time_event(i):
+            add_time_event(i)
+            if in_arrival[0]:
+                record(table.arrival.item(i) * scale, 1, table.pid.item(i), table.burst.item(i) * scale,
+                       sim.time_events_ready)
+
+        def traced_add_time_events(rows):
+            queued = sim.time_events_ready + np.arange(1, len(rows) + 1)
+            # RR adds a block one process at a time, those adds are recorded here and not again
+            in_arrival[0] = False
+            try:
+                add_time_events(rows)
+            finally:
+                in_arrival[0] = True
+            self.record_block(table.arrival[rows] * scale, 1, table.pid[rows], table.burst[rows] * scale, queued)
+
+        def traced_handle_time_event(i):
+            pid = table.pid.item(i)
+            remaining = table.remaining.item(i)
+            handle_time_event(i)
+            record(sim.clock * scale, 2, pid, remaining * scale, sim.time_events_ready)
+
+        def traced_handle_termination_event(i):
+            pid = table.pid.item(i)
+            handle_termination_event(i)
+            record(sim.clock * scale, 3, pid, 0.0, sim.time_events_ready)
+
+        self.patch(sim, 'handle_arrival_event', traced_handle_arrival_event)
+        self.patch(sim, 'add_time_event', traced_add_time_event)
+        self.patch(sim, 'add_time_events', traced_add_time_events)
+        self.patch(sim, 'handle_time_event', traced_handle_time_event)
+        self.patch(sim, 'handle_termination_event', traced_handle_termination_event)
+
+        if hasattr(sim, 'end_slice'):
+            end_slice = sim.end_slice
+
+            def traced_end_slice(i, expired):
+                end_slice(i, expired)
+                record(sim.clock * scale, 4, table.pid.item(i), table.remaining.item(i) * scale, sim.time_events_ready)
+            self.patch(sim, 'end_slice', traced_end_slice)
+
+    def detach(self, sim):
+        super().detach(sim)
+        self.close()
+
+    # writes what is left in the buffer and cuts the file to the records written
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        if self.map is not None:
+            self.map.flush()
+            self.map = None
+        self.file.truncate(self.written * RECORD_DTYPE.itemsize)
+        self.file.close()
+        self.file = None
+
+
+class EventTrace:
+    '''
+    a trace written by TraceRecorder, memory mapped read only. records of type 0 at the end are
+    space the recorder had reserved but not filled, from a run that did not finish, and are left out
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.getsize(path) == 0:
+            records = np.empty(0, dtype=RECORD_DTYPE)
+        else:
+            records = np.memmap(path, dtype=RECORD_DTYPE, mode='r')
+            filled = np.flatnonzero(records['type'])
+            records = records[:filled[-1] + 1 if len(filled) else 0]
+        self.records = records
+
+    def __len__(self):
+        return len(self.records)
+
+    # number of records of each type
+    def counts(self):
+        return {name: int(np.count_nonzero(self.records['type'] == t)) for t, name in TYPE_NAMES.items()}
+
+    # records of one process in the order they happened
+    def timeline(self, pid):
+        return self.records[self.records['pid'] == pid]
+
+    def timelines(self):
+        """
+        one row per process, in pid order. times of events that are not in the trace (a process
+        that had not finished when the run ended) are nan
+        :return: dict of arrays: pid, arrival, burst, first slice, completion, slices, turnaround,
+                 wait and response (first slice - arrival)
+        """
+        r = self.records
+        pids = np.unique(r['pid'])
+        n = len(pids)
+        out = {'pid': pids}
+
+        # field of the first record of each process with the given type, records are in time order
+        def per_process(event_type, field):
+            values = np.full(n, np.nan)
+            sub = r[r['type'] == event_type]
+            sub_pids, first = np.unique(sub['pid'], return_index=True)
+            values[np.searchsorted(pids, sub_pids)] = sub[field][first]
+            return values
+
+        out['arrival'] = per_process(1, 'time')
+        out['burst'] = per_process(1, 'remaining')
+        out['first slice'] = per_process(2, 'time')
+        out['completion'] = per_process(3, 'time')
+        slices = r['pid'][r['type'] == 2]
+        out['slices'] = np.bincount(np.searchsorted(pids, slices), minlength=n)
+        out['turnaround'] = out['completion'] - out['arrival']
+        out['wait'] = out['turnaround'] - out['burst']
+        out['response'] = out['first slice'] - out['arrival']
+        return out
+
+    def queue_length(self):
+        """
+        the ready queue length as a step function of time, one point per distinct event time
+        holding the length after the last event at that time
+        :return: (times, lengths)
+        """
+        times = np.asarray(self.records['time'])
+        queued = np.asarray(self.records['queued'])
+        if len(times) == 0:
+            return times, queued
+        last = np.append(times[1:] != times[:-1], True)
+        return times[last], queued[last]
+
+    # time weighted mean of the ready queue length over the traced span
+    def mean_queue_length(self):
+        times, lengths = self.queue_length()
+        if len(times) < 2:
+            return float(lengths[0]) if len(lengths) else 0.0
+        return float(np.dot(lengths[:-1], np.diff(times)) / (times[-1] - times[0]))
+
+
+def print_summary(trace):
+    print(f'{trace.path}: {len(trace)} records')
+    for name, count in trace.counts().items():
+        print(f'    {name:<12} {count}')
+    if len(trace) == 0:
+        return
+    lines = trace.timelines()
+    done = ~np.isnan(lines['turnaround'])
+    times, lengths = trace.queue_length()
+    print(f"span {times[0]:.6g} - {times[-1]:.6g}, {len(lines['pid'])} processes, {int(done.sum())} finished")
+    if done.any():
+        print(f"average turnaround time {lines['turnaround'][done].mean():.6g}")
+        print(f"average wait time {lines['wait'][done].mean():.6g}")
+        print(f"average response time {np.nanmean(lines['response'][done]):.6g}")
+    print(f'ready queue length: time average {trace.mean_queue_length():.6g}, max {int(lengths.max())}')
+
+
+def print_timeline(trace, pid):
+    records = trace.timeline(pid)
+    if len(records) == 0:
+        print(f'process {pid} is not in the trace')
+        return
+    for rec in records:
+        print(f"{rec['time']:14.6f}  {TYPE_NAMES[int(rec['type'])]:<12} remaining={rec['remaining']:.6g} "
+              f"queued={rec['queued']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='summarise an event trace written by TraceRecorder')
+    parser.add_argument('path')
+    parser.add_argument('--pid', type=int, action='append', default=[], help='print the timeline of a process')
+    args = parser.parse_args(argv)
+
+    trace = EventTrace(args.path)
+    print_summary(trace)
+    for pid in args.pid:
+        print(f'process {pid}:')
+        print_timeline(trace, pid)
+
+
+if __name__ == '__main__':
+    main()
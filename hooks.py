@@ -0,0 +1,127 @@
+import time
+from collections import defaultdict
+
+"""
+optional instrumentation for Scheduler.run_sim. a scheduler built with hooks=SimHooks(...) runs
+a separate instrumented loop, the normal loop has no hook checks in it at all so it runs at
+full speed when hooks are off.
+
+while the instrumented loop runs, the hooks wrap the scheduler's methods on the instance
+(and the arrival source's refill) to time them, and take them off again when the run ends.
+"""
+
+
+# histogram bucket of a queue length: 0 for an empty queue, otherwise k for 2**(k-1) <= n < 2**k.
+# a heap insert sifts through at most k levels so this is also its worst case scan length
+def length_bucket(n):
+    return n.bit_length()
+
+
+class SimHooks:
+    '''
+    per method timers, queue length histograms at insertion and user callbacks.
+        times / calls: seconds spent in and number of calls to each timed method. handler times
+                       include the time of the methods they call
+        scan_lengths: histograms (bucket -> count, see length_bucket) of the ready queue length when
+                      a process is added to it and of the event queue length when an event is pushed
+        on_pop(sim, event): called with every event the loop takes, before it is handled
+        on_complete(sim, i): called when the process in row i finishes, before its row is released
+        methods: names of the methods to time, defaults to timed_methods ('arrival refill' is the
+                 arrival source's refill). a timed method that calls another timed one pays for
+                 that timer too, timing the handlers alone gives their true cost
+    '''
+    timed_methods = ('pop_event', 'handle_arrival_event', 'handle_time_event', 'handle_termination_event',
+                     'handle_slice_end_event', 'add_arrival_event', 'add_time_event', 'add_time_events',
+                     'add_termination_event', 'arrival refill')
+
+    def __init__(self, timers=True, histograms=True, on_pop=None, on_complete=None, methods=None):
+        self.timers = timers
+        self.methods = methods if methods is not None else self.timed_methods
+        self.histograms = histograms
+        self.on_pop = on_pop
+        self.on_complete = on_complete
+        self.times = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.scan_lengths = {'ready queue': defaultdict(int), 'event queue': defaultdict(int)}
+        self.patched = []
+
+    # wraps func so its time goes to self.times[name]
+    def timed(self, name, func):
+        times = self.times
+        calls = self.calls
+
+        def wrapper(*args):
+            start = time.perf_counter()
+            result = func(*args)
+            times[name] += time.perf_counter() - start
+            calls[name] += 1
+            return result
+        return wrapper
+
+    # sets an instance attribute that shadows the class method, remembered so detach can remove it
+    def patch(self, obj, name, func):
+        setattr(obj, name, func)
+        if not any(o is obj and n == name for o, n in self.patched):
+            self.patched.append((obj, name))
+
+    def attach(self, sim):
+        if self.histograms:
+            ready_hist = self.scan_lengths['ready queue']
+            event_hist = self.scan_lengths['event queue']
+            add_time_event = sim.add_time_event
+            add_time_events = sim.add_time_events
+            push_event = sim.push_event
+
+            def counted_add_time_event(i):
+                ready_hist[length_bucket(sim.time_events_ready)] += 1
+                add_time_event(i)
+
+            # a block of arrivals is counted at the length the queue had before the block
+            def counted_add_time_events(rows):
+                ready_hist[length_bucket(sim.time_events_ready)] += len(rows)
+                add_time_events(rows)
+
+            def counted_push_event(event):
+                event_hist[length_bucket(len(sim.event_queue))] += 1
+                push_event(event)
+            self.patch(sim, 'add_time_event', counted_add_time_event)
+            self.patch(sim, 'add_time_events', counted_add_time_events)
+            self.patch(sim, 'push_event', counted_push_event)
+
+        if self.timers:
+            # handle_slice_end_event is only there on policy schedulers
+            for name in [name for name in self.methods if hasattr(sim, name)]:
+                self.patch(sim, name, self.timed(name, getattr(sim, name)))
+            if 'arrival refill' in self.methods and hasattr(sim.arrivals, 'refill'):
+                self.patch(sim.arrivals, 'refill', self.timed('arrival refill', sim.arrivals.refill))
+
+        if self.on_complete is not None:
+            finish_process = sim.finish_process
+            on_complete = self.on_complete
+
+            def hooked_finish_process(i):
+                on_complete(sim, i)
+                finish_process(i)
+            self.patch(sim, 'finish_process', hooked_finish_process)
+
+    def detach(self, sim):
+        for obj, name in self.patched:
+            delattr(obj, name)
+        self.patched = []
+
+    # microseconds per call of each timed method
+    def us_per_call(self):
+        return {name: self.times[name] / self.calls[name] * 1e6 for name in self.times if self.calls[name]}
+
+    def report(self):
+        lines = ['method                        calls     total s   us/call']
+        per_call = self.us_per_call()
+        for name in sorted(self.times, key=self.times.get, reverse=True):
+            lines.append(f'{name:<28} {self.calls[name]:7d} {self.times[name]:11.4f} {per_call.get(name, 0):9.2f}')
+        for queue, hist in self.scan_lengths.items():
+            if hist:
+                lines.append(f'{queue} length at insert:')
+                for bucket in sorted(hist):
+                    low = 0 if bucket == 0 else 2 ** (bucket - 1)
+                    lines.append(f'  >= {low:<8d} {hist[bucket]}')
+        return '\n'.join(lines)
@@ -1,42 +1,133 @@
 import sys
 """
 Driver code for discrete time simulator
+
+    python main.py 3 10 0.06 0.04                        one run in this process
+    python main.py client 3 10 0.06 0.04 --seed 1        the same run on a running service.py
+the simulator is only imported for runs in this process, the client starts without numpy
 """
-from scheduling_algorithms import *
 
 
 def help_():
+    from scheduling_algorithms import ALGORITHMS, algorithm_help
     s = "this program takes 4 arguments and should be executed as\npython main.py arg1 arg2 arg3 arg4\n" \
-        "arg1: integer 1-3 representing the desired scheduling algorithm. \t1) FCFS \t2) STRF \t3) RR\n" \
+        f"arg1: integer 1-{len(ALGORITHMS)} representing the desired scheduling algorithm. \t{algorithm_help()}\n" \
         "arg2: integer 1-30, average arrival rate (average processes per second)\n" \
         "arg3: float, average burst time (0.06 is recommended)\n" \
-        "arg4: float, time quantum for RR (0.04 is recommended and this argument may be omitted if arg1 is not 3)\n"
+        "arg4: float, time quantum for RR and MLFQ (0.04 is recommended and this argument may be omitted for the\n" \
+        "      other algorithms)\n" \
+        "python main.py client --help sends runs to a simulation service (service.py) instead\n"
     print(s)
     exit(0)
 
 
+def client(argv):
+    import argparse
+
+    from service import DEFAULT_SOCKET
+
+    parser = argparse.ArgumentParser(prog='main.py client', description='run simulations on a running service.py')
+    parser.add_argument('run', nargs='*', type=float, metavar='ARG',
+                        help='algorithm, arrival rate, burst time and quantum, as for a run in this process')
+    parser.add_argument('--seed', type=int, default=None, help='identical seeded runs in flight are run once')
+    parser.add_argument('--max-processes', type=int, default=None)
+    parser.add_argument('--target', type=float, default=None,
+                        help='stop at this relative confidence interval half width instead of at max processes')
+    parser.add_argument('--saturation', action='store_true', help='stop runs that are clearly unstable')
+    parser.add_argument('--requests', default=None,
+                        help='file of json line run requests to send instead, - for stdin. replies are printed as json lines')
+    parser.add_argument('--status', action='store_true', help='print the service counters')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='path of the service socket')
+    args = parser.parse_args(argv)
+
+    # the requests are read and checked before anything is sent, only the socket calls below
+    # mean that the service is not there when they fail
+    if args.status:
+        requests = None
+    elif args.requests is not None:
+        requests = read_requests(args.requests, parser)
+    else:
+        requests = [run_request(args, parser)]
+    try:
+        send_runs(args, requests)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f'no service is listening on {args.socket}, start one with python service.py')
+        exit(1)
+
+
+# the run requests of a json lines file, - for stdin
+def read_requests(path, parser):
+    import json
+
+    try:
+        f = sys.stdin if path == '-' else open(path)
+        with f:
+            lines = [line for line in f if line.strip()]
+    except OSError as e:
+        parser.error(f'cannot read {path}: {e.strerror}')
+    try:
+        return [json.loads(line) for line in lines]
+    except ValueError as e:
+        parser.error(f'{path} is not json lines: {e}')
+
+
+# the run request given by the command line arguments
+def run_request(args, parser):
+    if len(args.run) not in (3, 4):
+        parser.error('a run takes an algorithm, arrival rate, burst time and an optional quantum')
+    request = {'algorithm': int(args.run[0]), 'arrival_rate': args.run[1], 'avg_burst': args.run[2],
+               'quantum': args.run[3] if len(args.run) == 4 else 0.0, 'seed': args.seed,
+               'saturation': args.saturation}
+    if args.max_processes is not None:
+        request['max_processes'] = args.max_processes
+    if args.target is not None:
+        request['stopping'] = {'target': args.target}
+    return request
+
+
+# sends the requests (None asks for the status) and prints the replies
+def send_runs(args, requests):
+    import json
+
+    from service import request_runs, status
+
+    if requests is None:
+        print(json.dumps(status(args.socket)))
+        return
+    if args.requests is not None:
+        for reply in request_runs(requests, args.socket):
+            print(json.dumps(reply), flush=True)
+        return
+    for reply in request_runs(requests, args.socket):
+        if reply['type'] == 'error':
+            print(f"error: {reply['error']}")
+            exit(1)
+        for key, value in reply['metrics'].items():
+            print(f'{key}: {value}')
+
+
 def main():
-    if not (len(sys.argv) == 5 or (len(sys.argv) == 4 and sys.argv[1] != 3)):
+    if len(sys.argv) > 1 and sys.argv[1] == 'client':
+        client(sys.argv[2:])
+        return
+
+    from scheduling_algorithms import ALGORITHMS
+
+    if len(sys.argv) not in (4, 5) or not sys.argv[1].isdigit() or int(sys.argv[1]) not in ALGORITHMS:
         help_()
-        exit(0)
 
     algorithm = int(sys.argv[1])
+    cls = ALGORITHMS[algorithm]
+    if cls.uses_quantum and len(sys.argv) != 5:
+        help_()
     arrival_rate = int(sys.argv[2])
     avg_burst = float(sys.argv[3])
     quantum = 0
-    if sys.argv[1] == '3':
+    if len(sys.argv) == 5:
         quantum = float(sys.argv[4])
 
     print(algorithm, arrival_rate, avg_burst, quantum)
-    s = None
-    if algorithm == 1:
-        s = FCFS(arrival_rate=arrival_rate, avg_service_time=avg_burst, quantum=quantum)
-    elif algorithm == 2:
-        s = STRF(arrival_rate=arrival_rate, avg_service_time=avg_burst, quantum=quantum)
-    elif algorithm == 3:
-        s = RR(arrival_rate=arrival_rate, avg_service_time=avg_burst, quantum=quantum)
-    else:
-        help_()
+    s = cls(arrival_rate=arrival_rate, avg_service_time=avg_burst, quantum=quantum)
 
     s.run_sim()
     s.stats()
@@ -48,4 +139,3 @@ def main():
 
 if __name__ == '__main__':
     main()
-
@@ -0,0 +1,200 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+"""
+streaming metrics. everything here takes one value at a time (or a numpy block of values)
+and keeps a constant amount of state, so the scheduler does not have to hold on to finished
+processes to report on them. all of the accumulators can be merged, which is how results
+from several runs are combined.
+"""
+
+
+class RunningStats:
+    '''
+    running count, mean and variance (welford) plus min and max
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    # adds a numpy array of values at once
+    def add_many(self, values):
+        if len(values) == 0:
+            return
+        block = RunningStats()
+        block.count = len(values)
+        block.mean = float(values.mean())
+        block.m2 = float(((values - block.mean) ** 2).sum())
+        block.min = float(values.min())
+        block.max = float(values.max())
+        self.merge(block)
+
+    # combines another RunningStats into this one (chan et al.)
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+
+class QuantileSketch:
+    '''
+    streaming quantile sketch with relative error. values go into logarithmic buckets, so a
+    quantile is reported within relative_accuracy of the true value using a few hundred
+    buckets no matter how many values are added. values at or below min_value (waits of
+    zero) share one bucket and are reported as 0
+    '''
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, x):
+        self.count += 1
+        if x <= self.min_value:
+            self.zero_count += 1
+            return
+        k = math.ceil(math.log(x) / self.log_gamma)
+        self.buckets[k] = self.buckets.get(k, 0) + 1
+
+    # adds a numpy array of values at once
+    def add_many(self, values):
+        self.count += len(values)
+        positive = values[values > self.min_value]
+        self.zero_count += len(values) - len(positive)
+        if len(positive) == 0:
+            return
+        keys, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64), return_counts=True)
+        for k, c in zip(keys.tolist(), counts.tolist()):
+            self.buckets[k] = self.buckets.get(k, 0) + c
+
+    def merge(self, other):
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for k, c in other.buckets.items():
+            self.buckets[k] = self.buckets.get(k, 0) + c
+
+    # value at quantile q (0 to 1), nan if nothing was added
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for k in sorted(self.buckets):
+            seen += self.buckets[k]
+            if rank < seen:
+                return 2 * self.gamma ** k / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class MetricsAccumulator:
+    '''
+    turnaround and wait times of finished processes: running mean/variance and quantile
+    sketches for each. this is what collect_metrics reports from
+    '''
+    quantiles = (0.5, 0.95, 0.99)
+
+    def __init__(self):
+        self.turnaround = RunningStats()
+        self.wait = RunningStats()
+        self.turnaround_sketch = QuantileSketch()
+        self.wait_sketch = QuantileSketch()
+
+    def add(self, turnaround, wait):
+        self.turnaround.add(turnaround)
+        self.wait.add(wait)
+        self.turnaround_sketch.add(turnaround)
+        self.wait_sketch.add(wait)
+
+    # adds numpy arrays of turnaround and wait times
+    def add_many(self, turnarounds, waits):
+        self.turnaround.add_many(turnarounds)
+        self.wait.add_many(waits)
+        self.turnaround_sketch.add_many(turnarounds)
+        self.wait_sketch.add_many(waits)
+
+    def merge(self, other):
+        self.turnaround.merge(other.turnaround)
+        self.wait.merge(other.wait)
+        self.turnaround_sketch.merge(other.turnaround_sketch)
+        self.wait_sketch.merge(other.wait_sketch)
+
+    # spread and percentiles, keyed like the rest of the collect_metrics dict
+    def summary(self):
+        d = {"turnaround time std dev": self.turnaround.std(),
+             "wait time std dev": self.wait.std()}
+        for q in self.quantiles:
+            d[f"p{round(q * 100)} turnaround time"] = self.turnaround_sketch.quantile(q)
+        for q in self.quantiles:
+            d[f"p{round(q * 100)} wait time"] = self.wait_sketch.quantile(q)
+        return d
+
+
+# quantile of student's t distribution with df degrees of freedom. exact for 1 and 2 degrees
+# of freedom, otherwise the cornish-fisher expansion around the normal quantile which is
+# good to about 1e-3 from 3 degrees of freedom up
+def t_quantile(p, df):
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    z = NormalDist().inv_cdf(p)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+# half width of the t confidence interval for a mean of n values with standard deviation std
+def ci_half_width(std, n, level=0.95):
+    if n < 2:
+        return math.inf
+    return t_quantile(0.5 + level / 2, n - 1) * std / math.sqrt(n)
+
+
+# mean and confidence interval half width of every metric over a list of collect_metrics dicts
+# from independent replications
+def replication_summary(metric_dicts, level=0.95):
+    summary = {}
+    for key in metric_dicts[0]:
+        values = np.array([d[key] for d in metric_dicts], dtype=np.float64)
+        std = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+        summary[key] = (float(values.mean()), ci_half_width(std, len(values), level))
+    return summary
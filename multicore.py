@@ -0,0 +1,307 @@
+import heapq
+import itertools
+import random
+from collections import deque
+
+import numpy as np
+from arrivals import ArrivalStream, TickSource, seed_sequence
+from event_queue import HeapEventQueue
+from metrics import MetricsAccumulator
+from scheduling_algorithms import TICKS_PER_SECOND, Event, ProcessTable
+
+"""
+multi core scheduling. MultiCoreScheduler runs FCFS (1), STRF (2) or RR (3) on k cores that
+share one event queue. each core has its own run queue, or optionally all cores take work from
+one global queue. nothing in here looks at every core for an event:
+    idle cores are kept on a stack, an arrival goes straight to one if there is one
+    otherwise an arrival joins the shorter run queue of two cores picked at random
+    (power of two choices)
+    a core that runs out of work steals from a random core that has work waiting, the cores
+    with waiting work are kept in a list with an index so one can be picked in O(1)
+
+FCFS and STRF run every process to completion once it is on a core. RR runs a process for one
+quantum (or what is left of it) and then puts it at the back of its core's run queue, so with
+one core it is the textbook round robin, not the single cpu RR class in scheduling_algorithms.py
+which schedules its time slices a quantum apart whatever they do.
+
+with integer_clock=True times are int64 nanoseconds as in Scheduler, metrics are in seconds either way.
+"""
+
+
+class CoreEvent(Event):
+    __slots__ = ('core',)
+
+    def __init__(self, event_type, time, proc, core):
+        super().__init__(event_type, time, proc)
+        self.core = core
+
+    def __str__(self):
+        return f"type={self.event_type}, time={self.time}, process={self.process}, core={self.core}"
+
+
+class FifoRunQueue:
+    '''
+    first come first serve run queue, used by FCFS and RR. steals take the newest process
+    '''
+
+    def __init__(self, table):
+        self.items = deque()
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, i):
+        self.items.append(i)
+
+    def pop(self):
+        return self.items.popleft()
+
+    def steal(self):
+        return self.items.pop()
+
+
+class ShortestRunQueue:
+    '''
+    shortest time remaining first run queue, a heap on the time remaining. steals take the
+    shortest process as well, it is the one that would run next
+    '''
+
+    def __init__(self, table):
+        self.table = table
+        self.items = []
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, i):
+        heapq.heappush(self.items, (self.table.remaining.item(i), next(self.counter), i))
+
+    def pop(self):
+        return heapq.heappop(self.items)[2]
+
+    steal = pop
+
+
+RUN_QUEUES = {1: FifoRunQueue, 2: ShortestRunQueue, 3: FifoRunQueue}
+NAMES = {1: 'FCFS', 2: 'STRF', 3: 'RR'}
+
+
+class MultiCoreScheduler:
+    '''
+    k core scheduler.
+        algorithm: 1) FCFS 2) STRF 3) RR
+        cores: number of cores
+        global_queue: every core takes work from one shared run queue instead of its own
+        stealing: with per core queues, a core without work steals from one that has some
+        integer_clock: keep time in int64 nanoseconds, see Scheduler
+    '''
+    # tie break rank of each event type when two events have the same time
+    event_ranks = {1: 0, 2: 1, 3: 1}
+
+    def __init__(self, algorithm, arrival_rate, avg_burst_time, quantum, cores=1, global_queue=False, stealing=True,
+                 seed=None, arrivals=None, integer_clock=False):
+        self.algorithm = algorithm
+        self.inter_process_arrival_rate = 1/arrival_rate
+        self.avg_burst_time = avg_burst_time
+        self.integer_clock = integer_clock
+        self.time_scale = 1 / TICKS_PER_SECOND if integer_clock else 1.0 # seconds per unit of clock time
+        self.quantum = round(quantum * TICKS_PER_SECOND) if integer_clock else quantum # in clock units
+        self.cores = cores
+        self.global_queue = global_queue
+        self.stealing = stealing and not global_queue
+        self.max_processes = 10000 # the sim stops once this many processes are done
+
+        self.processes = ProcessTable(time_dtype=np.int64 if integer_clock else np.float64)
+        self.event_queue = HeapEventQueue()
+        self.arrivals = arrivals if arrivals is not None else ArrivalStream(arrival_rate, avg_burst_time, seed)
+        if integer_clock:
+            self.arrivals = TickSource(self.arrivals, TICKS_PER_SECOND)
+        # placement and stealing draws, kept apart from the arrival stream's generators
+        self.random = random.Random(int(seed_sequence(seed).spawn(3)[2].generate_state(1)[0]))
+        self.next_pid = 0
+        self.total_processes = None
+        self.clock = 0
+
+        run_queue = RUN_QUEUES[algorithm]
+        if global_queue:
+            shared = run_queue(self.processes)
+            self.run_queues = [shared] * cores
+        else:
+            self.run_queues = [run_queue(self.processes) for _ in range(cores)]
+        self.running = [None] * cores # row running on each core
+        self.idle = list(range(cores - 1, -1, -1)) # stack of idle cores, core 0 on top
+        self.loaded = [] # cores with processes waiting in their own run queue
+        self.loaded_at = {} # core -> position in loaded
+
+        #  metrics
+        self.metrics = MetricsAccumulator()
+        self.core_cpu_time = [0] * cores # in clock units
+        self.core_completed = [0] * cores
+        self.core_steals = [0] * cores
+        self.processes_completed = 0
+        self.event_counter = 0
+        self.time_events_handled = 0
+        self.arrival_events_handled = 0
+        self.termination_events_handled = 0
+
+        # start
+        self.add_arrival_event()
+
+
+    # takes the next arrival from the arrival source and adds it to the event queue
+    def add_arrival_event(self):
+        arrival = self.arrivals.next()
+        if arrival is None:
+            self.total_processes = self.next_pid
+            self.max_processes = min(self.max_processes, self.next_pid)
+            return
+        t, burst = arrival
+        i = self.processes.add(self.next_pid, t, burst)
+        self.next_pid += 1
+        self.event_queue.push(Event(1, t, i), self.event_ranks[1])
+
+
+    # adds process i to the run queue of core c and keeps the list of loaded cores up to date
+    def enqueue(self, c, i):
+        queue = self.run_queues[c]
+        queue.push(i)
+        if not self.global_queue and len(queue) == 1:
+            self.loaded_at[c] = len(self.loaded)
+            self.loaded.append(c)
+
+
+    # takes the next process off the run queue of core c
+    def dequeue(self, c, steal=False):
+        queue = self.run_queues[c]
+        i = queue.steal() if steal else queue.pop()
+        if not self.global_queue and not len(queue):
+            # swap c with the last loaded core and drop it
+            k = self.loaded_at.pop(c)
+            last = self.loaded.pop()
+            if last != c:
+                self.loaded[k] = last
+                self.loaded_at[last] = k
+        return i
+
+
+    # starts process i on core c: to completion for FCFS and STRF, for one quantum for RR
+    def dispatch(self, c, i):
+        self.running[c] = i
+        self.time_events_handled += 1
+        t = self.processes.remaining.item(i)
+        if self.algorithm == 3 and t > self.quantum:
+            event = CoreEvent(2, self.clock + self.quantum, i, c)
+        else:
+            event = CoreEvent(3, self.clock + t, i, c)
+        self.event_queue.push(event, self.event_ranks[event.event_type])
+
+
+    # core c is free: it runs the next process of its queue, steals one or goes idle
+    def next_on_core(self, c):
+        if len(self.run_queues[c]):
+            self.dispatch(c, self.dequeue(c))
+        elif self.stealing and self.loaded:
+            victim = self.loaded[self.random.randrange(len(self.loaded))]
+            self.core_steals[c] += 1
+            self.dispatch(c, self.dequeue(victim, steal=True))
+        else:
+            self.running[c] = None
+            self.idle.append(c)
+
+
+    def handle_arrival_event(self, event):
+        self.arrival_events_handled += 1
+        self.add_arrival_event()
+        i = event.process
+        if self.idle:
+            self.dispatch(self.idle.pop(), i)
+        elif self.global_queue:
+            self.enqueue(0, i)
+        else:
+            # the shorter queue of two random cores
+            a = self.random.randrange(self.cores)
+            b = self.random.randrange(self.cores)
+            self.enqueue(a if len(self.run_queues[a]) <= len(self.run_queues[b]) else b, i)
+
+
+    # end of an RR time slice, the process goes to the back of its core's queue
+    def handle_time_event(self, event):
+        c = event.core
+        i = event.process
+        self.core_cpu_time[c] += self.quantum
+        self.processes.remaining[i] = self.processes.remaining.item(i) - self.quantum
+        self.enqueue(c, i)
+        self.next_on_core(c)
+
+
+    def handle_termination_event(self, event):
+        c = event.core
+        i = event.process
+        table = self.processes
+        self.termination_events_handled += 1
+        self.core_cpu_time[c] += table.remaining.item(i)
+        table.remaining[i] = 0
+        turnaround = self.clock - table.arrival.item(i)
+        self.metrics.add(turnaround * self.time_scale, (turnaround - table.burst.item(i)) * self.time_scale)
+        self.core_completed[c] += 1
+        self.processes_completed += 1
+        table.release(i)
+        self.next_on_core(c)
+
+
+    # runs events until max_processes processes are done
+    def run_sim(self):
+        event_menu = {
+            1: self.handle_arrival_event,
+            2: self.handle_time_event,
+            3: self.handle_termination_event
+        }
+
+        try:
+            while True:
+                event = self.event_queue.pop()
+                self.clock = event.time
+                event_menu[event.event_type](event)
+
+                self.event_counter += 1
+                if self.processes_completed == self.max_processes:
+                    break
+        except IndexError:
+            # the event queue ran dry, fine once every process of a finished trace is done
+            if self.processes_completed != self.total_processes:
+                raise
+
+
+    def collect_metrics(self):
+        """
+        the single cpu metrics plus the cpu time, utilisation, throughput and steals of each core
+        :return: dict
+        """
+        avg_wait_time = self.metrics.wait.mean
+        seconds = self.clock * self.time_scale
+        d = {"average turnaround time": self.metrics.turnaround.mean,
+             "throughput": self.processes_completed / seconds,
+             "average wait time": avg_wait_time,
+             "average time events in queue": avg_wait_time / self.inter_process_arrival_rate
+             }
+        d.update(self.metrics.summary())
+        d["utilization"] = sum(self.core_cpu_time) / (self.clock * self.cores)
+        d["per core utilization"] = [t / self.clock for t in self.core_cpu_time]
+        d["per core throughput"] = [n / seconds for n in self.core_completed]
+        d["per core steals"] = list(self.core_steals)
+        return d
+
+
+    def stats(self):
+        print('------------------------------------')
+        print(f'{NAMES[self.algorithm]} on {self.cores} cores, '
+              f'{"global queue" if self.global_queue else "per core queues"}'
+              f'{", work stealing" if self.stealing else ""}')
+        print(f'clock={self.clock}')
+        print(f'events_completed={self.event_counter}')
+        print(f'processes_completed={self.processes_completed}')
+        for c in range(self.cores):
+            print(f'core {c}: cpu_time={self.core_cpu_time[c] * self.time_scale:.3f} completed={self.core_completed[c]} '
+                  f'queued={len(self.run_queues[c])} steals={self.core_steals[c]}')
+        print('------------------------------------\n')
@@ -0,0 +1,219 @@
+import heapq
+import itertools
+import math
+from collections import deque
+
+import numpy as np
+from arrivals import seed_sequence
+
+"""
+scheduling policies for PolicyScheduler (see scheduling_algorithms.py). the scheduler owns the
+event queue, the clock and the cpu, a policy owns the ready queue and makes the decisions:
+    arrive(i) / arrive_many(rows): a new process (a row of the process table) is ready
+    pick_next(): takes the process that runs next off the ready queue
+    quantum(i): how long process i may run before it goes back to the ready queue, in the
+                scheduler's clock units (see integer_clock), math.inf runs it to completion
+    preempt(running, i): whether the newly arrived process i takes the cpu from running.
+                         only asked when the policy is preemptive
+    requeue(i, used, expired): process i left the cpu after used clock units with work left, its
+                               quantum expired or it was preempted. it goes back in the ready queue
+every operation is O(log n) or better in the number of waiting processes, a policy reads what it
+needs about a process from the scheduler's process table and keeps its own state per row.
+
+a new policy is a subclass of Policy, run it with PolicyScheduler(rate, burst, quantum, policy=MyPolicy()).
+"""
+
+
+class Policy:
+    '''
+    base class of the scheduling policies, first come first serve without preemption
+        preemptive: arrivals are offered the cpu through preempt
+        uses_quantum: the quantum argument changes the schedule
+    '''
+    preemptive = False
+    uses_quantum = False
+
+    def __init__(self, quantum=None, seed=None):
+        self.sim = None
+        self.table = None
+        self.ready = deque()
+
+    # called once by the scheduler before anything is queued
+    def bind(self, sim):
+        self.sim = sim
+        self.table = sim.processes
+
+    def __len__(self):
+        return len(self.ready)
+
+    def arrive(self, i):
+        self.ready.append(i)
+
+    # a block of arrivals (an array of rows) in arrival order
+    def arrive_many(self, rows):
+        for i in rows.tolist():
+            self.arrive(i)
+
+    def pick_next(self):
+        return self.ready.popleft()
+
+    def quantum(self, i):
+        return math.inf
+
+    def preempt(self, running, i):
+        return False
+
+    def requeue(self, i, used, expired):
+        self.ready.append(i)
+
+
+class FirstComeFirstServed(Policy):
+    '''
+    first come first serve, the same schedule as the FCFS class
+    '''
+
+    def arrive_many(self, rows):
+        self.ready.extend(rows.tolist())
+
+
+class ShortestJobFirst(Policy):
+    '''
+    non preemptive shortest job first. a heap on the burst time, equal bursts first come first
+    serve. processes run to completion so this is the same schedule as the STRF class
+    '''
+
+    def __init__(self, quantum=None, seed=None):
+        super().__init__()
+        self.ready = []
+        self.counter = itertools.count()
+
+    def arrive(self, i):
+        heapq.heappush(self.ready, (self.table.burst.item(i), next(self.counter), i))
+
+    # a small block is pushed one by one, a big one is merged into the heap in one heapify
+    def arrive_many(self, rows):
+        entries = zip(self.table.burst[rows].tolist(), self.counter, rows.tolist())
+        if len(rows) * 8 < len(self.ready):
+            for entry in entries:
+                heapq.heappush(self.ready, entry)
+        else:
+            self.ready.extend(entries)
+            heapq.heapify(self.ready)
+
+    def pick_next(self):
+        return heapq.heappop(self.ready)[2]
+
+    def requeue(self, i, used, expired):
+        self.arrive(i)
+
+
+class PriorityAging(Policy):
+    '''
+    priority scheduling with aging. every process gets a priority from 0 (highest) to levels - 1
+    when it arrives, drawn uniformly from the seed, and gains aging priority levels per second
+    it waits, so nothing starves. the effective priority at time t of a process that entered the
+    ready queue at time e is
+        priority - aging * (t - e) = (priority + aging * e) - aging * t
+    and aging * t is the same for every waiting process, so the order never changes while they
+    wait: the ready queue is a heap on priority + aging * e and aging costs nothing per event.
+        preemptive: an arrival with a higher priority than the running process takes the cpu.
+                    the running process competes with its own priority, waiting again restarts
+                    its aging
+    '''
+
+    def __init__(self, quantum=None, seed=None, levels=4, aging=5.0, preemptive=True, block_size=4096):
+        super().__init__()
+        self.levels = levels
+        self.aging = aging
+        self.preemptive = preemptive
+        self.ready = []
+        self.counter = itertools.count()
+        self.priority = {} # row -> priority of the process in it
+        self.rng = np.random.default_rng(seed_sequence(seed).spawn(3)[2])
+        self.block_size = block_size
+        self.draws = []
+        self.aging_per_tick = aging
+
+    # aging is per second, the clock may run in other units
+    def bind(self, sim):
+        super().bind(sim)
+        self.aging_per_tick = self.aging * sim.time_scale
+
+    # next priority, drawn a block at a time
+    def draw(self):
+        if not self.draws:
+            self.draws = self.rng.integers(0, self.levels, self.block_size).tolist()
+            self.draws.reverse()
+        return self.draws.pop()
+
+    # process i enters the ready queue at time t
+    def enqueue(self, i, t):
+        heapq.heappush(self.ready, (self.priority[i] + self.aging_per_tick * t, next(self.counter), i))
+
+    # a new process ages from its arrival time, arrivals taken in bulk are queued before the clock gets there
+    def arrive(self, i):
+        self.priority[i] = self.draw()
+        self.enqueue(i, self.table.arrival.item(i))
+
+    def pick_next(self):
+        return heapq.heappop(self.ready)[2]
+
+    def preempt(self, running, i):
+        return self.priority[i] < self.priority[running]
+
+    def requeue(self, i, used, expired):
+        self.enqueue(i, self.sim.clock)
+
+
+class MultilevelFeedback(Policy):
+    '''
+    multilevel feedback queue. levels first come first serve queues, a new process starts on
+    level 0 and every quantum it uses up in full moves it one level down. level k gets a quantum
+    of quantum * 2**k, the last level keeps that quantum and runs round robin. the next process
+    comes from the highest level that has any, found from a bit mask of the non empty levels in
+    O(1). an arrival preempts a process running below level 0, a preempted process keeps its
+    level. with levels=1 this is plain round robin.
+    quantum is in the scheduler's clock units, nanoseconds for a scheduler with integer_clock
+    '''
+    preemptive = True
+    uses_quantum = True
+
+    def __init__(self, quantum=0.04, seed=None, levels=3):
+        super().__init__()
+        self.base_quantum = quantum
+        self.queues = [deque() for _ in range(levels)]
+        self.nonempty = 0 # bit k is set when level k has processes
+        self.level = {} # row -> level of the process in it
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def enqueue(self, i, level):
+        self.queues[level].append(i)
+        self.nonempty |= 1 << level
+        self.count += 1
+
+    def arrive(self, i):
+        self.level[i] = 0
+        self.enqueue(i, 0)
+
+    def pick_next(self):
+        level = (self.nonempty & -self.nonempty).bit_length() - 1
+        queue = self.queues[level]
+        i = queue.popleft()
+        if not queue:
+            self.nonempty &= ~(1 << level)
+        self.count -= 1
+        return i
+
+    def quantum(self, i):
+        return self.base_quantum * 2 ** self.level[i]
+
+    def preempt(self, running, i):
+        return self.level[running] > 0
+
+    def requeue(self, i, used, expired):
+        if expired:
+            self.level[i] = min(self.level[i] + 1, len(self.queues) - 1)
+        self.enqueue(i, self.level[i])
@@ -0,0 +1,181 @@
+import argparse
+import math
+
+import numpy as np
+from metrics import ci_half_width
+from results_store import ResultsStore
+from sweep import SweepTask, run_sweep, task_seed
+
+"""
+quantum search for RR. finds the quantum with the lowest mean turnaround (or wait) time for an
+arrival rate and burst in two steps, both in log quantum:
+    successive halving over a coarse set of candidates. every candidate starts with a couple
+    of replications, each round the better half survives and gets twice the replications, so
+    the budget goes to the candidates that are still in the running
+    golden section search between the neighbours of the best candidate at full replications,
+    which narrows the quantum down as finely as a much denser grid would
+replication k of every quantum runs on the same seed (common random numbers), so quanta are
+compared on the same workloads and most of the noise cancels out of the comparison.
+replications that were already run are reused from round to round, and from earlier searches
+as well when a results store is given. runs go out in parallel over the sweep worker pool.
+
+    python quantum_search.py --rate 10 --burst 0.06 --store results
+"""
+
+
+RR = 3
+
+
+# objective of one run, saturated runs never win
+def objective(result, metric):
+    if result['metrics'].get('saturated'):
+        return math.inf
+    return result['metrics'][metric]
+
+
+class QuantumSearch:
+    '''
+    state of one search: the seeds shared by every quantum and the runs done so far
+    '''
+
+    def __init__(self, arrival_rate, avg_burst, metric, max_replications, seed, workers=None, store=None):
+        self.arrival_rate = arrival_rate
+        self.avg_burst = avg_burst
+        self.metric = metric
+        self.workers = workers
+        self.store = store
+        self.seeds = [task_seed(seed, RR, arrival_rate, avg_burst, 0, k) for k in range(max_replications)]
+        self.results = {} # (quantum, replication) -> result
+        self.runs = 0
+        self.events = 0
+
+    def evaluate(self, quanta, replications):
+        """
+        runs whatever replications of quanta are missing, all in one parallel batch
+        :return: list of (quantum, mean, ci half width, replications), best first
+        """
+        quanta = [round(q, 6) for q in quanta]
+        tasks = [SweepTask(RR, self.arrival_rate, self.avg_burst, q, k, self.seeds[k])
+                 for q in quanta for k in range(replications) if (q, k) not in self.results]
+        for result in run_sweep(tasks, workers=self.workers, store=self.store):
+            task = result['task']
+            self.results[(task.quantum, task.replication)] = result
+            if not result.get('cached'):
+                self.runs += 1
+                self.events += result['events']
+
+        scores = []
+        for q in quanta:
+            values = np.array([objective(self.results[(q, k)], self.metric) for k in range(replications)])
+            std = float(values.std(ddof=1)) if replications > 1 and np.isfinite(values).all() else 0.0
+            scores.append((q, float(values.mean()), ci_half_width(std, replications), replications))
+        return sorted(scores, key=lambda s: s[1])
+
+
+def search_quantum(arrival_rate, avg_burst, q_min=0.005, q_max=0.2, candidates=8, metric="average turnaround time",
+                   min_replications=2, max_replications=8, refine=6, seed=None, workers=None, store=None,
+                   on_round=None):
+    """
+    successive halving over candidates log spaced quanta between q_min and q_max, then refine
+    steps of golden section search around the best one
+    :param metric: collect_metrics key to minimise
+    :param store: ResultsStore, runs in it are not simulated again and new ones are added
+    :param on_round: called with the list of (quantum, mean, half width, replications) after every round
+    :return: dict with the best quantum, its mean and ci half width, the rounds, the number of runs and
+             events simulated and what a log spaced grid just as fine at max_replications would cost
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    search = QuantumSearch(arrival_rate, avg_burst, metric, max_replications, seed, workers, store)
+    quanta = np.geomspace(q_min, q_max, candidates).tolist()
+    rounds = []
+
+    def record(scores):
+        rounds.append(scores)
+        if on_round is not None:
+            on_round(scores)
+        return scores
+
+    alive = quanta
+    replications = min(min_replications, max_replications)
+    while True:
+        scores = record(search.evaluate(alive, replications))
+        if len(alive) <= 2 and replications >= max_replications or len(alive) == 1:
+            break
+        # the better half goes on to the next round with twice the replications
+        alive = [s[0] for s in scores[:max(len(scores) // 2, 1)]]
+        replications = min(replications * 2, max_replications)
+
+    # golden section in log quantum between the grid neighbours of the best candidate
+    k = min(range(len(quanta)), key=lambda j: abs(quanta[j] - scores[0][0]))
+    lo = math.log(quanta[max(k - 1, 0)])
+    hi = math.log(quanta[min(k + 1, len(quanta) - 1)])
+    ratio = (math.sqrt(5) - 1) / 2
+    c = hi - ratio * (hi - lo)
+    d = lo + ratio * (hi - lo)
+    fc = fd = None
+    for _ in range(refine):
+        if fc is None:
+            fc = record(search.evaluate([math.exp(c)], max_replications))[0][1]
+        if fd is None:
+            fd = record(search.evaluate([math.exp(d)], max_replications))[0][1]
+        if fc < fd:
+            hi, d, fd = d, c, fc
+            c, fc = hi - ratio * (hi - lo), None
+        else:
+            lo, c, fc = c, d, fd
+            d, fd = lo + ratio * (hi - lo), None
+
+    finalists = {s[0] for s in scores} | {round(math.exp(x), 6) for x in (c, d)}
+    finalists = [q for q in finalists if all((q, j) in search.results for j in range(max_replications))]
+    best = search.evaluate(finalists, max_replications)[0]
+
+    # a log spaced grid with steps as fine as the final bracket
+    step = max(hi - lo, 1e-12)
+    dense_points = math.ceil(math.log(q_max / q_min) / step) + 1
+    per_run = search.events / search.runs if search.runs else 0
+    return {'quantum': best[0],
+            'mean': best[1],
+            'half_width': best[2],
+            'replications': best[3],
+            'rounds': rounds,
+            'runs': search.runs,
+            'events': search.events,
+            'dense_runs': dense_points * max_replications,
+            'dense_events': per_run * dense_points * max_replications}
+
+
+def print_round(scores):
+    print(f'{len(scores)} candidates, {scores[0][3]} replications each')
+    for q, mean, half_width, _ in scores:
+        print(f'    quantum {q:<10g} {mean:12.6g} +- {half_width:.3g}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='search the RR quantum with the lowest mean turnaround or wait time')
+    parser.add_argument('--rate', type=float, required=True, help='arrival rate')
+    parser.add_argument('--burst', type=float, default=0.06, help='average burst time')
+    parser.add_argument('--q-min', type=float, default=0.005)
+    parser.add_argument('--q-max', type=float, default=0.2)
+    parser.add_argument('--candidates', type=int, default=8, help='log spaced quanta to start from')
+    parser.add_argument('--refine', type=int, default=6, help='golden section steps after the candidates')
+    parser.add_argument('--metric', choices=['turnaround', 'wait'], default='turnaround')
+    parser.add_argument('--max-replications', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=None, help='random if omitted')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the cpu count')
+    parser.add_argument('--store', default=None, help='results store directory, stored runs are not simulated again')
+    args = parser.parse_args(argv)
+
+    store = ResultsStore(args.store) if args.store is not None else None
+    best = search_quantum(args.rate, args.burst, args.q_min, args.q_max, args.candidates,
+                          f'average {args.metric} time', max_replications=args.max_replications, refine=args.refine,
+                          seed=args.seed,
+                          workers=args.workers, store=store, on_round=print_round)
+    print(f"best quantum {best['quantum']:g}: {best['mean']:.6g} +- {best['half_width']:.3g} "
+          f"over {best['replications']} replications")
+    print(f"simulated {best['runs']} runs ({best['events']} events), "
+          f"a dense grid would be {best['dense_runs']} runs (~{best['dense_events']:.0f} events)")
+
+
+if __name__ == '__main__':
+    main()
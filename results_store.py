@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+"""
+binary results store. every run is one row with a fixed schema: the run configuration
+(algorithm, arrival rate, burst, quantum, seed), the version of the simulator code that
+produced it and its metrics. each column is a raw little endian numpy file in the store
+directory, appends write a whole batch of rows to every column at once and reads map a column
+straight from disk, so a column can be pulled out without parsing anything else.
+
+the store also works as a run cache: a run whose configuration, seed and code version are
+already stored does not have to be simulated again, see lookup.
+"""
+
+
+# source files whose contents decide the results of a run
+SIMULATOR_SOURCES = ('scheduling_algorithms.py', 'policies.py', 'arrivals.py', 'event_queue.py', 'metrics.py',
+                     'saturation.py')
+
+# metric columns, in the order of the collect_metrics dict
+METRICS = ("average turnaround time", "throughput", "average wait time", "average time events in queue",
+           "turnaround time std dev", "wait time std dev",
+           "p50 turnaround time", "p95 turnaround time", "p99 turnaround time",
+           "p50 wait time", "p95 wait time", "p99 wait time")
+
+SCHEMA = [('algorithm', '<i1'),
+          ('arrival_rate', '<f8'),
+          ('avg_burst', '<f8'),
+          ('quantum', '<f8'),
+          ('replication', '<i4'),
+          ('seed', '<u8'),
+          ('code_version', 'S16'),
+          ('events', '<i8'),
+          ('wall_time', '<f8'),
+          ('saturated', '<i1'),
+          ('backlog growth rate', '<f8')] + [(name, '<f8') for name in METRICS]
+
+# columns that identify a run in the cache
+KEY_COLUMNS = ('algorithm', 'arrival_rate', 'avg_burst', 'quantum', 'seed', 'code_version')
+
+
+# short hash of the simulator sources, changes whenever the code that produces results does
+def code_version():
+    h = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in SIMULATOR_SOURCES:
+        with open(os.path.join(here, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+# file name of a column, metric names have spaces in them
+def column_file(name):
+    return name.replace(' ', '_') + '.bin'
+
+
+class ResultsStore:
+    '''
+    a directory of column files plus meta.json with the schema and the row count. the row
+    count is only updated after every column of a batch has been written, so a batch that was
+    cut off halfway is ignored by readers and overwritten by the next append
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.schema = dict(SCHEMA)
+        self.version = code_version()
+        self.index = None # cache key -> row, built on the first lookup
+        os.makedirs(path, exist_ok=True)
+        meta_file = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            if meta['schema'] != [list(c) for c in SCHEMA]:
+                raise ValueError(f'{path} was written with a different schema')
+            self.rows = meta['rows']
+        else:
+            self.rows = 0
+            self.write_meta()
+
+    def __len__(self):
+        return self.rows
+
+    def write_meta(self):
+        meta_file = os.path.join(self.path, 'meta.json')
+        with open(meta_file + '.tmp', 'w') as f:
+            json.dump({'schema': SCHEMA, 'rows': self.rows}, f)
+        os.replace(meta_file + '.tmp', meta_file)
+
+    # the stored values of one column, memory mapped read only
+    def column(self, name):
+        dtype = np.dtype(self.schema[name])
+        if self.rows == 0:
+            return np.empty(0, dtype)
+        return np.memmap(os.path.join(self.path, column_file(name)), dtype=dtype, mode='r', shape=(self.rows,))
+
+    # dict of columns, all of them if names is None
+    def read(self, names=None):
+        return {name: self.column(name) for name in (names or self.schema)}
+
+    # appends a batch of rows given as a dict of equal length sequences, one per column
+    def append_columns(self, columns):
+        n = len(columns['algorithm'])
+        if n == 0:
+            return
+        for name, dtype in SCHEMA:
+            values = np.asarray(columns[name], dtype=dtype)
+            if len(values) != n:
+                raise ValueError(f'column {name} has {len(values)} values, expected {n}')
+            with open(os.path.join(self.path, column_file(name)), 'r+b' if self.rows else 'wb') as f:
+                f.seek(self.rows * values.itemsize)
+                f.write(values.tobytes())
+                f.truncate()
+        self.rows += n
+        self.write_meta()
+        self.index = None
+
+    def append(self, results):
+        """
+        appends sweep results (dicts from sweep.run_task) in one batch, tagged with the current
+        code version
+        """
+        columns = {name: [] for name in self.schema}
+        for result in results:
+            task = result['task']
+            columns['algorithm'].append(task.algorithm)
+            columns['arrival_rate'].append(task.arrival_rate)
+            columns['avg_burst'].append(task.avg_burst)
+            columns['quantum'].append(task.quantum)
+            columns['replication'].append(task.replication)
+            columns['seed'].append(task.seed)
+            columns['code_version'].append(self.version)
+            columns['events'].append(result['events'])
+            columns['wall_time'].append(result['wall_time'])
+            # runs without a saturation detector are not known to be saturated
+            columns['saturated'].append(result['metrics'].get('saturated', False))
+            columns['backlog growth rate'].append(result['metrics'].get('backlog growth rate', np.nan))
+            for name in METRICS:
+                columns[name].append(result['metrics'][name])
+        self.append_columns(columns)
+
+    def build_index(self):
+        keys = zip(*(self.column(name).tolist() for name in KEY_COLUMNS))
+        self.index = {key: row for row, key in enumerate(keys)}
+
+    def lookup(self, task):
+        """
+        :return: the row of a stored run of task made with the current code version, None if there is none
+        """
+        if self.index is None:
+            self.build_index()
+        key = (task.algorithm, float(task.arrival_rate), float(task.avg_burst), float(task.quantum),
+               task.seed, self.version.encode())
+        return self.index.get(key)
+
+    # a stored row as a result dict, the same shape as sweep.run_task returns
+    def result(self, row, task):
+        metrics = {name: self.column(name).item(row) for name in METRICS}
+        metrics['saturated'] = bool(self.column('saturated').item(row))
+        metrics['backlog growth rate'] = self.column('backlog growth rate').item(row)
+        return {'task': task,
+                'metrics': metrics,
+                'events': self.column('events').item(row),
+                'wall_time': self.column('wall_time').item(row),
+                'cached': True}
+
+    # boolean row mask of the rows whose columns equal the given values
+    def select(self, **values):
+        mask = np.ones(self.rows, dtype=bool)
+        for name, value in values.items():
+            if name == 'code_version' and isinstance(value, str):
+                value = value.encode()
+            mask &= self.column(name) == value
+        return mask
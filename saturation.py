@@ -0,0 +1,134 @@
+import math
+
+import numpy as np
+
+"""
+saturation detection. above an arrival rate of 1 / burst the queue is unstable: the backlog
+grows without bound, every event gets slower and the metrics never settle, so running such a
+configuration to max_processes only burns time. a scheduler built with
+saturation=SaturationDetector() samples its backlog (processes waiting for the cpu) and
+utilisation every few thousand events and stops the run as soon as the backlog is clearly
+growing, either with the cpu busy all of the time or steadily over the whole window.
+the run is then marked saturated and reports the growth rate next to its partial metrics.
+"""
+
+
+# least squares slope of y over x and its standard error
+def slope(x, y):
+    x = x - x.mean()
+    sxx = float((x * x).sum())
+    if sxx == 0:
+        return 0.0, math.inf
+    b = float((x * (y - y.mean())).sum()) / sxx
+    residuals = y - y.mean() - b * x
+    if len(x) < 3:
+        return b, math.inf
+    return b, math.sqrt(float((residuals * residuals).sum()) / (len(x) - 2) / sxx)
+
+
+class SaturationDetector:
+    '''
+    online check for an unstable queue.
+        check_events: events between samples
+        window: least number of samples to decide on. decisions use the most recent half of the
+                samples once there are more than twice this many
+        utilization: cpu_time / clock over the window at or above which the cpu counts as pinned
+        t_value: how many standard errors the backlog slope has to be above zero
+        min_growth: processes the backlog has to grow by over the window
+    '''
+
+    def __init__(self, check_events=1000, window=10, utilization=0.98, t_value=5.0, min_growth=100):
+        self.check_events = check_events
+        self.window = window
+        self.utilization = utilization
+        self.t_value = t_value
+        self.min_growth = min_growth
+
+        self.clock = []
+        self.backlog = []
+        self.cpu_time = []
+        self.saturated = False
+        self.growth_rate = math.nan # backlog growth in processes per second over the window
+        self.window_utilization = math.nan
+        self.detected_at = math.nan # clock when saturation was detected
+        self.held = (np.empty(0), np.empty(0, dtype=np.int64), np.empty(0)) # samples of sample_block still to count
+
+    # clock and cpu time are kept in seconds whatever the scheduler's clock unit
+    def sample(self, sim):
+        self.clock.append(sim.clock * sim.time_scale)
+        self.backlog.append(sim.time_events_ready)
+        self.cpu_time.append(sim.cpu_time * sim.time_scale)
+        return self.assess()
+
+    # decides on the last window of samples, returns True when the queue is saturated
+    def assess(self):
+        if len(self.clock) < self.window:
+            return False
+        n = max(self.window, len(self.clock) // 2)
+        clock = np.array(self.clock[-n:], dtype=np.float64)
+        backlog = np.array(self.backlog[-n:], dtype=np.float64)
+        cpu_time = np.array(self.cpu_time[-n:], dtype=np.float64)
+        span = clock[-1] - clock[0]
+        if span <= 0:
+            return False
+
+        b, se = slope(clock, backlog)
+        self.growth_rate = b
+        self.window_utilization = (cpu_time[-1] - cpu_time[0]) / span
+        growing = b > self.t_value * se and backlog[-1] - backlog[0] >= self.min_growth
+        # steady growth: the mean backlog goes up from each quarter of the window to the next
+        quarters = [q.mean() for q in np.array_split(backlog, 4)]
+        steady = all(a < b for a, b in zip(quarters, quarters[1:]))
+        if growing and (self.window_utilization >= self.utilization or steady):
+            self.saturated = True
+            self.detected_at = float(clock[-1])
+        return self.saturated
+
+    def watch(self, sim, loop):
+        """
+        wraps an event loop so it stops every check_events events to take a sample
+        :return: loop(processes, events) that returns early once the run is saturated
+        """
+        def watched(processes, events=math.inf):
+            while not self.saturated:
+                end = min(sim.event_counter + self.check_events, events)
+                loop(processes, end)
+                if sim.processes_completed in (processes, sim.total_processes) or sim.event_counter >= events:
+                    return
+                if self.sample(sim):
+                    sim.aborted = 'saturated'
+        return watched
+
+    # samples a run that is computed a block of processes at a time (the FCFS closed form) from
+    # its arrays, taking a sample every check_events / 3 processes as the event engine roughly
+    # would. first is the index of the block's first process, cpu_time the cpu time used before
+    # the block and time_scale the seconds per unit of the arrays' times. a sample counts the
+    # arrivals up to its clock, so it is held back until an arrival past that clock has been seen.
+    # every sample is assessed as it is taken, like watch does.
+    # returns the number of processes done at the sample that found the run saturated, None if none did
+    def sample_block(self, first, arrival, burst, completion, cpu_time, time_scale=1.0):
+        step = max(self.check_events // 3, 1)
+        ends = np.arange((step - 1 - first) % step, len(completion), step)
+        held_clock, held_done, held_cpu = self.held
+        held_clock = np.concatenate((held_clock, completion[ends]))
+        held_done = np.concatenate((held_done, first + ends + 1))
+        held_cpu = np.concatenate((held_cpu, cpu_time + np.cumsum(burst)[ends]))
+        # past the last arrival seen the backlog would look like it is shrinking
+        seen = held_clock <= arrival[-1]
+        clock = held_clock[seen]
+        backlog = first + np.searchsorted(arrival, clock, side='right') - held_done[seen]
+        self.held = (held_clock[~seen], held_done[~seen], held_cpu[~seen])
+        for t, waiting, cpu, done in zip((clock * time_scale).tolist(), backlog.tolist(),
+                                         (held_cpu[seen] * time_scale).tolist(), held_done[seen].tolist()):
+            self.clock.append(t)
+            self.backlog.append(waiting)
+            self.cpu_time.append(cpu)
+            if self.assess():
+                return done
+        return None
+
+    def summary(self):
+        return {"saturated": self.saturated,
+                "backlog growth rate": self.growth_rate,
+                "utilization": self.window_utilization,
+                "saturation detected at": self.detected_at}
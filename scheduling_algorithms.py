@@ -1,16 +1,41 @@
+import heapq
+import itertools
+import math
+from collections import deque
+
 import numpy as np
+from arrivals import ArrivalStream, TickSource
+from event_queue import HeapEventQueue
+from metrics import MetricsAccumulator
+from policies import FirstComeFirstServed, MultilevelFeedback, PriorityAging, ShortestJobFirst
 
 """
 event types are as follows:
 1) arrival process
 2) time slice
 3) process termination
-
-event queue is a linked list of events and the processes are handled as a member of an event.
+4) end of a time slice that left the process unfinished (PolicyScheduler only)
+
+events live in a pluggable event queue (a binary heap by default, see event_queue.py).
+arrivals come lazily from an arrival source (see arrivals.py), only the next one is queued.
+process data is kept column wise in a process table and events refer to a process by its
+row index in the table. processes that are waiting for the cpu are kept in a ready queue
+owned by each algorithm rather than in the event queue.
+
+time is a float number of seconds by default. with integer_clock=True a scheduler keeps time
+as an integer number of nanoseconds instead: arrival and burst times are rounded to the
+nanosecond once when they come in, the clock, event times, the quantum and the process table
+columns are int64 and all time arithmetic is exact, so ties between events are exact too and
+round robin slices do not drift. metrics are still reported in seconds.
 """
 
 
+TICKS_PER_SECOND = 10**9 # clock ticks per second with integer_clock
+
+
 class Process:
+    __slots__ = ('pid', 'time', 'burst_time', 'time_remaining', 'termination_time')
+
     def __init__(self, pid, arrival_time, burst):
         self.pid = pid
         self.time = arrival_time
@@ -24,62 +49,194 @@ class Process:
 
 
 class Event:
+    __slots__ = ('event_type', 'time', 'process')
+
     def __init__(self, event_type, time, proc):
         self.event_type=event_type
         self.time=time
-        self.process=proc
-        self.next=None
+        self.process=proc # row index of the process in the process table
 
     def __str__(self):
-        return f"type={self.event_type}, time={self.time}, next_exists?={self.next is not None} process={self.process}"
+        return f"type={self.event_type}, time={self.time}, process={self.process}"
+
+
+
+class ProcessTable:
+    '''
+    struct of arrays storage for processes. every process is a row index into numpy columns
+    so a process costs 40 bytes instead of a full python object.
+    termination is nan (-1 with integer times) until the process is done. rows that are released
+    get reused by the next process so the table only grows with the number of processes in the system
+        time_dtype: dtype of the time columns, float64 seconds or int64 clock ticks
+    '''
 
+    def __init__(self, capacity=1024, time_dtype=np.float64):
+        self.size = 0
+        self.free = [] # released rows
+        self.time_dtype = np.dtype(time_dtype)
+        self.unfinished = np.nan if self.time_dtype.kind == 'f' else -1 # termination of a running process
+        self.pid = np.empty(capacity, dtype=np.int64)
+        self.arrival = np.empty(capacity, dtype=self.time_dtype)
+        self.burst = np.empty(capacity, dtype=self.time_dtype)
+        self.remaining = np.empty(capacity, dtype=self.time_dtype)
+        self.termination = np.empty(capacity, dtype=self.time_dtype)
+
+    # number of rows in use
+    def __len__(self):
+        return self.size - len(self.free)
+
+    # makes sure there is room for n more rows, columns double in size when they run out
+    def reserve(self, n):
+        needed = self.size + n
+        capacity = len(self.pid)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ('pid', 'arrival', 'burst', 'remaining', 'termination'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    # adds one process, returns its index
+    def add(self, pid, arrival_time, burst_time):
+        if self.free:
+            i = self.free.pop()
+        else:
+            i = self.size
+            if i == len(self.pid):
+                self.reserve(1)
+            self.size = i + 1
+        self.pid[i] = pid
+        self.arrival[i] = arrival_time
+        self.burst[i] = burst_time
+        self.remaining[i] = burst_time
+        self.termination[i] = self.unfinished
+        return i
+
+    # gives row i back so a later process can use it
+    def release(self, i):
+        self.free.append(i)
+
+    # adds a block of processes at the end of the table, returns the index of the first one
+    def add_many(self, first_pid, arrival_times, burst_times):
+        n = len(arrival_times)
+        self.reserve(n)
+        start = self.size
+        end = start + n
+        self.pid[start:end] = np.arange(first_pid, first_pid + n)
+        self.arrival[start:end] = arrival_times
+        self.burst[start:end] = burst_times
+        self.remaining[start:end] = burst_times
+        self.termination[start:end] = self.unfinished
+        self.size = end
+        return start
+
+    # adds a block of processes, reusing released rows first. returns the array of their rows
+    def add_block(self, first_pid, arrival_times, burst_times):
+        n = len(arrival_times)
+        reused = min(n, len(self.free))
+        rows = np.empty(n, dtype=np.int64)
+        if reused:
+            rows[:reused] = self.free[-reused:][::-1]
+            del self.free[-reused:]
+        if reused < n:
+            self.reserve(n - reused)
+            rows[reused:] = np.arange(self.size, self.size + n - reused)
+            self.size += n - reused
+        self.pid[rows] = np.arange(first_pid, first_pid + n)
+        self.arrival[rows] = arrival_times
+        self.burst[rows] = burst_times
+        self.remaining[rows] = burst_times
+        self.termination[rows] = self.unfinished
+        return rows
+
+    # mask of the rows that have terminated
+    def completed(self):
+        if self.time_dtype.kind == 'f':
+            return ~np.isnan(self.termination[:self.size])
+        return self.termination[:self.size] != self.unfinished
+
+    # builds a Process object for row i, used for printing and debugging
+    def process(self, i):
+        p = Process(self.pid.item(i), self.arrival.item(i), self.burst.item(i))
+        p.time_remaining = self.remaining.item(i)
+        term = self.termination.item(i)
+        p.termination_time = 0 if term != term or term == self.unfinished else term
+        return p
+
+
+
+# one line of the data file: algorithm, arrival rate, burst, quantum, the metrics, then 1 if the run
+# was stopped early as saturated (0 otherwise) and its backlog growth rate. runs without a
+# saturation detector are not known to be saturated and have a nan growth rate
+def metrics_line(algorithm, arrival_rate, avg_burst_time, quantum, metrics):
+    saturated = int(bool(metrics.get('saturated', False)))
+    growth_rate = metrics.get('backlog growth rate', math.nan)
+    return f"{algorithm},{arrival_rate},{avg_burst_time},{quantum},{metrics['average turnaround time']},{metrics['throughput']},{metrics['average wait time']},{metrics['average time events in queue']},{saturated},{growth_rate}\n"
 
 
 class Scheduler:
-    def __init__(self, arrival_rate, avg_burst_time, quantum):
+    # tie break rank of each event type when two events have the same time
+    event_ranks = {1: 0, 2: 1, 3: 1}
+    uses_quantum = False # whether the quantum argument changes the schedule
+
+    def __init__(self, arrival_rate, avg_burst_time, quantum, event_queue=None, seed=None, arrivals=None,
+                 keep_records=False, hooks=None, stopping=None, saturation=None, integer_clock=False):
         self.inter_process_arrival_rate = 1/arrival_rate
         self.avg_burst_time = avg_burst_time
-        self.quantum = quantum
+        self.integer_clock = integer_clock
+        self.time_scale = 1 / TICKS_PER_SECOND if integer_clock else 1.0 # seconds per unit of clock time
+        self.quantum = round(quantum * TICKS_PER_SECOND) if integer_clock else quantum # in clock units
         self.algorithm = 0
-
-        self.new_processes = []
-        self.processes = []
-        self.done_processes = []
-        self.head_event_queue = None
-        self.tail_event_queue = None
+        self.max_processes = 10000 # the sim stops once this many processes are done
+
+        self.processes = ProcessTable(time_dtype=np.int64 if integer_clock else np.float64)
+        self.keep_records = keep_records # keep the table rows of finished processes
+        self.hooks = hooks # optional SimHooks instrumentation, see hooks.py
+        self.stopping = stopping # optional SequentialStopping rule, see stopping.py. replaces max_processes
+        self.saturation = saturation # optional SaturationDetector, see saturation.py
+        self.aborted = None # why the run stopped early, if it did
+        self.recent_done = deque(maxlen=20) # pids of the last few finished processes for stats()
+        self.event_queue = event_queue if event_queue is not None else HeapEventQueue()
+        self.ready_queue = deque() # processes waiting for the cpu
+        self.arrivals = arrivals if arrivals is not None else ArrivalStream(arrival_rate, avg_burst_time, seed)
+        if integer_clock:
+            self.arrivals = TickSource(self.arrivals, TICKS_PER_SECOND)
+        self.next_pid = 0
+        self.total_processes = None # number of processes the arrival source had, once it runs out
         self.current_event = None
         self.clock = 0
 
         #  metrics
+        self.metrics = MetricsAccumulator()
         self.cpu_time = 0
         self.processes_completed = 0
         self.event_counter = 0
-        self.time_events_ready = 0 # number of time slice events in the event queue
+        self.time_events_ready = 0 # number of processes waiting in the ready queue
         self.termination_event_ready = False # can only be one termination events in the queue currently
         self.term_event = None # the termination event object in the queue if it exists
-        self.last_time_event = None # last time event object for faster indexing
 
         self.time_events_handled = 0
         self.arrival_events_handled = 0
         self.termination_events_handled = 0
 
         # start
-        self.add_arrival_events(12000)
+        self.add_arrival_event()
         # self.test_queue()
 
 
     def test_queue(self):
-        i = 0
-        tmp= self.head_event_queue
-        while True:
-            if tmp is None:
-                break
-            else:
-                if i < 500:
-                    print(tmp)
-                tmp = tmp.next
-                i += 1
-        print(f'{i} events in LL')
+        events = self.sorted_events()
+        for e in events[:500]:
+            print(e)
+        print(f'{len(events)} events in queue')
+
+
+    # returns the queued events in the order they will be popped
+    def sorted_events(self):
+        return [entry[3] for entry in sorted(self.event_queue)]
 
 
     def collect_metrics(self):
@@ -87,20 +244,14 @@ class Scheduler:
         collects average turnaround time,
         total throughput processes completed per second,
         average wait time,
-        average number of processes in queue
-        :return: dict {avg_turnaround_time, throughput, avg_wait_time, avg_n_processes_queued}
+        average number of processes in queue,
+        then the spread and p50/p95/p99 of turnaround and wait time.
+        everything comes from the streaming accumulators so this does not depend on run length
+        :return: dict {avg_turnaround_time, throughput, avg_wait_time, avg_n_processes_queued, ...}
         """
-        waiting_times = []
-        turnaround_times = []
-
-        for p in self.done_processes:
-            t = p.termination_time - p.time
-            turnaround_times.append(t)
-            waiting_times.append(t-p.burst_time)
-
-        avg_turnaround_time = sum(turnaround_times)/len(turnaround_times)
-        avg_wait_time = sum(waiting_times)/len(waiting_times)
-        throughput = self.processes_completed / self.clock
+        avg_turnaround_time = self.metrics.turnaround.mean
+        avg_wait_time = self.metrics.wait.mean
+        throughput = self.processes_completed / (self.clock * self.time_scale)
         avg_queue_len = avg_wait_time / self.inter_process_arrival_rate
 
         d = {"average turnaround time": avg_turnaround_time,
@@ -108,80 +259,70 @@ class Scheduler:
              "average wait time": avg_wait_time,
              "average time events in queue": avg_queue_len
              }
+        d.update(self.metrics.summary())
+        if self.stopping is not None:
+            d.update(self.stopping.summary())
+        if self.saturation is not None:
+            d.update(self.saturation.summary())
         return d
 
 
     # writes the metrics as a line in the given data file
     def write_metrics(self, data_file: str):
         metrics = self.collect_metrics()
-        line = f"{self.algorithm},{1/self.inter_process_arrival_rate},{self.avg_burst_time},{self.quantum},{metrics['average turnaround time']},{metrics['throughput']},{metrics['average wait time']},{metrics['average time events in queue']}\n"
+        quantum = self.quantum * self.time_scale
+        line = metrics_line(self.algorithm, 1/self.inter_process_arrival_rate, self.avg_burst_time, quantum, metrics)
         with open(data_file, 'a') as f:
             f.write(line)
 
 
-    # function for generating arrival events to the queue
-    def add_arrival_events(self, n_events):
-        bursts_times = np.random.exponential(self.avg_burst_time, n_events)
-        inter_arrival_times = np.random.poisson(self.inter_process_arrival_rate * 1000, n_events) / 1000
+    # takes the next arrival from the arrival source and adds it to the event queue.
+    # a trace source can run out, then no more processes than have arrived can finish
+    def add_arrival_event(self):
+        arrival = self.arrivals.next()
+        if arrival is None:
+            self.total_processes = self.next_pid
+            self.max_processes = min(self.max_processes, self.next_pid)
+            return
+        t, burst = arrival
+        i = self.processes.add(self.next_pid, t, burst)
+        self.next_pid += 1
+        self.push_event(Event(1, t, i))
 
-        t = self.clock
-        if self.tail_event_queue is not None:
-            t = self.tail_event_queue.time
 
-        arrival_times = []
-        for i in range(len(inter_arrival_times)):
-            t += inter_arrival_times[i]
-            arrival_times.append(t)
+    # adds an event to the event queue, ties on time are broken by the event type rank
+    def push_event(self, event):
+        self.event_queue.push(event, self.event_ranks[event.event_type])
 
-        next_pid = 0
-        if self.tail_event_queue is not None:
-            next_pid = self.tail_event_queue.process.pid + 1
 
-        start = 0
-        e = 0
-        if self.tail_event_queue is not None:
-            e = self.tail_event_queue
-        else:
-            p = Process(pid=next_pid, arrival_time=arrival_times[0], burst=bursts_times[0])
-            self.head_event_queue = Event(1, arrival_times[0], p)
-            e = self.head_event_queue
-            start = 1
+    # adds a process to the ready queue. it gets a time event as soon as the cpu is free
+    def add_time_event(self, i):
+        self.time_events_ready += 1
+        self.ready_queue.append(i)
 
-        for i in range(start, n_events):
-            p = Process(pid=next_pid+i, arrival_time=arrival_times[i], burst=bursts_times[i])
-            e.next = Event(event_type=1, time=arrival_times[i], proc=p)
-            e = e.next
-        self.tail_event_queue = e
 
+    # adds a block of arrived processes (an array of rows) to the ready queue
+    def add_time_events(self, rows):
+        self.time_events_ready += len(rows)
+        self.ready_queue.extend(rows.tolist())
 
-    # adds a time event to the queue. dynamically finds the right time for it
-    def add_time_event(self, proc):
-        self.time_events_ready += 1
-        if self.last_time_event is not None:
-            event = Event(2, self.last_time_event.time, proc)
-            event.next = self.last_time_event.next
-            self.last_time_event.next = event
-            self.last_time_event = event
-
-        elif self.termination_event_ready:
-            event = Event(2, self.term_event.time, proc)
-            event.next = self.term_event.next
-            self.term_event.next = event
-            self.last_time_event = event
 
-        else:
-            event = Event(2, self.clock, proc)
-            event.next = self.head_event_queue
-            self.head_event_queue = event
-            self.last_time_event = event
+    # time up to which arrivals can be taken in bulk: while a process runs to completion nothing
+    # but arrivals happens until its termination. None when the cpu is free, the next waiting
+    # process is dispatched right away
+    def arrival_horizon(self):
+        if self.termination_event_ready:
+            return self.term_event.time
+        return None
+
 
-        if self.term_event is not None and self.term_event.time < self.head_event_queue.time:
-            print('there was a problem caught in add time event')
-            exit(0)
+    # takes the next process to run off the ready queue
+    def next_ready(self):
+        return self.ready_queue.popleft()
 
 
     # adds termination event to the event queue. much of the is error checking
-    def add_termination_event(self, time, proc):
+    def add_termination_event(self, time, i):
         if time < self.clock:
             print("time problem in add term event")
             exit(1)
@@ -193,135 +334,177 @@ class Scheduler:
             exit(1)
 
         # declare the event
-        event = Event(3, time, proc)
+        event = Event(3, time, i)
         self.term_event = event
         self.termination_event_ready = True
+        self.push_event(event)
 
-        #  if there are no time events in the queue
-        if self.last_time_event is None:
-            if self.head_event_queue.time > time: # first check if it belongs in the front
-                event.next = self.head_event_queue
-                self.head_event_queue = event
-                return
-
-            else: # otherwise add it to the ll normally
-                tmp = self.head_event_queue
-                while True:
-                    if tmp is self.tail_event_queue:
-                        # add arrival events if none are left
-                        self.add_arrival_events(1000)
-
-                    if tmp.next.time > time:
-                        event.next = tmp.next
-                        tmp.next = event
-                        return
-                    else:
-                        tmp = tmp.next
-
-        else:   # there is a time event in the queue
-            # first adjust the time of all time events as no time event should come before the term event
-            tmp = self.head_event_queue
-            while True:
-                if tmp.event_type == 2:
-                    tmp.time = time
-                    tmp = tmp.next
-                else:
-                    break
-
-            if self.last_time_event.next is not tmp: # bug check
-                print('this is an issue in add term event')
-                exit(1)
-
-            # after the term event, the rest of the time events will follow
-            event.next = self.head_event_queue
-            self.head_event_queue = self.last_time_event.next
-
-            # check if the term event belongs at the front
-            if time < self.head_event_queue.time:
-                self.last_time_event.next = self.head_event_queue
-                self.head_event_queue = event
-                return
 
-            else:   #otherwise add to ll normally
-                tmp = self.last_time_event
-                while True:
-                    if tmp is self.tail_event_queue:
-                        self.add_arrival_events(1000)
-
-                    if tmp.next.time > time:
-                        self.last_time_event.next = tmp.next
-                        tmp.next = event
-                        break
-                    else:
-                        tmp = tmp.next
-
-
-    # handles arrival events
-    def handle_arrival_event(self, proc):
+    # handles arrival events. every further arrival up to the next cpu event is handled here as
+    # well, in one block straight from the arrival source, and counted as an event of its own
+    def handle_arrival_event(self, i):
         self.arrival_events_handled += 1
-        self.add_time_event(proc)
+        self.add_time_event(i)
+
+        horizon = self.arrival_horizon()
+        if horizon is not None:
+            t = self.arrivals.next_time()
+            if t is not None and t <= horizon:
+                self.absorb_arrivals(horizon)
+        self.add_arrival_event()
+
+
+    # takes every arrival up to and including time horizon from the arrival source and adds
+    # them to the ready queue. the first few are added one at a time, numpy only pays off for
+    # a long run of arrivals, which then goes in as one block
+    def absorb_arrivals(self, horizon):
+        arrivals = self.arrivals
+        n = 0
+        t = arrivals.next_time()
+        while t is not None and t <= horizon:
+            if n == 16:
+                times, bursts = arrivals.take_until(horizon)
+                rows = self.processes.add_block(self.next_pid, times, bursts)
+                self.next_pid += len(rows)
+                self.add_time_events(rows)
+                n += len(rows)
+                t = times.item(-1)
+                break
+            t, burst = arrivals.next()
+            i = self.processes.add(self.next_pid, t, burst)
+            self.next_pid += 1
+            self.add_time_event(i)
+            n += 1
+            t = arrivals.next_time()
+        self.arrival_events_handled += n
+        self.event_counter += n
+        self.clock = self.processes.arrival.item(i) if n < 16 else t
 
 
     # handles time slice events
-    def handle_time_event(self, proc):
+    def handle_time_event(self, i):
         self.time_events_handled += 1
         self.time_events_ready-=1
 
-        if self.last_time_event.process is proc:
-            self.last_time_event = None
-
-        self.cpu_time += proc.burst_time
-        t = proc.time_remaining
-        proc.time_remaining = 0
-        self.add_termination_event(self.clock+t, proc)
+        t = self.processes.remaining.item(i)
+        self.cpu_time += t
+        self.processes.remaining[i] = 0
+        self.add_termination_event(self.clock+t, i)
 
 
     # terminates a done process
-    def handle_termination_event(self, proc):
+    def handle_termination_event(self, i):
         self.termination_events_handled += 1
         self.termination_event_ready = False
-        proc.termination_time = self.clock
-        self.done_processes.append(proc)
-        self.processes_completed += 1
+        self.finish_process(i)
         self.term_event = None
 
 
+    # records a finished process in the metrics (in seconds) and frees its row unless records are kept
+    def finish_process(self, i):
+        table = self.processes
+        turnaround = self.clock - table.arrival.item(i)
+        wait = (turnaround - table.burst.item(i)) * self.time_scale
+        turnaround *= self.time_scale
+        self.metrics.add(turnaround, wait)
+        if self.stopping is not None:
+            self.stopping.add(turnaround, wait)
+        self.recent_done.append(table.pid.item(i))
+        self.processes_completed += 1
+        if self.keep_records:
+            table.termination[i] = self.clock
+        else:
+            table.release(i)
+
+
     # helper function for debugging
     def show_events(self, n):
         print()
-        tmp = self.head_event_queue
-        for _ in range(n):
-            print(tmp)
-            tmp = tmp.next
+        for e in self.sorted_events()[:n]:
+            print(e)
         print()
 
 
-    # takes the first event off the ll and returns it
+    # takes the next event off the queue and returns it.
+    # when the cpu is free a waiting process is run right away with a time event at the current time
     def pop_event(self):
-        tmp = self.head_event_queue
-        self.head_event_queue = self.head_event_queue.next
-        return tmp
+        if not self.termination_event_ready and self.time_events_ready:
+            return Event(2, self.clock, self.next_ready())
+        return self.event_queue.pop()
 
 
     # this is the main function of the sim.
-    # runs events until 10,000 processes are done
+    # runs events until max_processes (10,000) processes are done, or until the stopping rule
+    # says the metrics are precise enough. a saturation detector can end the run early
     def run_sim(self):
-        event_menu = {
+        loop = self.event_loop if self.hooks is None else self.event_loop_hooked
+        if self.saturation is not None:
+            loop = self.saturation.watch(self, loop)
+        if self.hooks is not None:
+            self.hooks.attach(self)
+        try:
+            if self.stopping is None:
+                loop(self.max_processes)
+            else:
+                self.stopping.run(self, loop)
+        finally:
+            if self.hooks is not None:
+                self.hooks.detach(self)
+
+
+    # handler of each event type
+    def event_handlers(self):
+        return {
             1: self.handle_arrival_event,
             2: self.handle_time_event,
             3: self.handle_termination_event
         }
 
-        while True:
-            self.current_event = self.pop_event()
-            self.clock = self.current_event.time
 
-            func = event_menu[self.current_event.event_type]
-            func(self.current_event.process)
+    # runs events until the given number of processes are done or the event counter reaches events
+    def event_loop(self, processes, events=math.inf):
+        event_menu = self.event_handlers()
 
-            self.event_counter += 1
-            if self.processes_completed == 10000:
-                break
+        try:
+            while True:
+                self.current_event = self.pop_event()
+                self.clock = self.current_event.time
+
+                func = event_menu[self.current_event.event_type]
+                func(self.current_event.process)
+
+                self.event_counter += 1
+                if self.processes_completed == processes or self.event_counter >= events:
+                    break
+        except IndexError:
+            # the event queue ran dry, fine once every process of a finished trace is done
+            if self.processes_completed != self.total_processes:
+                raise
+
+
+    # same loop as event_loop with on_pop called for every event.
+    # kept separate so event_loop does not pay for any hook checks
+    def event_loop_hooked(self, processes, events=math.inf):
+        event_menu = self.event_handlers()
+        on_pop = self.hooks.on_pop
+
+        try:
+            while True:
+                self.current_event = self.pop_event()
+                self.clock = self.current_event.time
+                if on_pop is not None:
+                    on_pop(self, self.current_event)
+
+                func = event_menu[self.current_event.event_type]
+                func(self.current_event.process)
+
+                self.event_counter += 1
+                if self.processes_completed == processes or self.event_counter >= events:
+                    break
+        except IndexError:
+            # the event queue ran dry, fine once every process of a finished trace is done
+            if self.processes_completed != self.total_processes:
+                raise
 
 
     # outputs final data
@@ -332,14 +515,13 @@ class Scheduler:
             f'time_events_ready={self.time_events_ready}\n' \
             f'termination_event_ready={self.termination_event_ready}\n' \
             f'term_event={self.term_event}\n' \
-            f'last_time_event={self.last_time_event}\n' \
             f'events_completed={self.event_counter}\n' \
             f'arrival_events_called={self.arrival_events_handled}\n' \
             f'time_slice_events={self.time_events_handled}\n' \
             f'termination_events_called={self.termination_events_handled}\n' \
             f'processes_completed={self.processes_completed}'
         print(s)
-        done_ids = [p.pid for p in self.done_processes[len(self.done_processes)-20:]]
+        done_ids = list(self.recent_done)
         print("done_recent: ", done_ids)
         print('------------------------------------\n')
         # --------------------------------------------------------
@@ -349,11 +531,128 @@ class FCFS(Scheduler):
     '''
     first come first serve. this is the most basic scheduling algorithm
     once a process is created, it is added to the queue without any preemption.
-    Scheduler is already FCFS so this is just a shell class that inherits from Scheduler
+    Scheduler is already FCFS so the event engine is inherited as is. with fast=True (the default)
+    run_sim skips the event loop and computes the whole run at once from the arrival and burst
+    arrays, the event engine is still there with fast=False or when hooks or a stopping rule are set
     '''
-    def __init__(self, arrival_rate, avg_service_time, quantum):
-        super().__init__(arrival_rate, avg_service_time, quantum)
+    def __init__(self, arrival_rate, avg_service_time, quantum, fast=True, **kwargs):
+        super().__init__(arrival_rate, avg_service_time, quantum, **kwargs)
         self.algorithm = 1
+        self.fast = fast
+        self.fast_block = 1 << 16 # processes per block of run_fast
+
+
+    def run_sim(self):
+        # hooks instrument events and stopping rules run in stages, both need the event engine
+        if self.fast and self.hooks is None and self.stopping is None and self.event_counter == 0:
+            self.run_fast()
+        else:
+            super().run_sim()
+
+
+    # single server first come first serve is the lindley recursion
+    #   completion[n] = max(completion[n-1], arrival[n]) + burst[n]
+    # which unrolls to completion[n] = S[n] + max over k <= n of (arrival[k] - S[k-1]) with S the
+    # running sum of bursts, so it is a cumsum and a running max over numpy arrays. it runs a block
+    # of fast_block processes at a time, the last completion carries over into the running max of
+    # the next block, so a long run or a trace is never held whole.
+    # a saturation detector stops the run at the sample that finds it saturated, as in the event
+    # engine. a sample can only be counted once later arrivals are known, so processes are only
+    # added to the metrics up to the first sample still held back, the others wait in pending.
+    # the counters, queues and metrics end up the same as the event engine stopping there
+    def run_fast(self):
+        table = self.processes
+        saturation = self.saturation
+
+        # the first arrival is already in the event queue, the rest come from the same stream.
+        # a trace can have fewer than max_processes
+        first = self.event_queue.pop()
+        times, bursts = self.arrivals.take(min(self.fast_block, self.max_processes) - 1)
+        arrival = np.concatenate((table.arrival[first.process:first.process + 1], times))
+        burst = np.concatenate((table.burst[first.process:first.process + 1], bursts))
+        table.release(first.process)
+
+        n = 0 # processes computed
+        done = 0 # processes added to the metrics
+        clock = self.clock # last completion computed
+        pending = deque() # computed blocks from done on: (first index, arrival, burst, completion, cpu time after each)
+        stop = None
+        while True:
+            work_done = np.cumsum(burst)
+            work_before = np.concatenate(([0], work_done[:-1]))
+            start = np.maximum.accumulate(arrival - work_before)
+            if n:
+                np.maximum(start, clock, out=start)
+            completion = work_done + start
+            cpu_time = pending[-1][4].item(-1) if pending else self.cpu_time
+            pending.append((n, arrival, burst, completion, work_done + cpu_time))
+            if saturation is not None:
+                stop = saturation.sample_block(n, arrival, burst, completion, cpu_time, self.time_scale)
+            clock = completion.item(-1)
+            n += len(arrival)
+
+            if stop is not None:
+                settled = stop
+            elif saturation is not None and len(saturation.held[1]):
+                settled = saturation.held[1].item(0)
+            else:
+                settled = n
+            done = self.finish_fast(pending, done, settled)
+            if stop is not None or n == self.max_processes:
+                break
+            arrival, burst = self.arrivals.take(min(self.fast_block, self.max_processes - n))
+            if not len(arrival):
+                break
+
+        if stop is not None:
+            self.aborted = 'saturated'
+            # the processes computed past the stop have not run, their arrivals go back to the source
+            if pending:
+                offset = done - pending[0][0]
+                self.arrivals.unread(np.concatenate([block[1] for block in pending])[offset:],
+                                     np.concatenate([block[2] for block in pending])[offset:])
+        else:
+            done = self.finish_fast(pending, done, n)
+        n = done
+
+        self.processes_completed = n
+        self.recent_done.extend(range(max(n - 20, 0), n))
+
+        # arrivals that came in while the last processes were running wait in the ready queue and
+        # the next one is in the event queue, where the event engine leaves them
+        self.next_pid = n
+        late_times, late_bursts = self.arrivals.take_until(self.clock)
+        if len(late_times):
+            rows = table.add_block(n, late_times, late_bursts)
+            self.next_pid += len(rows)
+            self.add_time_events(rows)
+        self.add_arrival_event()
+        self.arrival_events_handled = n + len(late_times)
+        self.time_events_handled = n
+        self.termination_events_handled = n
+        self.event_counter = self.arrival_events_handled + 2 * n
+
+
+    # adds the pending processes of run_fast up to (not including) index end to the metrics and
+    # moves the clock and cpu time to the last of them. returns end
+    def finish_fast(self, pending, done, end):
+        table = self.processes
+        while done < end:
+            first, arrival, burst, completion, cpu_time = pending[0]
+            lo = done - first
+            hi = min(end - first, len(arrival))
+            turnaround = completion[lo:hi] - arrival[lo:hi]
+            self.metrics.add_many(turnaround * self.time_scale, (turnaround - burst[lo:hi]) * self.time_scale)
+            if self.keep_records:
+                first_row = table.add_many(done, arrival[lo:hi], burst[lo:hi])
+                table.remaining[first_row:first_row + hi - lo] = 0
+                table.termination[first_row:first_row + hi - lo] = completion[lo:hi]
+            self.clock = completion.item(hi - 1)
+            self.cpu_time = cpu_time.item(hi - 1)
+            done = first + hi
+            if hi == len(arrival):
+                pending.popleft()
+        return done
 
 # --------------------------------------------------------
 
@@ -364,54 +663,34 @@ class STRF(Scheduler):
     once a process is created, it is added to the queue in order of how much time it will take.
     '''
 
-    def __init__(self, arrival_rate, avg_service_time, quantum):
-        super().__init__(arrival_rate, avg_service_time, quantum)
+    def __init__(self, arrival_rate, avg_service_time, quantum, **kwargs):
+        self.ready_counter = itertools.count()
+        super().__init__(arrival_rate, avg_service_time, quantum, **kwargs)
         self.algorithm = 2
+        self.ready_queue = [] # heap on time remaining, equal times stay first come first serve
 
 
-    def add_time_event(self, proc):
+    def add_time_event(self, i):
         self.time_events_ready += 1
-        if self.termination_event_ready:
-            event = Event(2, self.term_event.time, proc)
-            tmp_event = self.term_event
-            while True:
-                if tmp_event.next.event_type != 2 or tmp_event.next.process.burst_time > proc.burst_time:
-                    event.next = tmp_event.next
-                    tmp_event.next = event
-                    if tmp_event is self.last_time_event or self.time_events_ready-1 == 0:
-                        self.last_time_event = event
-                    break
-                else:
-                    tmp_event = tmp_event.next
-
+        heapq.heappush(self.ready_queue, (self.processes.remaining.item(i), next(self.ready_counter), i))
+
+
+    # a small block is pushed one by one, a big one is merged into the heap in one heapify
+    def add_time_events(self, rows):
+        n = len(rows)
+        self.time_events_ready += n
+        keys = self.processes.remaining[rows].tolist()
+        entries = zip(keys, self.ready_counter, rows.tolist())
+        if n * 8 < len(self.ready_queue):
+            for entry in entries:
+                heapq.heappush(self.ready_queue, entry)
         else:
-            # first make sure the time event does not belong as the head
-            if self.head_event_queue.event_type != 2 or (self.head_event_queue.event_type == 2 and self.head_event_queue.process.burst_time > proc.burst_time):
-                event = Event(2, self.clock, proc)
-                if self.head_event_queue.event_type !=  2:
-                    self.last_time_event = event
+            self.ready_queue.extend(entries)
+            heapq.heapify(self.ready_queue)
 
-                event.next = self.head_event_queue
-                self.head_event_queue = event
 
-            else:
-                tmp_event = self.head_event_queue
-                while True:
-                    if tmp_event is self.last_time_event:
-                        event = Event(event_type=2, time=tmp_event.time, proc=proc)
-                        event.next = self.last_time_event.next
-                        self.last_time_event.next = event
-                        self.last_time_event = event
-                        break
-
-                    elif tmp_event.next.process.burst_time > proc.burst_time:
-                        event = Event(2, tmp_event.time, proc)
-                        event.next = tmp_event.next
-                        tmp_event.next = event
-                        break
-
-                    else:
-                        tmp_event = tmp_event.next
+    def next_ready(self):
+        return heapq.heappop(self.ready_queue)[2]
 
 # --------------------------------------------------------
 
@@ -419,108 +698,239 @@ class STRF(Scheduler):
 class RR(Scheduler):
     '''
     Round robbin. This algorithm will only work on a process for a specific amount of time
-    then schedules another time event for that process at the end of the queue until it is done
+    then schedules another time event for that process at the end of the queue until it is done.
+    the ready queue holds the scheduled time events in order, only the first one is in the event queue
     '''
+    uses_quantum = True
 
-    def __init__(self, arrival_rate, avg_service_time, quantum):
-        super().__init__(arrival_rate, avg_service_time, quantum)
+    def __init__(self, arrival_rate, avg_service_time, quantum, **kwargs):
+        super().__init__(arrival_rate, avg_service_time, quantum, **kwargs)
         self.algorithm = 3
 
 
-    def add_basic_event(self, event:Event, start_on_last=False):
-        if start_on_last:
-            # first check that there are no bugs:
-            if self.last_time_event.time > event.time:
-                print('error in add basic event')
-                exit(1)
-
-            # next check if it should be put as next
-            if self.last_time_event.next.time > event.time:
-                event.next = self.last_time_event.next
-                self.last_time_event.next = event
-                return
+    # the time event goes one quantum after the last one in the ready queue
+    def add_time_event(self, i):
+        self.time_events_ready += 1
 
-            else:
-                tmp = self.last_time_event
-                while True:
-                    if tmp is self.tail_event_queue:
-                        self.add_arrival_events(1000)
-
-                    if tmp.next.time > event.time:
-                        event.next = tmp.next
-                        tmp.next = event
-                        return
-                    else:
-                        tmp = tmp.next
-
-        # end if start on last
-        else:   # starting from beginning
-            # first check if it belongs as the head
-            if self.head_event_queue.time > event.time:
-                event.next = self.head_event_queue
-                self.head_event_queue = event
-                return
+        if self.ready_queue:
+            event = Event(2, self.ready_queue[-1][3].time+self.quantum, i)
+        else:
+            event = Event(2, self.clock+self.quantum, i)
+        entry = self.event_queue.entry(event, self.event_ranks[2])
+        self.ready_queue.append(entry)
+        if len(self.ready_queue) == 1:
+            self.event_queue.push_entry(entry)
 
-            else:
-                tmp = self.head_event_queue
-                while True:
-                    if tmp is self.tail_event_queue:
-                        self.add_arrival_events(1000)
 
-                    if tmp.next.time > event.time:
-                        event.next = tmp.next
-                        tmp.next = event
-                        return
-                    else:
-                        tmp = tmp.next
+    # each arrival gets its time slice after the ones already queued
+    def add_time_events(self, rows):
+        for i in rows.tolist():
+            self.add_time_event(i)
 
 
-    def add_time_event(self, proc):
-        self.time_events_ready += 1
+    # arrivals can be taken in bulk up to the next queued event. their time slices all go
+    # after the first one in the ready queue, which is in the event queue already
+    def arrival_horizon(self):
+        return self.event_queue.peek()[0]
 
-        if self.last_time_event is not None and proc is not self.last_time_event.process:
-            event = Event(2, self.last_time_event.time+self.quantum, proc)
-            tt =  self.last_time_event.time+self.quantum
-            self.add_basic_event(event, start_on_last=True)
-            self.last_time_event = event
 
-        else:
-            event = Event(2, self.clock+self.quantum, proc)
-            tt = self.clock+self.quantum
-            self.add_basic_event(event)
-            self.last_time_event = event
+    # time events come off the event queue, the next one in the ready queue takes its place
+    def pop_event(self):
+        tmp = self.event_queue.pop()
+        if tmp.event_type == 2:
+            self.ready_queue.popleft()
+            if self.ready_queue:
+                self.event_queue.push_entry(self.ready_queue[0])
+        return tmp
 
 
-    def add_termination_event(self, time, proc):
-        if proc.time > time:
+    def add_termination_event(self, time, i):
+        if self.processes.arrival.item(i) > time:
             print('process cannot terminate before its arrival')
-            print(proc)
+            print(self.processes.process(i))
             print(time)
             print()
             self.stats()
-            for x in self.done_processes:
-                print(x)
             exit(1)
 
-        event = Event(3, time, proc)
-        self.add_basic_event(event)
+        event = Event(3, time, i)
+        self.push_event(event)
 
 
-    def handle_time_event(self, proc):
+    def handle_time_event(self, i):
         self.time_events_handled += 1
         self.time_events_ready-=1
 
-        if proc.time_remaining > self.quantum:
+        t = self.processes.remaining.item(i)
+        if t > self.quantum:
             self.cpu_time += self.quantum
-            proc.time_remaining -= self.quantum
-            self.add_time_event(proc)
+            self.processes.remaining[i] = t - self.quantum
+            self.add_time_event(i)
+        else:
+            self.cpu_time += t
+            self.processes.remaining[i] = 0
+            self.add_termination_event(self.clock+t, i)
+
+# --------------------------------------------------------
+
+
+class PolicyScheduler(Scheduler):
+    '''
+    scheduler driven by a Policy (see policies.py). the engine keeps the event queue and the cpu,
+    the policy keeps the ready queue and decides what runs next, for how long and whether an
+    arrival takes the cpu from the running process.
+    a process runs for the policy's quantum or until it is done. a slice that ends with work left
+    is a slice end event (4) and the process goes back to the policy. when an arrival preempts the
+    running process its pending event stays in the event queue and is dropped when it comes up,
+    so preempting is O(1) as well
+        policy: Policy instance, defaults to policy_class(quantum, seed)
+    '''
+    policy_class = FirstComeFirstServed
+    uses_quantum = FirstComeFirstServed.uses_quantum
+    event_ranks = {1: 0, 2: 1, 3: 1, 4: 1}
+
+    def __init__(self, arrival_rate, avg_service_time, quantum, policy=None, **kwargs):
+        super().__init__(arrival_rate, avg_service_time, quantum, **kwargs)
+        self.policy = policy if policy is not None else self.policy_class(self.quantum, kwargs.get('seed'))
+        self.policy.bind(self)
+        self.slice_start = 0 # time the running process got the cpu
+        self.slice_ends_handled = 0
+        self.preemptions = 0
+
+
+    def event_handlers(self):
+        handlers = super().event_handlers()
+        handlers[4] = self.handle_slice_end_event
+        return handlers
+
+
+    def add_time_event(self, i):
+        self.time_events_ready += 1
+        self.policy.arrive(i)
+
+
+    def add_time_events(self, rows):
+        self.time_events_ready += len(rows)
+        self.policy.arrive_many(rows)
+
+
+    def next_ready(self):
+        return self.policy.pick_next()
+
+
+    # arrivals can only be taken in bulk when none of them can preempt the running process
+    def arrival_horizon(self):
+        if self.policy.preemptive:
+            return None
+        return super().arrival_horizon()
+
+
+    # the events of preempted slices are skipped, only the running process has a live cpu event
+    def pop_event(self):
+        while True:
+            if not self.termination_event_ready and self.time_events_ready:
+                return Event(2, self.clock, self.next_ready())
+            event = self.event_queue.pop()
+            if event.event_type == 1 or event is self.term_event:
+                return event
+
+
+    def handle_arrival_event(self, i):
+        super().handle_arrival_event(i)
+        if self.policy.preemptive and self.termination_event_ready and self.policy.preempt(self.term_event.process, i):
+            self.preemptions += 1
+            self.end_slice(self.term_event.process, False)
+
+
+    # runs a process for its quantum, to termination if that is enough to finish it
+    def handle_time_event(self, i):
+        self.time_events_handled += 1
+        self.time_events_ready -= 1
+
+        t = self.processes.remaining.item(i)
+        q = self.policy.quantum(i)
+        self.slice_start = self.clock
+        if t <= q:
+            self.cpu_time += t
+            self.add_termination_event(self.clock+t, i)
         else:
-            self.cpu_time += proc.time_remaining
-            t =  proc.time_remaining
-            proc.time_remaining = 0
+            self.cpu_time += q
+            event = Event(4, self.clock+q, i)
+            self.term_event = event
+            self.termination_event_ready = True
+            self.push_event(event)
+
+
+    def handle_slice_end_event(self, i):
+        self.slice_ends_handled += 1
+        self.end_slice(i, True)
+
+
+    # the running process i leaves the cpu unfinished, its quantum expired or it was preempted.
+    # cpu time was counted for the whole slice when it started, the part it did not use comes off
+    def end_slice(self, i, expired):
+        used = self.clock - self.slice_start
+        self.cpu_time -= self.term_event.time - self.clock
+        self.processes.remaining[i] = self.processes.remaining.item(i) - used
+        self.termination_event_ready = False
+        self.term_event = None
+        self.time_events_ready += 1
+        self.policy.requeue(i, used, expired)
+
+
+    def handle_termination_event(self, i):
+        self.processes.remaining[i] = 0
+        super().handle_termination_event(i)
+
+
+    def stats(self):
+        print(f'policy={type(self.policy).__name__} waiting={len(self.policy)} '
+              f'slice_ends={self.slice_ends_handled} preemptions={self.preemptions}')
+        super().stats()
+
+
+class MLFQ(PolicyScheduler):
+    '''
+    multilevel feedback queue, see MultilevelFeedback
+    '''
+    policy_class = MultilevelFeedback
+    uses_quantum = MultilevelFeedback.uses_quantum
+
+    def __init__(self, arrival_rate, avg_service_time, quantum, **kwargs):
+        super().__init__(arrival_rate, avg_service_time, quantum, **kwargs)
+        self.algorithm = 4
+
+
+class Priority(PolicyScheduler):
+    '''
+    preemptive priority scheduling with aging, see PriorityAging
+    '''
+    policy_class = PriorityAging
+    uses_quantum = PriorityAging.uses_quantum
+
+    def __init__(self, arrival_rate, avg_service_time, quantum, **kwargs):
+        super().__init__(arrival_rate, avg_service_time, quantum, **kwargs)
+        self.algorithm = 5
+
+
+class SJF(PolicyScheduler):
+    '''
+    non preemptive shortest job first, see ShortestJobFirst
+    '''
+    policy_class = ShortestJobFirst
+    uses_quantum = ShortestJobFirst.uses_quantum
+
+    def __init__(self, arrival_rate, avg_service_time, quantum, **kwargs):
+        super().__init__(arrival_rate, avg_service_time, quantum, **kwargs)
+        self.algorithm = 6
+
+# --------------------------------------------------------
+
 
-            if proc is self.last_time_event.process:
-                self.last_time_event = None
+# algorithm numbers used by the command line and the data file
+ALGORITHMS = {1: FCFS, 2: STRF, 3: RR, 4: MLFQ, 5: Priority, 6: SJF}
 
-            self.add_termination_event(self.clock+t, proc)
 
+# '1) FCFS 2) STRF ...' for command line help
+def algorithm_help():
+    return ' '.join(f'{number}) {cls.__name__}' for number, cls in ALGORITHMS.items())
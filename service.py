@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import socket
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+"""
+long lived simulation service on a local unix socket. starting python, importing numpy and
+setting up a scheduler costs more than a small run does, so the service keeps a pool of worker
+processes that have done all of that once already and hands runs to them. clients send json
+lines and get json lines back, one per run as soon as it finishes, so replies can come back out
+of order and are matched up by id:
+    client:  {"type": "run", "id": 7, "algorithm": 3, "arrival_rate": 10, "avg_burst": 0.06,
+              "quantum": 0.04, "seed": 1, "max_processes": 10000, "stopping": {"target": 0.05},
+              "saturation": true}
+             {"type": "status"}
+    service: {"type": "result", "id": 7, "metrics": {...}, "events": 52311, "wall_time": 0.21, "shared": false}
+             {"type": "error", "id": 7, "error": "..."}
+             {"type": "status", "runs": 120, "shared": 31, "in_flight": 2, "workers": 4}
+only algorithm, arrival_rate and avg_burst are required. stopping takes the SequentialStopping
+arguments (see stopping.py) and replaces max_processes, saturation stops runs that are clearly
+unstable (see saturation.py). a run that is asked for again while an identical one is still
+running is not run twice, both get the one result ("shared": true on the second). runs without
+a seed draw a random one and are never shared. a client can send any number of runs on one
+connection, the connection is closed once the client has closed its side and every reply is out.
+replies are strict json, metrics that are nan or infinite are null.
+
+this module only imports numpy and the simulator in the service and its workers, clients stay
+cheap to start.
+
+    python service.py --workers 4
+    python main.py client 3 10 0.06 0.04 --seed 1
+"""
+
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'scheduler_sim.sock')
+REQUIRED_FIELDS = ('algorithm', 'arrival_rate', 'avg_burst')
+# request fields and their defaults
+RUN_FIELDS = {'algorithm': None, 'arrival_rate': None, 'avg_burst': None, 'quantum': 0.0, 'seed': None,
+              'max_processes': 10000, 'stopping': None, 'saturation': False}
+
+
+# numpy scalars in the metrics go out as plain numbers, and nan and inf (a saturation detector
+# that never fired, an interval that could not be computed) as null, json has no other way to
+# write them
+def plain(value):
+    if isinstance(value, dict):
+        return {key: plain(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def encode(message):
+    return (json.dumps(plain(message), allow_nan=False) + '\n').encode()
+
+
+# json true and false are ints to python, fields that take an integer do not accept them
+def integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_run(message):
+    """
+    checks a run request and fills in the defaults
+    :return: dict with the RUN_FIELDS, raises ValueError if the request is not valid
+    """
+    from scheduling_algorithms import ALGORITHMS
+    from stopping import SequentialStopping
+
+    unknown = set(message) - set(RUN_FIELDS) - {'type', 'id'}
+    if unknown:
+        raise ValueError(f'unknown fields {sorted(unknown)}')
+    missing = [name for name in REQUIRED_FIELDS if name not in message]
+    if missing:
+        raise ValueError(f'missing fields {missing}')
+    run = {name: message.get(name, default) for name, default in RUN_FIELDS.items()}
+    if not integer(run['algorithm']) or run['algorithm'] not in ALGORITHMS:
+        raise ValueError(f'algorithm must be one of {sorted(ALGORITHMS)}')
+    for name in ('arrival_rate', 'avg_burst', 'quantum'):
+        if not isinstance(run[name], (int, float)) or isinstance(run[name], bool):
+            raise ValueError(f'{name} must be a number')
+    if run['arrival_rate'] <= 0 or run['avg_burst'] <= 0:
+        raise ValueError('arrival_rate and avg_burst must be positive')
+    if ALGORITHMS[run['algorithm']].uses_quantum and run['quantum'] <= 0:
+        raise ValueError(f"{ALGORITHMS[run['algorithm']].__name__} needs a positive quantum")
+    if run['seed'] is not None and (not integer(run['seed']) or run['seed'] < 0):
+        raise ValueError('seed must be a non negative integer')
+    if not integer(run['max_processes']) or run['max_processes'] < 1:
+        raise ValueError('max_processes must be a positive integer')
+    if not isinstance(run['saturation'], bool):
+        raise ValueError('saturation must be true or false')
+    if run['stopping'] is not None:
+        try:
+            SequentialStopping(**run['stopping'])
+        except TypeError as e:
+            raise ValueError(f'bad stopping rule: {e}') from None
+    return run
+
+
+# runs one parsed request, this is what the worker processes execute
+def execute(run):
+    from saturation import SaturationDetector
+    from scheduling_algorithms import ALGORITHMS
+    from stopping import SequentialStopping
+
+    start = time.perf_counter()
+    stopping = SequentialStopping(**run['stopping']) if run['stopping'] is not None else None
+    saturation = SaturationDetector() if run['saturation'] else None
+    s = ALGORITHMS[run['algorithm']](run['arrival_rate'], run['avg_burst'], run['quantum'], seed=run['seed'],
+                                     stopping=stopping, saturation=saturation)
+    s.max_processes = run['max_processes']
+    s.run_sim()
+    return {'metrics': s.collect_metrics(), 'events': s.event_counter, 'wall_time': time.perf_counter() - start}
+
+
+# worker initializer: imports the simulator and runs every algorithm once so the first real
+# run does not pay for imports, allocations and first calls
+def warm_up():
+    from scheduling_algorithms import ALGORITHMS
+    for algorithm in ALGORITHMS:
+        execute(dict(RUN_FIELDS, algorithm=algorithm, arrival_rate=10, avg_burst=0.06, quantum=0.04, seed=0,
+                     max_processes=50))
+
+
+def ready():
+    return os.getpid()
+
+
+class SimulationService:
+    '''
+    the service: a unix socket server in front of a pool of warm worker processes.
+        workers: worker processes, defaults to the cpu count
+    '''
+
+    def __init__(self, path=DEFAULT_SOCKET, workers=None):
+        self.path = path
+        self.workers = workers or os.cpu_count()
+        self.pool = None
+        self.server = None
+        self.in_flight = {} # request key -> future of the run, for seeded runs that are still running
+        self.runs = 0 # runs started
+        self.shared = 0 # requests answered with the result of a run that was already running
+
+    # starts the pool and waits until every worker is warm
+    async def start_pool(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, ready) for _ in range(self.workers)))
+
+    async def start(self):
+        """
+        starts the pool and then listens on the socket. a socket file left behind by a service that is
+        gone is removed, a live one raises
+        """
+        if os.path.exists(self.path):
+            with socket.socket(socket.AF_UNIX) as probe:
+                try:
+                    probe.connect(self.path)
+                    raise RuntimeError(f'a service is already listening on {self.path}')
+                except (ConnectionRefusedError, FileNotFoundError):
+                    os.unlink(self.path)
+        await self.start_pool()
+        self.server = await asyncio.start_unix_server(self.handle, path=self.path)
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    # runs a parsed request on the pool. a pool whose worker died is replaced and the run is
+    # reported as failed
+    async def execute(self, run):
+        loop = asyncio.get_running_loop()
+        self.runs += 1
+        try:
+            return await loop.run_in_executor(self.pool, execute, run)
+        except BrokenProcessPool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up)
+            raise RuntimeError('the worker running this request died') from None
+
+    async def run(self, run):
+        """
+        the result of a parsed request, shared with an identical seeded request that is already running
+        :return: (result dict, True if it was shared)
+        """
+        if run['seed'] is None:
+            return await self.execute(run), False
+        key = json.dumps(run, sort_keys=True)
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future), True
+        future = asyncio.ensure_future(self.execute(run))
+        self.in_flight[key] = future
+        future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(future), False
+
+    # the reply to one run request
+    async def reply(self, message):
+        try:
+            run = parse_run(message)
+            result, shared = await self.run(run)
+        except (ValueError, RuntimeError) as e:
+            return {'type': 'error', 'id': message.get('id'), 'error': str(e)}
+        except Exception as e:
+            # a run that fails in the simulator is that request's error, the service keeps going
+            return {'type': 'error', 'id': message.get('id'), 'error': f'{type(e).__name__}: {e}'}
+        return dict(result, type='result', id=message.get('id'), shared=shared)
+
+    def status(self):
+        return {'type': 'status', 'runs': self.runs, 'shared': self.shared, 'in_flight': len(self.in_flight),
+                'workers': self.workers}
+
+    # one client connection. every run request gets its own task so replies go out as runs finish
+    async def handle(self, reader, writer):
+        pending = set()
+
+        async def answer(message):
+            reply = await self.reply(message)
+            writer.write(encode(reply))
+            await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    if not isinstance(message, dict):
+                        raise ValueError('a request is a json object')
+                except ValueError as e:
+                    writer.write(encode({'type': 'error', 'id': None, 'error': f'bad request: {e}'}))
+                    continue
+                if message.get('type') == 'status':
+                    writer.write(encode(self.status()))
+                elif message.get('type', 'run') == 'run':
+                    task = asyncio.ensure_future(answer(message))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                else:
+                    writer.write(encode({'type': 'error', 'id': message.get('id'),
+                                         'error': f"unknown request type {message['type']}"}))
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        except ConnectionError:
+            # a client that goes away does not get its replies, identical requests still share the runs
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            writer.close()
+
+
+def request_runs(requests, path=DEFAULT_SOCKET):
+    """
+    sends run requests to the service and yields the replies as they come in, which is the order
+    the runs finish. requests without an id are numbered by their position in requests
+    """
+    requests = [dict(r) for r in requests]
+    for k, request in enumerate(requests):
+        request.setdefault('type', 'run')
+        request.setdefault('id', k)
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(path)
+        sock.sendall(b''.join(encode(r) for r in requests))
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as stream:
+            for line in stream:
+                yield json.loads(line)
+
+
+def status(path=DEFAULT_SOCKET):
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(path)
+        sock.sendall(encode({'type': 'status'}))
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as stream:
+            return json.loads(stream.readline())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='serve simulation runs on a unix socket from warm worker processes')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='path of the unix socket')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the cpu count')
+    args = parser.parse_args(argv)
+
+    service = SimulationService(args.socket, args.workers)
+    print(f'starting {service.workers} workers')
+
+    async def serve():
+        await service.start()
+        print(f'listening on {args.socket}')
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            await service.close()
+            print(f'{service.runs} runs, {service.shared} shared')
+
+    asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import math
+
+import numpy as np
+from metrics import t_quantile
+
+"""
+sequential stopping. instead of always running to a fixed number of finished processes, a
+scheduler built with stopping=SequentialStopping(...) runs in stages and after each stage
+estimates how precise its metrics are, stopping as soon as they are precise enough.
+
+the estimate is the method of batch means on the turnaround (and/or wait) time series:
+    the warm-up is cut off with MSER-5, the truncation point that minimises the standard
+    error of the mean of what is left
+    the rest is split into a fixed number of batches, whose means are close to independent
+    even when single turnaround times are strongly autocorrelated, and the t confidence
+    interval is taken over the batch means
+the run stops when the relative half width of the interval is below the target for every
+chosen metric, or when the event cap is hit.
+"""
+
+
+# MSER-5 truncation point of a series of 5-means y: the d that minimises
+#   sum((y[d:] - mean(y[d:]))**2) / (len(y) - d)**2
+# over the first half of the series. returns (d, True if the minimum was inside the first half)
+def mser(y):
+    m = len(y)
+    half = m // 2
+    # sums over y[d:] for every d, from the back
+    tail_sum = np.cumsum(y[::-1])[::-1]
+    tail_sq = np.cumsum((y * y)[::-1])[::-1]
+    n = m - np.arange(half + 1)
+    ssd = tail_sq[:half + 1] - tail_sum[:half + 1] ** 2 / n
+    d = int(np.argmin(ssd / n ** 2))
+    return d, d < half
+
+
+# means of a series split into n equal batches, the first len % n values are dropped
+def batch_means(x, n):
+    size = len(x) // n
+    return x[len(x) - size * n:].reshape(n, size).mean(axis=1)
+
+
+class SequentialStopping:
+    '''
+    stopping rule for one run.
+        target: relative confidence interval half width (half width / |mean|) to reach
+        metrics: which series have to reach it, 'turnaround' and/or 'wait'
+        level: confidence level of the interval
+        batches: number of batch means the interval is taken over
+        min_processes: finished processes before the first check
+        max_events: hard cap on events, the run stops there even if it did not converge
+        growth: each stage runs until this many times the processes of the last one
+    '''
+    group = 5 # observations per point of the MSER-5 series
+
+    def __init__(self, target=0.05, metrics=('turnaround',), level=0.95, batches=20, min_processes=1000,
+                 max_events=10**7, growth=1.25):
+        self.target = target
+        self.metrics = metrics
+        self.level = level
+        self.batches = batches
+        self.min_processes = min_processes
+        self.max_events = max_events
+        self.growth = growth
+
+        self.pending = {'turnaround': [], 'wait': []} # observations not folded into 5-means yet
+        self.series = {'turnaround': np.empty(0), 'wait': np.empty(0)} # 5-means
+        self.estimates = {} # metric -> (steady state mean, half width, warm-up processes)
+        self.converged = False
+        self.checks = 0
+
+    # called by the scheduler for every finished process
+    def add(self, turnaround, wait):
+        self.pending['turnaround'].append(turnaround)
+        self.pending['wait'].append(wait)
+
+    # moves whole groups of pending observations into the 5-means series
+    def fold(self):
+        for name, values in self.pending.items():
+            k = len(values) - len(values) % self.group
+            if k:
+                means = np.array(values[:k]).reshape(-1, self.group).mean(axis=1)
+                self.series[name] = np.concatenate((self.series[name], means))
+                del values[:k]
+
+    # updates the estimates, returns True when every chosen metric is precise enough
+    def check(self):
+        self.fold()
+        self.checks += 1
+        done = True
+        for name in self.metrics:
+            y = self.series[name]
+            if len(y) < 2 * self.batches:
+                return False
+            d, settled = mser(y)
+            rest = y[d:]
+            means = batch_means(rest, self.batches)
+            mean = float(rest.mean())
+            half_width = t_quantile(0.5 + self.level / 2, self.batches - 1) * float(means.std(ddof=1)) / math.sqrt(self.batches)
+            self.estimates[name] = (mean, half_width, d * self.group)
+            if not settled or half_width > self.target * abs(mean):
+                done = False
+        return done
+
+    def run(self, sim, loop):
+        """
+        runs sim in stages with loop(processes, events), the scheduler's event loop, until the
+        metrics converge, the event cap is hit, the arrivals run out or the run is aborted
+        """
+        processes = max(self.min_processes, sim.processes_completed + 1)
+        while True:
+            # a trace source can run out before the metrics converge
+            if sim.total_processes is not None:
+                processes = min(processes, sim.total_processes)
+            loop(processes, self.max_events)
+            if self.check():
+                self.converged = True
+                return
+            if sim.event_counter >= self.max_events or sim.processes_completed == sim.total_processes or sim.aborted:
+                return
+            processes = max(processes + 1, int(processes * self.growth))
+
+    # steady state mean, half width and relative half width of each chosen metric, and the
+    # warm-up that was cut off. keyed like the collect_metrics dict
+    def summary(self):
+        d = {}
+        for name, (mean, half_width, warmup) in self.estimates.items():
+            d[f"steady state {name} time"] = mean
+            d[f"{name} time ci half width"] = half_width
+            d[f"{name} time relative half width"] = half_width / abs(mean) if mean else math.inf
+            d[f"{name} warm-up processes"] = warmup
+        d["converged"] = self.converged
+        return d
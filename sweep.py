@@ -0,0 +1,189 @@
+import argparse
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from results_store import ResultsStore
+from saturation import SaturationDetector
+from scheduling_algorithms import ALGORITHMS, algorithm_help, metrics_line
+
+"""
+parameter sweeps. a sweep is a grid of algorithm x arrival rate x burst x quantum x replication,
+every point of the grid is one simulation run. runs are spread over a process pool, results
+are streamed back as they finish and written to the data file in one batch at the end. with a
+results store, runs that are already stored are read back instead of simulated again.
+
+can be run as a script, see `python sweep.py --help`
+"""
+
+
+SweepTask = namedtuple('SweepTask', ['algorithm', 'arrival_rate', 'avg_burst', 'quantum', 'replication', 'seed'])
+
+
+# seed for one run. derived from the sweep seed and the run's own parameters so every run
+# gets an independent stream that does not change when the rest of the grid changes
+def task_seed(sweep_seed, algorithm, arrival_rate, avg_burst, quantum, replication):
+    key = [sweep_seed, algorithm, round(arrival_rate * 10**6), round(avg_burst * 10**9), round(quantum * 10**9), replication]
+    return int(np.random.SeedSequence(key).generate_state(1, np.uint64)[0])
+
+
+# builds the tasks of a sweep in grid order. algorithms that do not use a quantum only run
+# with the first one. if no seed is given a random one is drawn
+def make_tasks(algorithms, arrival_rates, avg_bursts, quanta, replications=1, seed=None):
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    tasks = []
+    for algorithm in algorithms:
+        algorithm_quanta = quanta if ALGORITHMS[algorithm].uses_quantum else quanta[:1]
+        for arrival_rate in arrival_rates:
+            for avg_burst in avg_bursts:
+                for quantum in algorithm_quanta:
+                    for replication in range(replications):
+                        s = task_seed(seed, algorithm, arrival_rate, avg_burst, quantum, replication)
+                        tasks.append(SweepTask(algorithm, arrival_rate, avg_burst, quantum, replication, s))
+    return tasks
+
+
+# runs a single task, this is what the worker processes execute.
+# with saturation unstable configurations are stopped as soon as their backlog is clearly growing,
+# without it every run goes to max_processes
+def run_task(task, saturation=True):
+    start = time.perf_counter()
+    s = ALGORITHMS[task.algorithm](task.arrival_rate, task.avg_burst, task.quantum, seed=task.seed,
+                                   saturation=SaturationDetector() if saturation else None)
+    s.run_sim()
+    return {'task': task,
+            'metrics': s.collect_metrics(),
+            'events': s.event_counter,
+            'wall_time': time.perf_counter() - start}
+
+
+# rough relative cost of a task, busier systems have longer queues and more events
+def task_cost(task):
+    return task.arrival_rate * task.avg_burst
+
+
+# reads back the tasks that are already in the store. without saturation a stored run that was
+# stopped as saturated does not count, it is run again to max_processes
+# :return: (results with None for the tasks still to run, indices of the tasks still to run)
+def cached_results(tasks, store, on_result=None, saturation=True):
+    results = [None] * len(tasks)
+    if store is None:
+        return results, list(range(len(tasks)))
+    pending = []
+    for k, task in enumerate(tasks):
+        row = store.lookup(task)
+        if row is not None and not saturation and store.column('saturated').item(row):
+            row = None
+        if row is None:
+            pending.append(k)
+        else:
+            results[k] = store.result(row, task)
+            if on_result is not None:
+                on_result(results[k])
+    return results, pending
+
+
+def run_sweep(tasks, workers=None, on_result=None, store=None, saturation=True):
+    """
+    runs every task over a pool of worker processes. the most expensive tasks are submitted
+    first so the sweep is not left waiting on one slow run at the end.
+    :param workers: number of worker processes, defaults to the cpu count. 1 runs in this process
+    :param on_result: called with each result as soon as it finishes
+    :param store: ResultsStore. tasks already in it are read back instead of simulated and the
+                  new results are appended to it in one batch at the end
+    :param saturation: stop unstable runs early and mark them saturated. False runs every task to
+                       max_processes, as runs without a saturation detector do
+    :return: list of results in the same order as tasks
+    """
+    results, pending = cached_results(tasks, store, on_result, saturation)
+    order = sorted(pending, key=lambda k: task_cost(tasks[k]), reverse=True)
+
+    if workers == 1:
+        for k in order:
+            results[k] = run_task(tasks[k], saturation)
+            if on_result is not None:
+                on_result(results[k])
+    elif order:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_task, tasks[k], saturation): k for k in order}
+            for future in as_completed(futures):
+                k = futures[future]
+                results[k] = future.result()
+                if on_result is not None:
+                    on_result(results[k])
+
+    if store is not None:
+        store.append([results[k] for k in order])
+    return results
+
+
+# appends all results to the data file in one write, in the same format as Scheduler.write_metrics
+def write_results(results, data_file):
+    lines = []
+    for result in results:
+        task = result['task']
+        lines.append(metrics_line(task.algorithm, task.arrival_rate, task.avg_burst, task.quantum, result['metrics']))
+    with open(data_file, 'a') as f:
+        f.writelines(lines)
+
+
+def print_result(result):
+    task = result['task']
+    source = 'cached' if result.get('cached') else f"{result['wall_time']:.2f}s"
+    if result['metrics'].get('saturated'):
+        source += f", saturated, backlog growing {result['metrics']['backlog growth rate']:.1f}/s"
+    print(f"{ALGORITHMS[task.algorithm].__name__} arrival_rate = {task.arrival_rate} burst = {task.avg_burst} "
+          f"quantum = {task.quantum} replication = {task.replication} ({source})")
+
+
+# parses values like 0.06 or ranges like 1-30 (inclusive, integer steps)
+def parse_values(values):
+    parsed = []
+    for v in values:
+        if '-' in v[1:]:
+            lo, hi = v.split('-', 1)
+            parsed.extend(range(int(lo), int(hi) + 1))
+        elif v.lstrip('-').isdigit():
+            parsed.append(int(v))
+        else:
+            parsed.append(float(v))
+    return parsed
+
+
+# the sweep grid options, the defaults are the grid data_collector.py runs
+def add_grid_arguments(parser):
+    parser.add_argument('--algorithms', nargs='+', type=int, default=[1, 2, 3], help=algorithm_help())
+    parser.add_argument('--rates', nargs='+', default=['1-30'], help='arrival rates, ranges like 1-30 are allowed')
+    parser.add_argument('--bursts', nargs='+', type=float, default=[0.06], help='average burst times')
+    parser.add_argument('--quanta', nargs='+', type=float, default=[0.04], help='time quanta for RR')
+    parser.add_argument('--replications', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=None, help='sweep seed, random if omitted')
+    parser.add_argument('--output', default='data.csv', help='data file the results are appended to, - for none')
+    parser.add_argument('--store', default=None, help='results store directory, stored runs are not simulated again')
+    parser.add_argument('--no-saturation', dest='saturation', action='store_false',
+                        help='run unstable configurations to max processes instead of stopping them as saturated')
+
+
+# the tasks of the grid given by the add_grid_arguments options
+def grid_tasks(args):
+    return make_tasks(args.algorithms, parse_values(args.rates), args.bursts, args.quanta, args.replications, args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='run a grid of simulations in parallel')
+    add_grid_arguments(parser)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to the cpu count')
+    args = parser.parse_args(argv)
+
+    tasks = grid_tasks(args)
+    store = ResultsStore(args.store) if args.store is not None else None
+    print(f'running {len(tasks)} simulations')
+    results = run_sweep(tasks, workers=args.workers, on_result=print_result, store=store, saturation=args.saturation)
+    if args.output != '-':
+        write_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+import pytest
+from arrivals import ArrivalStream
+from batch import BatchScheduler
+from scheduling_algorithms import ALGORITHMS
+
+"""
+cross check of the batched replications against the single scheduler: replication r has to give
+the same run as the single scheduler with the same seed
+"""
+
+
+class QuantumBursts(ArrivalStream):
+    '''
+    synthetic arrivals whose bursts are whole multiples of the quantum, so RR slices end right on
+    the quantum boundary
+    '''
+
+    def __init__(self, arrival_rate, avg_burst_time, quantum, seed=None):
+        super().__init__(arrival_rate, avg_burst_time, seed)
+        self.quantum = quantum
+
+    def refill(self):
+        super().refill()
+        self.bursts = np.ceil(self.bursts / self.quantum) * self.quantum
+
+
+def assert_same_runs(batch, singles):
+    assert batch.processes_completed.tolist() == [s.processes_completed for s in singles]
+    assert batch.termination_events_handled.tolist() == [s.termination_events_handled for s in singles]
+    for r, (metrics, s) in enumerate(zip(batch.collect_metrics(), singles)):
+        assert batch.clock.item(r) * batch.time_scale == pytest.approx(s.clock * s.time_scale, rel=1e-12)
+        assert batch.cpu_time.item(r) == s.cpu_time
+        for key, value in s.collect_metrics().items():
+            if not (isinstance(value, float) and math.isnan(value)):
+                assert metrics[key] == pytest.approx(value, rel=1e-9, abs=1e-12), key
+
+
+@pytest.mark.parametrize('integer_clock', [False, True])
+@pytest.mark.parametrize('algorithm', [1, 3])
+@pytest.mark.parametrize('arrival_rate', [5, 14])
+def test_batch_matches_single(algorithm, arrival_rate, integer_clock):
+    seeds = [1, 2, 3]
+    batch = BatchScheduler(algorithm, arrival_rate, 0.06, 0.04, seeds, max_processes=3000, chunk=1000,
+                           integer_clock=integer_clock)
+    batch.run_sim()
+    singles = []
+    for seed in seeds:
+        s = ALGORITHMS[algorithm](arrival_rate, 0.06, 0.04, seed=seed, integer_clock=integer_clock)
+        s.max_processes = 3000
+        s.run_sim()
+        singles.append(s)
+    assert_same_runs(batch, singles)
+
+
+@pytest.mark.parametrize('algorithm', [1, 3])
+def test_slices_that_end_on_the_quantum_boundary(algorithm):
+    # every burst is a multiple of the quantum, so on the integer clock RR terminations tie with
+    # the next slice and a second termination is added before the first one is handled
+    def sources():
+        return [QuantumBursts(12, 0.06, 0.04, seed) for seed in (1, 2)]
+
+    batch = BatchScheduler(algorithm, 12, 0.06, 0.04, None, max_processes=2000, integer_clock=True,
+                           arrivals=sources())
+    most_pending = []
+    add_termination_events = batch.add_termination_events
+
+    def add_and_count(rows, times, pids):
+        add_termination_events(rows, times, pids)
+        most_pending.append(batch.terms_ready.max(initial=0))
+
+    batch.add_termination_events = add_and_count
+    batch.run_sim()
+    singles = []
+    for source in sources():
+        s = ALGORITHMS[algorithm](12, 0.06, 0.04, arrivals=source, integer_clock=True)
+        s.max_processes = 2000
+        s.run_sim()
+        singles.append(s)
+    assert_same_runs(batch, singles)
+    assert max(most_pending) == (2 if algorithm == 3 else 1)
@@ -0,0 +1,91 @@
+import pytest
+from checkpoint import fork, load_checkpoint, restore, save_checkpoint, snapshot
+from scheduling_algorithms import ALGORITHMS, FCFS, RR, SJF
+
+"""
+checkpoints: a run stopped, saved and resumed has to end exactly like the same run left alone
+"""
+
+
+def make(algorithm, quantum=0.04):
+    kwargs = {'fast': False} if algorithm == 1 else {}
+    return ALGORITHMS[algorithm](12, 0.06, quantum, seed=9, **kwargs)
+
+
+def assert_same_run(a, b):
+    for name in ('clock', 'cpu_time', 'processes_completed', 'event_counter', 'time_events_handled',
+                 'arrival_events_handled', 'termination_events_handled', 'next_pid'):
+        assert getattr(a, name) == getattr(b, name), name
+    assert list(a.recent_done) == list(b.recent_done)
+    assert a.collect_metrics() == b.collect_metrics()
+
+
+@pytest.mark.parametrize('algorithm', [1, 2, 3])
+def test_resume_matches_an_uninterrupted_run(tmp_path, algorithm):
+    whole = make(algorithm)
+    whole.max_processes = 3000
+    whole.run_sim()
+
+    first = make(algorithm)
+    first.max_processes = 1200
+    first.run_sim()
+    path = str(tmp_path / 'run.npz')
+    save_checkpoint(first, path)
+    resumed = load_checkpoint(path)
+    resumed.max_processes = 3000
+    resumed.run_sim()
+    assert_same_run(resumed, whole)
+
+
+@pytest.mark.parametrize('algorithm', [1, 2, 3])
+def test_fork_with_the_same_settings_carries_on(algorithm):
+    s = make(algorithm)
+    s.max_processes = 800
+    s.run_sim()
+    forked = fork(s)
+    for run in (s, forked):
+        run.max_processes = 2000
+        run.run_sim()
+    assert_same_run(forked, s)
+
+
+def test_fork_into_another_quantum_starts_from_the_same_state():
+    warm = make(3)
+    warm.max_processes = 1000
+    warm.run_sim()
+    forked = fork(warm, quantum=0.02, reset_metrics=True)
+    assert isinstance(forked, RR) and forked.quantum == 0.02
+    assert forked.clock == warm.clock and forked.next_pid == warm.next_pid
+    assert forked.metrics.turnaround.count == 0
+    forked.max_processes = 2000
+    forked.run_sim()
+    assert forked.processes_completed == 2000
+    assert forked.metrics.turnaround.count == 1000
+
+
+def test_fcfs_closed_form_carries_on_in_the_event_engine():
+    whole = make(1)
+    whole.max_processes = 3000
+    whole.run_sim()
+    fast = FCFS(12, 0.06, 0, seed=9)
+    fast.max_processes = 1200
+    fast.run_sim()
+    resumed = fork(fast)
+    resumed.max_processes = 3000
+    resumed.run_sim()
+    for name in ('clock', 'cpu_time', 'event_counter', 'next_pid', 'processes_completed'):
+        assert getattr(resumed, name) == pytest.approx(getattr(whole, name), rel=1e-12), name
+    # the closed form adds its metrics a block at a time, which rounds differently in the last bits
+    for key, value in whole.collect_metrics().items():
+        assert resumed.collect_metrics()[key] == pytest.approx(value, rel=1e-9), key
+
+
+def test_refuses_what_it_cannot_capture():
+    with pytest.raises(TypeError):
+        snapshot(RR(12, 0.06, 0.04, seed=1, integer_clock=True))
+    with pytest.raises(TypeError):
+        snapshot(SJF(12, 0.06, 0, seed=1))
+    meta, arrays = snapshot(make(2))
+    meta['format'] += 1
+    with pytest.raises(ValueError):
+        restore(meta, arrays)
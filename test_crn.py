@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from crn import SharedWorkload, compare_policies, run_replication
+from scheduling_algorithms import ALGORITHMS
+
+"""
+common random numbers: every policy in a replication sees the workload a standalone run with the
+same seed would, and the paired differences are the per replication differences
+"""
+
+
+def test_replication_matches_standalone_runs():
+    algorithms = [1, 2, 3, 6]
+    paired = run_replication(algorithms, 12, 0.06, 0.04, 3, saturation=False)
+    for algorithm, metrics in zip(algorithms, paired):
+        s = ALGORITHMS[algorithm](12, 0.06, 0.04, seed=3)
+        s.run_sim()
+        assert metrics == s.collect_metrics(), ALGORITHMS[algorithm].__name__
+
+
+def test_blocks_are_dropped_once_every_reader_passed_them():
+    workload = SharedWorkload(10, 0.06, seed=1, block_size=100)
+    first, second = workload.reader(), workload.reader()
+    a = first.take(1000)
+    assert len(workload.blocks) == 10
+    b = second.take(1000)
+    assert (a[0] == b[0]).all() and (a[1] == b[1]).all()
+    second.take(1)
+    first.take(1)
+    assert sorted(workload.blocks) == [10]
+
+
+def test_paired_differences():
+    summary = compare_policies([1, 2], 10, 0.06, 0.04, replications=6, seed=2, saturation=False)
+    key = "average turnaround time"
+    fcfs = [run_replication([1, 2], 10, 0.06, 0.04, s, saturation=False)
+            for s in np.random.SeedSequence(2).spawn(6)]
+    diffs = np.array([run[1][key] - run[0][key] for run in fcfs])
+    mean, half_width, ratio = summary['differences'][(2, 1)][key]
+    assert mean == pytest.approx(diffs.mean(), rel=1e-12)
+    assert summary['policies'][1][key][0] == pytest.approx(np.mean([run[0][key] for run in fcfs]), rel=1e-12)
+    # the same workload under both policies, so most of the noise cancels out of the difference
+    assert mean < 0 and ratio < 0.5
@@ -0,0 +1,81 @@
+import json
+import math
+
+import numpy as np
+import pytest
+from data_analyzer import CSV_METRICS, Aggregate, CSVResults, aggregate
+
+"""
+sweep analysis: chunked aggregation and its cache give the means of a single pass, and saturated
+runs are kept apart instead of being dropped
+"""
+
+
+def write_data(path, rows, saturated):
+    with open(path, 'a') as f:
+        for row, flag in zip(rows.tolist(), saturated.tolist()):
+            f.write(','.join(str(v) for v in row[:4]) + ',' + ','.join(repr(v) for v in row[4:]) +
+                    f',{int(flag)},0.0\n')
+
+
+def random_rows(rng, count):
+    keys = np.column_stack([rng.integers(1, 4, count), rng.choice([5, 15, 25], count),
+                            np.full(count, 0.06), np.full(count, 0.04)]).astype(np.float64)
+    return np.column_stack([keys, rng.normal(1.0, 0.3, (count, len(CSV_METRICS)))]), keys[:, 1] == 25
+
+
+def test_chunks_and_cache_match_one_pass(tmp_path):
+    rng = np.random.default_rng(1)
+    path = str(tmp_path / 'data.csv')
+    rows, saturated = random_rows(rng, 900)
+    write_data(path, rows[:600], saturated[:600])
+    aggregate(CSVResults(path), workers=1)
+    write_data(path, rows[600:], saturated[600:])
+    agg, chunks = aggregate(CSVResults(path), workers=1, chunk_rows=100)
+    assert chunks == 3
+    whole = Aggregate.from_rows(CSV_METRICS, rows[:, :4], rows[:, 4:], saturated, np.ones(900, dtype=bool))
+    got, expected = agg.summary(), whole.summary()
+    for key, value in expected.items():
+        assert got[key] == pytest.approx(value, rel=1e-12, nan_ok=True), key
+
+
+def test_saturated_runs_are_kept_apart():
+    keys = np.array([[1, 5, 0.06, 0], [1, 5, 0.06, 0], [1, 25, 0.06, 0], [1, 25, 0.06, 0], [1, 25, 0.06, 0]])
+    values = np.array([[1.0], [3.0], [10.0], [20.0], [30.0]])
+    saturated = np.array([False, False, True, True, False])
+    marked = np.ones(5, dtype=bool)
+    # the same rows in two chunks merge to the same groups
+    for agg in (Aggregate.from_rows(('turnaround',), keys, values, saturated, marked),
+                Aggregate.from_rows(('turnaround',), keys[:3], values[:3], saturated[:3], marked[:3]).merge(
+                    Aggregate.from_rows(('turnaround',), keys[3:], values[3:], saturated[3:], marked[3:]))):
+        summary = agg.summary()
+        assert summary['replications'].tolist() == [2, 1]
+        assert summary['saturated'].tolist() == [0, 2]
+        assert summary['turnaround'].tolist() == [2.0, 30.0]
+        assert math.isnan(summary['turnaround saturated'][0])
+        assert summary['turnaround saturated'][1] == 15.0
+        assert summary['turnaround saturated ci'][1] == pytest.approx(12.706 * math.sqrt(50) / math.sqrt(2), rel=1e-3)
+
+
+def test_group_of_only_saturated_runs_is_not_empty():
+    keys = np.array([[3, 25, 0.06, 0.04]] * 3)
+    agg = Aggregate.from_rows(('turnaround',), keys, np.array([[4.0], [5.0], [6.0]]), np.ones(3, dtype=bool),
+                              np.ones(3, dtype=bool))
+    summary = agg.summary()
+    assert summary['replications'].tolist() == [0]
+    assert math.isnan(summary['turnaround'][0])
+    assert summary['turnaround saturated'].tolist() == [5.0]
+
+
+def test_old_cache_is_rebuilt(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    rows, saturated = random_rows(np.random.default_rng(2), 50)
+    write_data(path, rows, saturated)
+    # a cache written before the saturated moments were kept
+    meta = json.dumps({'metrics': CSV_METRICS, 'source': CSVResults(path).state(0)}).encode()
+    np.savez(path + '.analysis.npz', keys=np.zeros((0, 4)), n=np.zeros(0), mean=np.zeros((0, 4)),
+             m2=np.zeros((0, 4)), saturated=np.zeros(0), unmarked=np.zeros(0),
+             meta=np.frombuffer(meta, dtype=np.uint8))
+    assert Aggregate.load(path + '.analysis.npz', CSV_METRICS) is None
+    agg, chunks = aggregate(CSVResults(path), workers=1)
+    assert chunks == 1 and agg.n.sum() + agg.saturated.sum() == 50
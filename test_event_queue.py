@@ -0,0 +1,61 @@
+import math
+
+import numpy as np
+import pytest
+from event_queue import HeapEventQueue, SortedListEventQueue
+from scheduling_algorithms import ALGORITHMS, Event
+
+"""
+the heap event queue against the sorted list reference: the same pops for the same pushes, and
+the same runs when the scheduler is built on either
+"""
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_heap_pops_like_the_sorted_list(seed):
+    rng = np.random.default_rng(seed)
+    heap, reference = HeapEventQueue(), SortedListEventQueue()
+    popped = []
+    # few distinct times and ranks so most keys tie and the sequence number decides
+    for k in range(2000):
+        if len(heap) and rng.random() < 0.4:
+            a, b = heap.pop(), reference.pop()
+            assert a is b
+            popped.append(a)
+            continue
+        event = Event(int(rng.integers(1, 4)), float(rng.integers(0, 20)), k)
+        rank = int(rng.integers(0, 2))
+        heap.push(event, rank)
+        reference.push(event, rank)
+        assert heap.peek()[3] is reference.peek()[3]
+    while len(heap):
+        assert heap.pop() is reference.pop()
+    assert not len(reference)
+
+
+def test_equal_keys_come_back_first_in_first_out():
+    queue = HeapEventQueue()
+    events = [Event(2, 1.0, k) for k in range(10)]
+    for event in events:
+        queue.push(event, 1)
+    queue.push(Event(1, 1.0, 99), 0)
+    assert queue.pop().process == 99
+    assert [queue.pop() for _ in events] == events
+
+
+@pytest.mark.parametrize('algorithm', sorted(ALGORITHMS))
+def test_runs_do_not_depend_on_the_backend(algorithm):
+    runs = []
+    for queue in (HeapEventQueue(), SortedListEventQueue()):
+        kwargs = {'fast': False} if algorithm == 1 else {}
+        s = ALGORITHMS[algorithm](12, 0.06, 0.04, seed=5, event_queue=queue, **kwargs)
+        s.max_processes = 2000
+        s.run_sim()
+        runs.append(s)
+    heap, reference = runs
+    assert heap.event_counter == reference.event_counter
+    assert heap.clock == reference.clock
+    assert list(heap.recent_done) == list(reference.recent_done)
+    for key, value in reference.collect_metrics().items():
+        if not (isinstance(value, float) and math.isnan(value)):
+            assert heap.collect_metrics()[key] == value, key
@@ -0,0 +1,117 @@
+import math
+
+import numpy as np
+import pytest
+from arrivals import BinaryTrace, write_binary_trace
+from saturation import SaturationDetector
+from scheduling_algorithms import FCFS
+
+"""
+cross check of the FCFS closed form (run_fast) against the event engine: both have to end in the
+same state, counters, queues and metrics
+"""
+
+
+COUNTERS = ('processes_completed', 'event_counter', 'arrival_events_handled', 'time_events_handled',
+            'termination_events_handled', 'time_events_ready', 'next_pid', 'total_processes', 'max_processes',
+            'termination_event_ready')
+
+
+def run_both(make, **kwargs):
+    fast = make(fast=True, **kwargs)
+    fast.run_sim()
+    engine = make(fast=False, **kwargs)
+    engine.run_sim()
+    return fast, engine
+
+
+def assert_same_state(fast, engine):
+    for name in COUNTERS:
+        assert getattr(fast, name) == getattr(engine, name), name
+    assert fast.clock == pytest.approx(engine.clock, rel=1e-12)
+    assert fast.cpu_time == pytest.approx(engine.cpu_time, rel=1e-12)
+    assert list(fast.recent_done) == list(engine.recent_done)
+
+    # the same processes wait in the ready queue and the same arrival is next
+    assert fast.processes.pid[list(fast.ready_queue)].tolist() == engine.processes.pid[list(engine.ready_queue)].tolist()
+    assert len(fast.event_queue) == len(engine.event_queue)
+    if len(engine.event_queue):
+        fast_next, engine_next = fast.event_queue.pop(), engine.event_queue.pop()
+        assert fast_next.event_type == engine_next.event_type == 1
+        assert fast_next.time == engine_next.time
+        assert fast.processes.pid[fast_next.process] == engine.processes.pid[engine_next.process]
+    assert fast.arrivals.next_time() == engine.arrivals.next_time()
+
+    fast_metrics, engine_metrics = fast.collect_metrics(), engine.collect_metrics()
+    assert fast_metrics.keys() == engine_metrics.keys()
+    for key, value in engine_metrics.items():
+        if isinstance(value, float) and math.isnan(value):
+            assert math.isnan(fast_metrics[key]), key
+        else:
+            assert fast_metrics[key] == pytest.approx(value, rel=1e-9, abs=1e-12), key
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+@pytest.mark.parametrize('arrival_rate', [1, 5, 15, 20])
+def test_fast_matches_event_engine(arrival_rate, seed):
+    # 20 processes per second at 0.06 seconds each is past saturation, the backlog keeps growing
+    fast, engine = run_both(lambda **kw: FCFS(arrival_rate, 0.06, 0, seed=seed, **kw))
+    assert_same_state(fast, engine)
+
+
+@pytest.mark.parametrize('integer_clock', [False, True])
+def test_fast_matches_event_engine_clock_units(integer_clock):
+    fast, engine = run_both(lambda **kw: FCFS(10, 0.06, 0, seed=4, integer_clock=integer_clock, **kw))
+    assert_same_state(fast, engine)
+
+
+@pytest.mark.parametrize('rows', [1, 500, 10000, 12000])
+def test_fast_matches_event_engine_on_a_trace(tmp_path, rows):
+    rng = np.random.default_rng(rows)
+    path = str(tmp_path / 'short.trace')
+    write_binary_trace(path, np.cumsum(rng.exponential(0.1, rows)), rng.exponential(0.06, rows))
+    fast, engine = run_both(lambda **kw: FCFS(10, 0.06, 0, arrivals=BinaryTrace(path, block_size=256), **kw))
+    assert_same_state(fast, engine)
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_both_flag_a_saturated_run(seed):
+    fast = FCFS(25, 0.06, 0, seed=seed, saturation=SaturationDetector())
+    fast.run_sim()
+    engine = FCFS(25, 0.06, 0, seed=seed, fast=False, saturation=SaturationDetector())
+    engine.run_sim()
+    assert fast.aborted == engine.aborted == 'saturated'
+    assert fast.collect_metrics()['saturated'] and engine.collect_metrics()['saturated']
+    # both stop long before max_processes. the fast path samples every check_events / 3 processes
+    # and the event engine every check_events events, so they stop near each other, not together
+    assert fast.processes_completed < fast.max_processes // 2
+    assert fast.processes_completed == pytest.approx(engine.processes_completed, rel=0.25)
+    assert fast.clock == pytest.approx(engine.clock, rel=0.25)
+
+
+def test_stable_run_is_not_flagged():
+    fast = FCFS(5, 0.06, 0, seed=1, saturation=SaturationDetector())
+    fast.run_sim()
+    assert fast.aborted is None
+    assert not fast.collect_metrics()['saturated']
+
+
+@pytest.mark.parametrize('arrival_rate', [5, 25])
+def test_fast_does_not_depend_on_the_block_size(arrival_rate):
+    runs = []
+    for fast_block in (1 << 16, 777, 1):
+        s = FCFS(arrival_rate, 0.06, 0, seed=7, saturation=SaturationDetector())
+        s.fast_block = fast_block
+        s.run_sim()
+        runs.append(s)
+    whole = runs[0]
+    for s in runs[1:]:
+        for name in COUNTERS:
+            assert getattr(s, name) == getattr(whole, name), name
+        assert s.clock == pytest.approx(whole.clock, rel=1e-12)
+        assert s.saturation.backlog == whole.saturation.backlog
+        assert s.saturation.clock == pytest.approx(whole.saturation.clock, rel=1e-12)
+        assert s.aborted == whole.aborted
+        for key, value in whole.collect_metrics().items():
+            if not (isinstance(value, float) and math.isnan(value)):
+                assert s.collect_metrics()[key] == pytest.approx(value, rel=1e-9, abs=1e-12), key
@@ -0,0 +1,31 @@
+from hooks import SimHooks
+from scheduling_algorithms import RR
+
+"""
+instrumentation hooks: a hooked run is the same run, only the chosen methods are timed, and
+the scheduler is left as it was
+"""
+
+
+def run(hooks=None):
+    s = RR(10, 0.06, 0.04, seed=1, hooks=hooks)
+    s.max_processes = 2000
+    s.run_sim()
+    return s
+
+
+def test_hooked_run_is_the_same_run():
+    hooks = SimHooks()
+    hooked, plain = run(hooks), run()
+    assert hooked.event_counter == plain.event_counter
+    assert hooked.collect_metrics() == plain.collect_metrics()
+    assert hooks.calls['handle_termination_event'] == plain.termination_events_handled
+    assert sum(hooks.scan_lengths['ready queue'].values()) > 0
+    assert not any(name in vars(hooked) for name in SimHooks.timed_methods)
+
+
+def test_only_the_chosen_methods_are_timed():
+    hooks = SimHooks(histograms=False, methods=('pop_event', 'handle_time_event'))
+    s = run(hooks)
+    assert set(hooks.times) == {'pop_event', 'handle_time_event'}
+    assert hooks.calls['handle_time_event'] == s.time_events_handled
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from metrics import MetricsAccumulator, QuantileSketch, RunningStats, t_quantile
+from scheduling_algorithms import ALGORITHMS
+
+"""
+the streaming accumulators against two pass numpy statistics, one value at a time, in blocks
+and merged from pieces
+"""
+
+
+def test_running_stats_match_two_pass():
+    values = np.random.default_rng(1).exponential(0.3, 5000)
+    one, blocks, merged = RunningStats(), RunningStats(), RunningStats()
+    for x in values.tolist():
+        one.add(x)
+    for block in np.array_split(values, 7):
+        blocks.add_many(block)
+        part = RunningStats()
+        for x in block.tolist():
+            part.add(x)
+        merged.merge(part)
+    for stats in (one, blocks, merged):
+        assert stats.count == len(values)
+        assert stats.mean == pytest.approx(values.mean(), rel=1e-12)
+        assert stats.variance() == pytest.approx(values.var(ddof=1), rel=1e-10)
+        assert (stats.min, stats.max) == (values.min(), values.max())
+
+
+def test_sketch_quantiles_within_relative_accuracy():
+    values = np.random.default_rng(2).exponential(0.3, 20000)
+    values[:1000] = 0.0
+    sketch, merged = QuantileSketch(), QuantileSketch()
+    sketch.add_many(values)
+    for block in np.array_split(values, 5):
+        part = QuantileSketch()
+        for x in block.tolist():
+            part.add(x)
+        merged.merge(part)
+    assert merged.buckets == sketch.buckets and merged.zero_count == sketch.zero_count == 1000
+    ordered = np.sort(values)
+    for q in (0.01, 0.5, 0.95, 0.99):
+        exact = ordered[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=sketch.relative_accuracy, abs=1e-12), q
+
+
+@pytest.mark.parametrize('algorithm', [1, 2, 3])
+def test_run_metrics_match_its_records(algorithm):
+    kwargs = {'fast': False} if algorithm == 1 else {}
+    s = ALGORITHMS[algorithm](10, 0.06, 0.04, seed=3, keep_records=True, **kwargs)
+    s.max_processes = 3000
+    s.run_sim()
+    table = s.processes
+    done = table.completed()
+    turnaround = table.termination[:table.size][done] - table.arrival[:table.size][done]
+    wait = turnaround - table.burst[:table.size][done]
+    metrics = s.collect_metrics()
+    assert metrics["average turnaround time"] == pytest.approx(turnaround.mean(), rel=1e-12)
+    assert metrics["average wait time"] == pytest.approx(wait.mean(), rel=1e-9, abs=1e-15)
+    assert metrics["turnaround time std dev"] == pytest.approx(turnaround.std(ddof=1), rel=1e-9)
+    assert metrics["p95 turnaround time"] == pytest.approx(np.sort(turnaround)[int(0.95 * (len(turnaround) - 1))],
+                                                           rel=0.01)
+
+
+def test_accumulators_merge_like_one_run():
+    rng = np.random.default_rng(4)
+    turnaround = rng.exponential(0.2, 4000)
+    wait = turnaround * rng.random(4000)
+    whole, merged = MetricsAccumulator(), MetricsAccumulator()
+    whole.add_many(turnaround, wait)
+    for t, w in zip(np.array_split(turnaround, 3), np.array_split(wait, 3)):
+        part = MetricsAccumulator()
+        part.add_many(t, w)
+        merged.merge(part)
+    for key, value in whole.summary().items():
+        assert merged.summary()[key] == pytest.approx(value, rel=1e-10), key
+
+
+def test_t_quantile():
+    # tables: t(0.975) for 1, 2, 5 and 30 degrees of freedom
+    for df, value in ((1, 12.7062), (2, 4.3027), (5, 2.5706), (30, 2.0423)):
+        assert t_quantile(0.975, df) == pytest.approx(value, abs=2e-3)
@@ -0,0 +1,62 @@
+import pytest
+from multicore import MultiCoreScheduler
+from scheduling_algorithms import ALGORITHMS
+
+"""
+the k core scheduler: with one core FCFS and STRF are the single cpu classes, and with more cores
+every process is accounted for on exactly one core
+"""
+
+
+@pytest.mark.parametrize('integer_clock', [False, True])
+@pytest.mark.parametrize('algorithm', [1, 2])
+@pytest.mark.parametrize('arrival_rate', [8, 15])
+def test_one_core_matches_the_single_cpu_class(algorithm, arrival_rate, integer_clock):
+    multi = MultiCoreScheduler(algorithm, arrival_rate, 0.06, 0, cores=1, seed=4, integer_clock=integer_clock)
+    multi.max_processes = 3000
+    multi.run_sim()
+    kwargs = {'fast': False} if algorithm == 1 else {}
+    single = ALGORITHMS[algorithm](arrival_rate, 0.06, 0, seed=4, integer_clock=integer_clock, **kwargs)
+    single.max_processes = 3000
+    single.run_sim()
+
+    assert multi.clock == single.clock
+    assert multi.core_cpu_time[0] == single.cpu_time
+    # the counters differ, a dispatch is part of the event that frees the core here and the next
+    # process is already on the core when the run stops
+    assert multi.arrival_events_handled == single.arrival_events_handled
+    multi_metrics = multi.collect_metrics()
+    for key, value in single.collect_metrics().items():
+        assert multi_metrics[key] == value, key
+
+
+@pytest.mark.parametrize('global_queue', [False, True])
+@pytest.mark.parametrize('algorithm', [1, 2, 3])
+def test_every_process_runs_on_one_core(algorithm, global_queue):
+    cores = 4
+    s = MultiCoreScheduler(algorithm, 40, 0.06, 0.04, cores=cores, global_queue=global_queue, seed=1)
+    s.max_processes = 5000
+    s.run_sim()
+    metrics = s.collect_metrics()
+    assert s.processes_completed == sum(s.core_completed) == 5000
+    assert s.termination_events_handled == 5000
+    assert s.arrival_events_handled == s.next_pid - 1
+    # rho = 40 * 0.06 / 4 = 0.6 of every core
+    assert 0.5 < metrics["utilization"] < 0.7
+    assert all(u <= 1 for u in metrics["per core utilization"])
+    if global_queue:
+        assert not any(metrics["per core steals"])
+
+
+def test_integer_clock_matches_float_clock():
+    runs = []
+    for integer_clock in (False, True):
+        s = MultiCoreScheduler(1, 30, 0.06, 0, cores=3, seed=6, integer_clock=integer_clock)
+        s.max_processes = 3000
+        s.run_sim()
+        runs.append(s)
+    float_run, integer_run = runs
+    assert integer_run.core_completed == float_run.core_completed
+    assert integer_run.clock * integer_run.time_scale == pytest.approx(float_run.clock, abs=1e-6)
+    for key in ("average turnaround time", "average wait time", "throughput"):
+        assert integer_run.collect_metrics()[key] == pytest.approx(float_run.collect_metrics()[key], rel=1e-6), key
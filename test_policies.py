@@ -0,0 +1,89 @@
+import pytest
+from multicore import MultiCoreScheduler
+from policies import MultilevelFeedback, PriorityAging
+from scheduling_algorithms import FCFS, MLFQ, SJF, STRF, PolicyScheduler, Priority
+
+"""
+the policy engine against the fixed schedulers it can reproduce: the default policy is FCFS,
+shortest job first is STRF and one level feedback is textbook round robin
+"""
+
+
+def run(s, processes=3000):
+    s.max_processes = processes
+    s.run_sim()
+    return s
+
+
+def assert_same_run(a, b):
+    assert a.clock == b.clock
+    assert a.cpu_time == b.cpu_time
+    assert a.processes_completed == b.processes_completed
+    assert list(a.recent_done) == list(b.recent_done)
+    b_metrics = b.collect_metrics()
+    for key, value in a.collect_metrics().items():
+        assert b_metrics[key] == value, key
+
+
+@pytest.mark.parametrize('integer_clock', [False, True])
+@pytest.mark.parametrize('arrival_rate', [8, 15])
+def test_default_policy_is_fcfs(arrival_rate, integer_clock):
+    policy = run(PolicyScheduler(arrival_rate, 0.06, 0, seed=1, integer_clock=integer_clock))
+    fcfs = run(FCFS(arrival_rate, 0.06, 0, seed=1, fast=False, integer_clock=integer_clock))
+    assert_same_run(policy, fcfs)
+    assert policy.event_counter == fcfs.event_counter
+
+
+@pytest.mark.parametrize('integer_clock', [False, True])
+@pytest.mark.parametrize('arrival_rate', [8, 15])
+def test_shortest_job_first_is_strf(arrival_rate, integer_clock):
+    sjf = run(SJF(arrival_rate, 0.06, 0, seed=2, integer_clock=integer_clock))
+    strf = run(STRF(arrival_rate, 0.06, 0, seed=2, integer_clock=integer_clock))
+    assert_same_run(sjf, strf)
+
+
+@pytest.mark.parametrize('integer_clock', [False, True])
+def test_one_level_feedback_is_round_robin(integer_clock):
+    mlfq = MLFQ(10, 0.06, 0.04, seed=3, integer_clock=integer_clock)
+    mlfq.policy = MultilevelFeedback(mlfq.quantum, levels=1)
+    mlfq.policy.bind(mlfq)
+    run(mlfq)
+    rr = run(MultiCoreScheduler(3, 10, 0.06, 0.04, cores=1, seed=3, integer_clock=integer_clock))
+    # the remaining time is taken down slice by slice in a different order, which can round
+    # differently on the float clock
+    assert mlfq.clock == pytest.approx(rr.clock, rel=1e-12)
+    assert mlfq.preemptions == 0
+    rr_metrics = rr.collect_metrics()
+    for key, value in mlfq.collect_metrics().items():
+        assert rr_metrics[key] == pytest.approx(value, rel=1e-12), key
+
+
+def test_feedback_moves_long_processes_down():
+    s = run(MLFQ(12, 0.06, 0.02, seed=4, keep_records=True))
+    assert s.slice_ends_handled > 0 and s.preemptions > 0
+    assert set(s.policy.level.values()) == {0, 1, 2}
+    # the run stops on a termination, so no slice is under way and every slice that was cut
+    # short by a preemption has given back the cpu time it did not use
+    table = s.processes
+    assert s.cpu_time == pytest.approx((table.burst[:table.size] - table.remaining[:table.size]).sum(), rel=1e-12)
+
+
+@pytest.mark.parametrize('integer_clock', [False, True])
+def test_priority_aging(integer_clock):
+    s = run(Priority(12, 0.06, 0, seed=5, integer_clock=integer_clock))
+    assert s.preemptions > 0
+    assert s.processes_completed == 3000
+    # without preemption or aging it is a plain non preemptive priority queue
+    plain = Priority(12, 0.06, 0, seed=5, integer_clock=integer_clock,
+                     policy=PriorityAging(seed=5, aging=0.0, preemptive=False))
+    run(plain)
+    assert plain.preemptions == 0
+    assert plain.collect_metrics()["average turnaround time"] != s.collect_metrics()["average turnaround time"]
+
+
+def test_priority_aging_does_not_depend_on_the_clock_units():
+    seconds = run(Priority(12, 0.06, 0, seed=6))
+    ticks = run(Priority(12, 0.06, 0, seed=6, integer_clock=True))
+    assert ticks.preemptions == seconds.preemptions
+    assert ticks.collect_metrics()["average turnaround time"] == pytest.approx(
+        seconds.collect_metrics()["average turnaround time"], rel=1e-6)
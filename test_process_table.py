@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from scheduling_algorithms import ALGORITHMS, ProcessTable
+
+"""
+the struct of arrays process table: rows round trip, released rows are reused, and a run gives
+the same results whether finished rows are kept or reused
+"""
+
+
+@pytest.mark.parametrize('time_dtype', [np.float64, np.int64])
+def test_rows_round_trip_through_growth(time_dtype):
+    table = ProcessTable(capacity=4, time_dtype=time_dtype)
+    rows = [table.add(pid, pid * 10, pid + 1) for pid in range(3)]
+    first = table.add_many(3, np.arange(3, 20) * 10, np.arange(3, 20) + 1)
+    assert rows == [0, 1, 2] and first == 3
+    assert len(table) == 20 and len(table.pid) >= 20
+    assert table.pid[:20].tolist() == list(range(20))
+    assert table.arrival[:20].tolist() == (np.arange(20) * 10).tolist()
+    assert (table.remaining[:20] == table.burst[:20]).all()
+    assert not table.completed().any()
+
+    p = table.process(7)
+    assert (p.pid, p.time, p.burst_time, p.time_remaining, p.termination_time) == (7, 70, 8, 8, 0)
+    table.termination[7] = 123
+    assert table.process(7).termination_time == 123
+    assert table.completed().tolist() == [k == 7 for k in range(20)]
+
+
+def test_released_rows_are_reused():
+    table = ProcessTable(capacity=4)
+    table.add_many(0, np.arange(8.0), np.ones(8))
+    for i in (2, 5, 6):
+        table.release(i)
+    assert len(table) == 5
+    assert table.add(8, 8.0, 1.0) == 6
+    rows = table.add_block(9, np.array([9.0, 10.0, 11.0]), np.ones(3))
+    assert rows.tolist() == [5, 2, 8]
+    assert table.size == 9 and not table.free
+    assert table.pid[[6, 5, 2, 8]].tolist() == [8, 9, 10, 11]
+    assert np.isnan(table.termination[rows]).all()
+
+
+@pytest.mark.parametrize('algorithm', sorted(ALGORITHMS))
+def test_runs_do_not_depend_on_keeping_records(algorithm):
+    runs = []
+    for keep_records in (False, True):
+        kwargs = {'fast': False} if algorithm == 1 else {}
+        s = ALGORITHMS[algorithm](12, 0.06, 0.04, seed=2, keep_records=keep_records, **kwargs)
+        s.max_processes = 2000
+        s.run_sim()
+        runs.append(s)
+    reused, kept = runs
+    assert reused.event_counter == kept.event_counter
+    assert reused.collect_metrics()["average turnaround time"] == kept.collect_metrics()["average turnaround time"]
+    # rows are reused, so the table only holds the processes that were in the system at once
+    assert reused.processes.size < kept.processes.size
+    assert kept.processes.completed().sum() == kept.processes_completed
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import math
+
+import numpy as np
+import pytest
+from service import SimulationService, encode, execute, parse_run, request_runs, status
+
+"""
+the simulation service: request checks, strict json replies, and one real service on a unix
+socket with a single worker for sharing identical runs and the error protocol
+"""
+
+
+RUN = {'algorithm': 3, 'arrival_rate': 10, 'avg_burst': 0.06, 'quantum': 0.04, 'seed': 1, 'max_processes': 3000}
+
+
+@pytest.mark.parametrize('change, error', [
+    ({'algorithm': 9}, 'algorithm must be one of'),
+    ({'algorithm': True}, 'algorithm must be one of'),
+    ({'arrival_rate': '10'}, 'arrival_rate must be a number'),
+    ({'avg_burst': False}, 'avg_burst must be a number'),
+    ({'arrival_rate': 0}, 'must be positive'),
+    ({'quantum': 0}, 'RR needs a positive quantum'),
+    ({'seed': True}, 'seed must be'),
+    ({'seed': -1}, 'seed must be'),
+    ({'seed': 1.5}, 'seed must be'),
+    ({'max_processes': False}, 'max_processes must be'),
+    ({'max_processes': 0}, 'max_processes must be'),
+    ({'saturation': 1}, 'saturation must be'),
+    ({'stopping': {'nonsense': 1}}, 'bad stopping rule'),
+    ({'colour': 'red'}, 'unknown fields'),
+])
+def test_bad_requests_are_refused(change, error):
+    with pytest.raises(ValueError, match=error):
+        parse_run(dict(RUN, **change))
+
+
+def test_missing_fields_and_defaults():
+    with pytest.raises(ValueError, match='missing fields'):
+        parse_run({'algorithm': 1, 'arrival_rate': 10})
+    run = parse_run({'type': 'run', 'id': 4, 'algorithm': 1, 'arrival_rate': 10, 'avg_burst': 0.06})
+    assert run == {'algorithm': 1, 'arrival_rate': 10, 'avg_burst': 0.06, 'quantum': 0.0, 'seed': None,
+                   'max_processes': 10000, 'stopping': None, 'saturation': False}
+
+
+def test_replies_are_strict_json():
+    line = encode({'metrics': {'a': np.float64(1.5), 'b': math.nan, 'c': [np.int64(2), -math.inf]}})
+    assert json.loads(line) == {'metrics': {'a': 1.5, 'b': None, 'c': [2, None]}}
+
+
+def test_service(tmp_path):
+    path = str(tmp_path / 's.sock')
+    expected = execute(parse_run(RUN))['metrics']
+
+    async def scenario():
+        service = SimulationService(path, workers=1)
+        await service.start()
+        try:
+            # two identical seeded runs on one connection share one run, an unseeded one never does
+            requests = [RUN, RUN, dict(RUN, seed=None), dict(RUN, seed=True), {'algorithm': 1}]
+            replies = await asyncio.to_thread(lambda: list(request_runs(requests, path)))
+            # the connection stays usable after errors, and a status query sees the counters
+            counters = await asyncio.to_thread(status, path)
+            with pytest.raises(RuntimeError, match='already listening'):
+                await SimulationService(path, workers=1).start()
+        finally:
+            await service.close()
+        return replies, counters
+
+    replies, counters = asyncio.run(scenario())
+    by_id = {reply['id']: reply for reply in replies}
+    assert sorted(by_id) == [0, 1, 2, 3, 4]
+    seeded = [by_id[0], by_id[1]]
+    assert {r['type'] for r in seeded} == {'result'}
+    assert sorted(r['shared'] for r in seeded) == [False, True]
+    for reply in seeded:
+        for key, value in expected.items():
+            assert reply['metrics'][key] == pytest.approx(value, rel=1e-12), key
+    assert by_id[2]['type'] == 'result' and not by_id[2]['shared']
+    assert by_id[3] == {'type': 'error', 'id': 3, 'error': 'seed must be a non negative integer'}
+    assert by_id[4]['type'] == 'error' and 'missing fields' in by_id[4]['error']
+    assert counters == {'type': 'status', 'runs': 2, 'shared': 1, 'in_flight': 0, 'workers': 1}
+    assert not (tmp_path / 's.sock').exists()
+
+
+def test_stale_socket_file_is_replaced(tmp_path):
+    path = tmp_path / 's.sock'
+    path.write_text('left behind')
+
+    async def scenario():
+        service = SimulationService(str(path), workers=1)
+        await service.start()
+        try:
+            return await asyncio.to_thread(status, str(path))
+        finally:
+            await service.close()
+
+    assert asyncio.run(scenario())['runs'] == 0